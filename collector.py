@@ -1,3 +1,4 @@
+import os
 import socket
 import time
 import csv
@@ -6,11 +7,20 @@ import threading
 from datetime import datetime
 
 class StreamingLatencyCollector:
+    """
+    Packets are a bare latency in ms (wrk2), or "<tag> <ms>" and
+    "<tag> <ms> <queries> <db_ms>" from the Django app (core/metrics.py).
+    Untagged samples and request tags (URL names) make up the overall
+    window; every tag also gets its own row in <output>_by_tag.csv. Tags
+    with a "/" are spans and outbox jobs, kept out of the overall window.
+    """
     def __init__(self, port=9999, window_size=5, output_file="latencies_stream.csv"):
         self.port = port
         self.window_size = window_size
         self.output_file = output_file
+        self.tag_output_file = os.path.splitext(output_file)[0] + "_by_tag.csv"
         self.latencies = []
+        self.by_tag = {}  # tag -> {"ms": [...], "queries": [...], "db_ms": [...]}
         self.window_start = time.time()
         self.running = True
         self.lock = threading.Lock()
@@ -36,6 +46,23 @@ class StreamingLatencyCollector:
                 'max_ms',
                 'stdev_ms'
             ])
+
+        with open(self.tag_output_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([
+                'timestamp',
+                'window_start',
+                'window_end',
+                'tag',
+                'count',
+                'avg_ms',
+                'p50_ms',
+                'p95_ms',
+                'p99_ms',
+                'max_ms',
+                'avg_queries',
+                'avg_db_ms'
+            ])
         
         print(f"=" * 60)
         print(f"  Streaming Latency Collector")
@@ -43,13 +70,18 @@ class StreamingLatencyCollector:
         print(f"  Port:        {self.port}")
         print(f"  Window size: {self.window_size}s")
         print(f"  Output:      {self.output_file}")
+        print(f"  Per tag:     {self.tag_output_file}")
         print(f"=" * 60)
         print()
     
     def flush_window(self):
         """Flush current window to CSV"""
         with self.lock:
+            if self.by_tag:
+                self.flush_tags()
+
             if not self.latencies:
+                self.window_start = time.time()
                 return
             
             latencies_array = np.array(self.latencies)
@@ -106,6 +138,66 @@ class StreamingLatencyCollector:
             self.latencies = []
             self.window_start = time.time()
     
+    def flush_tags(self):
+        """Write one row per tag for the current window (called with the lock held)"""
+        window_end = time.time()
+        window_start_str = datetime.fromtimestamp(self.window_start).strftime('%Y-%m-%d %H:%M:%S')
+        window_end_str = datetime.fromtimestamp(window_end).strftime('%Y-%m-%d %H:%M:%S')
+
+        with open(self.tag_output_file, 'a', newline='') as f:
+            writer = csv.writer(f)
+            for tag in sorted(self.by_tag):
+                samples = self.by_tag[tag]
+                latencies_array = np.array(samples["ms"])
+                avg_queries = np.mean(samples["queries"]) if samples["queries"] else ""
+                avg_db_ms = np.mean(samples["db_ms"]) if samples["db_ms"] else ""
+                p99 = np.percentile(latencies_array, 99)
+                writer.writerow([
+                    f"{window_end:.3f}",
+                    window_start_str,
+                    window_end_str,
+                    tag,
+                    len(latencies_array),
+                    f"{np.mean(latencies_array):.3f}",
+                    f"{np.percentile(latencies_array, 50):.3f}",
+                    f"{np.percentile(latencies_array, 95):.3f}",
+                    f"{p99:.3f}",
+                    f"{np.max(latencies_array):.3f}",
+                    f"{avg_queries:.1f}" if avg_queries != "" else "",
+                    f"{avg_db_ms:.3f}" if avg_db_ms != "" else "",
+                ])
+
+                queries = f" | Queries: {avg_queries:5.1f} | DB: {avg_db_ms:7.2f}ms" if avg_queries != "" else ""
+                print(f"           {tag:<45} Reqs: {len(latencies_array):5,d} | "
+                      f"P99: {p99:8.2f}ms{queries}")
+
+        self.by_tag = {}
+
+    def add_sample(self, text):
+        """Parse one packet; raises ValueError on malformed ones"""
+        parts = text.split()
+        if len(parts) == 1:
+            tag, latency_ms = None, float(parts[0])
+        elif len(parts) in (2, 4):
+            tag, latency_ms = parts[0], float(parts[1])
+        else:
+            raise ValueError(text)
+
+        if not (latency_ms > 0 and latency_ms < 60000):  # Sanity check: < 60 seconds
+            return
+
+        with self.lock:
+            if tag is not None:
+                samples = self.by_tag.setdefault(tag, {"ms": [], "queries": [], "db_ms": []})
+                samples["ms"].append(latency_ms)
+                if len(parts) == 4:
+                    samples["queries"].append(int(parts[2]))
+                    samples["db_ms"].append(float(parts[3]))
+
+            if tag is None or "/" not in tag:
+                self.latencies.append(latency_ms)
+                self.total_requests += 1
+
     def window_flusher_thread(self):
         """Periodically flush windows"""
         while self.running:
@@ -126,16 +218,9 @@ class StreamingLatencyCollector:
         
         while self.running:
             try:
-                data, addr = sock.recvfrom(64)  # Small packets
+                data, addr = sock.recvfrom(512)  # Small packets
                 try:
-                    # Parse simple float
-                    latency_ms = float(data.decode('utf-8').strip())
-                    
-                    if latency_ms > 0 and latency_ms < 60000:  # Sanity check: < 60 seconds
-                        with self.lock:
-                            self.latencies.append(latency_ms)
-                            self.total_requests += 1
-                            
+                    self.add_sample(data.decode('utf-8').strip())
                 except (ValueError, UnicodeDecodeError):
                     pass  # Ignore malformed packets
                     
@@ -184,7 +269,7 @@ class StreamingLatencyCollector:
 if __name__ == "__main__":
     import argparse
     
-    parser = argparse.ArgumentParser(description='Streaming latency collector for wrk2')
+    parser = argparse.ArgumentParser(description='Streaming latency collector for wrk2 and the Django app (METRICS_COLLECTOR)')
     parser.add_argument('--port', type=int, default=9999, help='UDP port (default: 9999)')
     parser.add_argument('--window', type=int, default=5, help='Window size in seconds (default: 5)')
     parser.add_argument('--output', type=str, default='latencies_stream.csv', help='Output CSV file')
@@ -1,8 +1,12 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
+from django.http import HttpResponse
 
-from .models import Category, Product, Order, OrderItem, DiscountTier, ColorPalette
+from .models import Category, Product, Order, OrderItem, DiscountTier, ColorPalette, DraftCart, OutboxJob
+from .outbox import requeue_jobs
+from .pdf_utils import build_wave_pdf
+from .waves import build_wave
 
 
 # ==============================
@@ -30,6 +34,38 @@ class CategoryAdmin(admin.ModelAdmin):
 # PRODUCT ADMIN
 # ==============================
 
+class FinalPriceFilter(admin.SimpleListFilter):
+    """
+    Filter products by the stored final_price (after discounts), so the
+    range is a WHERE on one column.
+    """
+    title = "final price"
+    parameter_name = "final_price_range"
+
+    # (value, label, lower bound, upper bound); bounds in TL, upper exclusive
+    RANGES = (
+        ("0-100", "< 100 TL", None, 100),
+        ("100-250", "100 – 250 TL", 100, 250),
+        ("250-500", "250 – 500 TL", 250, 500),
+        ("500-1000", "500 – 1000 TL", 500, 1000),
+        ("1000-", "≥ 1000 TL", 1000, None),
+    )
+
+    def lookups(self, request, model_admin):
+        return [(value, label) for value, label, _, _ in self.RANGES] + [("none", "No price")]
+
+    def queryset(self, request, queryset):
+        if self.value() == "none":
+            return queryset.filter(final_price__isnull=True)
+        for value, _, low, high in self.RANGES:
+            if self.value() == value:
+                if low is not None:
+                    queryset = queryset.filter(final_price__gte=low)
+                if high is not None:
+                    queryset = queryset.filter(final_price__lt=high)
+                return queryset
+        return queryset
+
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -42,11 +78,11 @@ class ProductAdmin(admin.ModelAdmin):
         "price",
         "discount_percent",
         "discount_price",       # NEW
-        "final_price_display",
+        "final_price",
         "unit",
         "is_active",
     )
-    list_filter = ("is_active", "category")
+    list_filter = ("is_active", "category", FinalPriceFilter)
     search_fields = ("name", "code")
     ordering = ("category", "display_order", "name")
 
@@ -61,10 +97,6 @@ class ProductAdmin(admin.ModelAdmin):
         "is_active",
     )
 
-    def final_price_display(self, obj):
-        return obj.final_price
-    final_price_display.short_description = "Final price"
-
 
 # ==============================
 # ORDER & ORDER ITEMS ADMIN
@@ -92,6 +124,15 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ("customer_type", "is_confirmed", "printed")  # ADD THIS
     date_hierarchy = "created_at"
     inlines = [OrderItemInline]
+    actions = ["wave_sheet_pdf"]
+
+    @admin.action(description="Toplu toplama listesi (PDF) – seçili onaylı siparişler")
+    def wave_sheet_pdf(self, request, queryset):
+        orders = queryset.filter(is_confirmed=True).order_by("created_at", "id")
+        wave = build_wave(orders)
+        response = HttpResponse(build_wave_pdf(wave), content_type="application/pdf")
+        response["Content-Disposition"] = 'inline; filename="wave.pdf"'
+        return response
 
     def csv_download_link(self, obj):
         url = reverse("order_csv_admin", args=[obj.id])
@@ -121,4 +162,25 @@ class ColorPaletteAdmin(admin.ModelAdmin):
     list_display = ['name', 'effect_type', 'color_preview', 'created_at']
     list_filter = ['effect_type']
     search_fields = ['name']
-    ordering = ['name']
\ No newline at end of file
+    ordering = ['name']
+
+
+@admin.register(DraftCart)
+class DraftCartAdmin(admin.ModelAdmin):
+    list_display = ['id', 'customer_name', 'customer_type', 'created_at', 'updated_at']
+    list_filter = ['customer_type']
+    search_fields = ['customer_name', 'customer_phone']
+
+
+@admin.register(OutboxJob)
+class OutboxJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'order', 'status', 'attempts', 'run_after', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['order__id']
+    readonly_fields = ['last_error']
+    actions = ['retry_jobs']
+
+    @admin.action(description="Seçili işleri yeniden kuyruğa al")
+    def retry_jobs(self, request, queryset):
+        count = requeue_jobs(queryset.exclude(status='running'))
+        self.message_user(request, f"{count} iş yeniden kuyruğa alındı.")
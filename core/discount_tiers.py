@@ -0,0 +1,91 @@
+# ============================
+#  DISCOUNT TIER ENGINE
+# ============================
+#
+# Every page of the order funnel needs the active discount tiers of the
+# customer type: as JSON for the cart scripts, as a list for the info box
+# and for the current/next tier of a subtotal. They change a few times a
+# month, so all active tiers are loaded once per process into sorted
+# arrays (lookups are a bisect) and rebuilt only after a DiscountTier is
+# saved or deleted (see signals.py).
+
+import json
+import threading
+from bisect import bisect_right
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .invalidation import bump_stamp, current_stamp
+from .models import DiscountTier
+
+STAMP_NAME = "discount_tiers"
+
+
+class TierTable:
+    """Active tiers of one customer type, ascending by threshold."""
+    def __init__(self, tiers):
+        self.tiers = tiers
+        self.thresholds = [tier.threshold for tier in tiers]
+        # Same shape as .values("threshold", "discount_percentage")
+        self.rows = [
+            {"threshold": tier.threshold, "discount_percentage": tier.discount_percentage}
+            for tier in tiers
+        ]
+        self.json = json.dumps(self.rows, cls=DjangoJSONEncoder)
+
+    def current_tier(self, subtotal):
+        """Highest tier whose threshold the subtotal reaches, or None."""
+        i = bisect_right(self.thresholds, subtotal)
+        return self.tiers[i - 1] if i else None
+
+    def next_tier(self, subtotal):
+        """Lowest tier whose threshold is above the subtotal, or None."""
+        i = bisect_right(self.thresholds, subtotal)
+        return self.tiers[i] if i < len(self.tiers) else None
+
+
+class DiscountTierEngine:
+    def __init__(self, stamp, tables):
+        self.stamp = stamp
+        self._tables = tables   # {customer_type: TierTable}
+        self._empty = TierTable([])
+
+    def table(self, customer_type) -> TierTable:
+        return self._tables.get(customer_type, self._empty)
+
+
+_lock = threading.Lock()
+_engine = None
+
+
+def _build_engine(stamp):
+    tiers_by_type = {}
+    for tier in DiscountTier.objects.filter(is_active=True).order_by("threshold", "id"):
+        tiers_by_type.setdefault(tier.customer_type, []).append(tier)
+
+    return DiscountTierEngine(
+        stamp,
+        {customer_type: TierTable(tiers) for customer_type, tiers in tiers_by_type.items()},
+    )
+
+
+def get_discount_tiers() -> DiscountTierEngine:
+    """Return the tier engine, rebuilding it if tiers changed anywhere."""
+    global _engine
+    stamp = current_stamp(STAMP_NAME)
+    engine = _engine
+    if engine is not None and engine.stamp == stamp:
+        return engine
+
+    with _lock:
+        if _engine is None or _engine.stamp != stamp:
+            _engine = _build_engine(stamp)
+        return _engine
+
+
+def get_tier_table(customer_type) -> TierTable:
+    return get_discount_tiers().table(customer_type)
+
+
+def invalidate_discount_tiers():
+    bump_stamp(STAMP_NAME)
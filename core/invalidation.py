@@ -0,0 +1,38 @@
+# ============================
+#  CROSS-PROCESS INVALIDATION
+# ============================
+#
+# In-process caches (product code index, discount tiers, ...) are shared by
+# every gunicorn worker, but a model save only runs signals in one of them.
+# Each cache has a stamp file under INVALIDATION_DIR: signals bump it, and
+# readers compare the stamp they built from with the current one (a single
+# os.stat, no DB query) to know when to rebuild.
+
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+
+def _stamp_path(name: str) -> Path:
+    return Path(settings.INVALIDATION_DIR) / f"{name}.stamp"
+
+
+def current_stamp(name: str) -> int:
+    """Current stamp of a cache; 0 if it was never bumped."""
+    try:
+        return os.stat(_stamp_path(name)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def bump_stamp(name: str):
+    """Mark a cache as stale in every process."""
+    path = _stamp_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    now = time.time_ns()
+    # Never move backwards, even if two bumps land in the same tick
+    now = max(now, current_stamp(name) + 1)
+    path.touch()
+    os.utime(path, ns=(now, now))
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from core.models import Product  # change 'core' if your app name is different
+from core.product_index import invalidate_product_code_index
 
 
 class Command(BaseCommand):
@@ -78,6 +79,8 @@ class Command(BaseCommand):
                 is_active=True,
                 image=image_path,
             )
+            # bulk_create skips save(), which maintains final_price
+            p.final_price = p.compute_final_price()
             products.append(p)
 
         if not products:
@@ -87,6 +90,9 @@ class Command(BaseCommand):
         with transaction.atomic():
             Product.objects.bulk_create(products)
 
+        # bulk_create sends no post_save signals
+        invalidate_product_code_index()
+
         self.stdout.write(
             self.style.SUCCESS(
                 f"Created {len(products)} products from {start_num} to {end_num}."
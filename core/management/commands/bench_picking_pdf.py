@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Order
+from core.pdf_utils import (
+    build_picking_pdf_canvas,
+    build_picking_pdf_platypus,
+    get_picking_background,
+    get_picking_layout,
+)
+
+
+class Command(BaseCommand):
+    help = "Compare per-order render time of the platypus and canvas picking PDF engines."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--order",
+            type=int,
+            default=None,
+            help="Order id to render (default: latest confirmed order)",
+        )
+        parser.add_argument(
+            "--runs",
+            type=int,
+            default=20,
+            help="Renders per engine (default: 20)",
+        )
+
+    def handle(self, *args, **options):
+        runs = options["runs"]
+
+        if options["order"]:
+            order = Order.objects.filter(id=options["order"]).first()
+        else:
+            order = Order.objects.filter(is_confirmed=True).order_by("-created_at").first()
+        if order is None:
+            raise CommandError("No order to render.")
+
+        # One-time per-process work is not part of the per-order cost
+        get_picking_layout()
+        get_picking_background()
+
+        results = {}
+        for name, build in (
+            ("platypus", build_picking_pdf_platypus),
+            ("canvas", build_picking_pdf_canvas),
+        ):
+            build(order)  # warm-up
+            started = time.perf_counter()
+            for _ in range(runs):
+                size = len(build(order))
+            per_order_ms = (time.perf_counter() - started) * 1000 / runs
+            results[name] = per_order_ms
+            self.stdout.write(f"{name:>9}: {per_order_ms:8.2f} ms/order  ({size:,} bytes)")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Order #{order.id}, {runs} runs: canvas is "
+                f"{results['platypus'] / results['canvas']:.1f}x faster per order."
+            )
+        )
@@ -0,0 +1,112 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from core.models import Product
+
+SESSION_ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cache": "django.contrib.sessions.backends.cache",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}
+
+WRITE_RE = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Walk the order funnel (info -> form -> success -> confirm) with each session "
+        "mode and count DB writes per completed order. Everything is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--orders",
+            type=int,
+            default=20,
+            help="Completed orders per session mode (default: 20)",
+        )
+        parser.add_argument(
+            "--items",
+            type=int,
+            default=5,
+            help="Products per order (default: 5)",
+        )
+
+    def handle(self, *args, **options):
+        products = list(Product.objects.filter(is_active=True).values_list("id", flat=True)[:options["items"]])
+        if not products:
+            raise CommandError("No active products to order.")
+
+        self.stdout.write(f"{options['orders']} orders x {len(products)} items per session mode")
+        self.stdout.write(f"{'mode':>15} {'session writes':>15} {'other writes':>13} {'ms/order':>9}")
+
+        results = {}
+        for mode, engine in SESSION_ENGINES.items():
+            session_writes, other_writes, ms = self.run_mode(engine, products, options["orders"])
+            results[mode] = session_writes + other_writes
+            self.stdout.write(f"{mode:>15} {session_writes:>15.1f} {other_writes:>13.1f} {ms:>9.1f}")
+
+        saved = results["db"] - min(results["cache"], results["signed_cookies"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Cache/cookie sessions save {saved:.1f} of {results['db']:.1f} DB writes per order."
+        ))
+
+    def run_mode(self, engine, products, orders):
+        session_writes = other_writes = 0
+        elapsed = 0.0
+
+        with override_settings(
+            SESSION_ENGINE=engine,
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                "sessions": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            },
+            ALLOWED_HOSTS=["testserver"],
+        ):
+            try:
+                with transaction.atomic():
+                    for _ in range(orders):
+                        with CaptureQueriesContext(connection) as queries:
+                            started = time.perf_counter()
+                            self.complete_order(Client(), products)
+                            elapsed += time.perf_counter() - started
+
+                        for query in queries:
+                            if WRITE_RE.match(query["sql"]):
+                                if "django_session" in query["sql"]:
+                                    session_writes += 1
+                                else:
+                                    other_writes += 1
+                    raise Rollback
+            except Rollback:
+                pass
+
+        return session_writes / orders, other_writes / orders, elapsed * 1000 / orders
+
+    def complete_order(self, client, products):
+        kwargs = {"customer_type": "retail"}
+        steps = [
+            ("get", reverse("customer_info", kwargs=kwargs), None),
+            ("post", reverse("customer_info", kwargs=kwargs), {
+                "customer_name": "Bench Müşteri",
+                "customer_phone": "05550000000",
+            }),
+            ("get", reverse("order_form", kwargs=kwargs), None),
+            ("post", reverse("order_form", kwargs=kwargs), {f"qty_{pid}": 2 for pid in products}),
+            ("get", reverse("order_success", kwargs=kwargs), None),
+            ("post", reverse("order_confirm", kwargs=kwargs), {}),
+        ]
+        for method, url, data in steps:
+            response = getattr(client, method)(url, data)
+            if response.status_code >= 400:
+                raise CommandError(f"{method.upper()} {url} -> {response.status_code}")
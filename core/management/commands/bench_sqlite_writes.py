@@ -0,0 +1,208 @@
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.models import Category, ColorPalette, Order, OrderItem, OutboxJob, Product
+
+BENCH_MODELS = (ColorPalette, Category, Product, Order, OrderItem, OutboxJob)
+
+
+class Command(BaseCommand):
+    help = (
+        "Confirm orders from many threads at once against a scratch SQLite file, "
+        "once per SQLITE_MODE (default rollback journal vs. WAL + BEGIN IMMEDIATE), "
+        "and report throughput and 'database is locked' failures."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="Concurrent order writers (default: 8)",
+        )
+        parser.add_argument(
+            "--orders",
+            type=int,
+            default=50,
+            help="Orders confirmed per writer thread (default: 50)",
+        )
+        parser.add_argument(
+            "--items",
+            type=int,
+            default=10,
+            help="Lines per order (default: 10)",
+        )
+
+    def handle(self, *args, **options):
+        modes = {
+            "default": {},
+            "wal": settings.SQLITE_WAL_OPTIONS,
+        }
+
+        self.stdout.write(
+            f"{options['threads']} writer threads x {options['orders']} orders x {options['items']} items, "
+            "plus one print agent thread"
+        )
+        self.stdout.write(f"{'mode':>8} {'orders/s':>9} {'p95 ms':>8} {'locked':>7} {'printed':>8}")
+
+        results = {}
+        for mode, db_options in modes.items():
+            scratch = Path(tempfile.mkdtemp(prefix=f"bench_sqlite_{mode}_"))
+            try:
+                # Bench products and confirmed orders bump invalidation stamps
+                # on commit; keep them off the stamps live workers and print
+                # agents watch
+                with override_settings(INVALIDATION_DIR=str(scratch / "run")):
+                    results[mode] = self.run_mode(mode, scratch / "bench.sqlite3", db_options, options)
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+            rate, p95, locked, printed = results[mode]
+            self.stdout.write(f"{mode:>8} {rate:>9.1f} {p95:>8.1f} {locked:>7} {printed:>8}")
+
+        speedup = results["wal"][0] / results["default"][0] if results["default"][0] else float("inf")
+        self.stdout.write(self.style.SUCCESS(
+            f"WAL mode: {speedup:.1f}x the order throughput, "
+            f"{results['default'][2]} -> {results['wal'][2]} locked errors."
+        ))
+
+    def run_mode(self, mode, path, db_options, options):
+        alias = f"bench_{mode}"
+        connections.settings[alias] = connections.configure_settings({
+            "default": connections.settings["default"],
+            alias: {
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": str(path),
+                "OPTIONS": dict(db_options),
+            },
+        })[alias]
+
+        try:
+            product_ids = self.setup_schema(alias, options["items"])
+
+            latencies = []
+            counters = {"locked": 0, "printed": 0}
+            lock = threading.Lock()
+            writers_done = threading.Event()
+
+            def writer(n):
+                try:
+                    for i in range(options["orders"]):
+                        started = time.perf_counter()
+                        try:
+                            self.confirm_order(alias, product_ids, f"Bench {n}-{i}")
+                        except OperationalError:
+                            with lock:
+                                counters["locked"] += 1
+                            continue
+                        with lock:
+                            latencies.append(time.perf_counter() - started)
+                finally:
+                    connections[alias].close()
+
+            def print_agent():
+                try:
+                    while not writers_done.is_set():
+                        try:
+                            printed = self.claim_and_print(alias)
+                        except OperationalError:
+                            with lock:
+                                counters["locked"] += 1
+                            continue
+                        with lock:
+                            counters["printed"] += printed
+                        time.sleep(0.01)
+                finally:
+                    connections[alias].close()
+
+            threads = [threading.Thread(target=writer, args=(n,)) for n in range(options["threads"])]
+            agent = threading.Thread(target=print_agent)
+
+            started = time.perf_counter()
+            agent.start()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            writers_done.set()
+            agent.join()
+
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0
+            return len(latencies) / elapsed, p95, counters["locked"], counters["printed"]
+        finally:
+            connections[alias].close()
+            del connections.settings[alias]
+
+    def setup_schema(self, alias, items):
+        with connections[alias].schema_editor() as editor:
+            for model in BENCH_MODELS:
+                editor.create_model(model)
+
+        category = Category.objects.using(alias).create(name="Bench")
+        products = [
+            Product(
+                category=category,
+                name=f"Ürün {i:03d}",
+                code=f"MBKO{i:03d}",
+                pick_order=i,
+                price=Decimal("100.00"),
+                final_price=Decimal("100.00"),
+            )
+            for i in range(items)
+        ]
+        Product.objects.using(alias).bulk_create(products)
+        return list(Product.objects.using(alias).values_list("id", flat=True))
+
+    def confirm_order(self, alias, product_ids, customer_name):
+        """The write pattern of order_confirm: read prices, then write in one transaction."""
+        with transaction.atomic(using=alias):
+            products = list(Product.objects.using(alias).filter(id__in=product_ids))
+            subtotal = sum(p.final_price * 2 for p in products)
+            order = Order.objects.using(alias).create(
+                customer_name=customer_name,
+                is_confirmed=True,
+                subtotal=subtotal,
+                final_total=subtotal,
+            )
+            OrderItem.objects.using(alias).bulk_create([
+                OrderItem(
+                    order=order,
+                    product=p,
+                    quantity=2,
+                    product_name=p.name,
+                    product_code=p.code,
+                    pick_order=p.pick_order,
+                    list_price=p.price,
+                    unit_price=p.final_price,
+                    line_total=p.final_price * 2,
+                )
+                for p in products
+            ])
+            OutboxJob.objects.using(alias).create(kind="order_documents_telegram", order=order)
+
+    def claim_and_print(self, alias):
+        """The write pattern of a print agent: read the queue, then lease and mark it."""
+        with transaction.atomic(using=alias):
+            ids = list(
+                Order.objects.using(alias)
+                .filter(is_confirmed=True, printed=False)
+                .order_by("created_at", "id")
+                .values_list("id", flat=True)[:20]
+            )
+            return (
+                Order.objects.using(alias)
+                .filter(id__in=ids, printed=False)
+                .update(printed=True, printed_at=timezone.now())
+            )
@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import DraftCart, Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete abandoned baskets: draft carts and unconfirmed orders older than --days, "
+        "in batches. Meant to run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=2,
+            help="Age in days after which an unconfirmed basket is stale (default: 2)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Rows deleted per transaction (default: 500)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count what would be deleted",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+
+        drafts = DraftCart.objects.filter(updated_at__lt=cutoff)
+        # Unconfirmed orders are left over from before draft carts existed
+        orders = Order.objects.filter(is_confirmed=False, created_at__lt=cutoff)
+
+        if options["dry_run"]:
+            self.stdout.write(
+                f"Would delete {drafts.count()} draft carts and {orders.count()} unconfirmed orders "
+                f"older than {cutoff:%Y-%m-%d %H:%M}."
+            )
+            return
+
+        deleted_drafts = self.purge(drafts, options["batch_size"])
+        deleted_orders = self.purge(orders, options["batch_size"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted_drafts} draft carts and {deleted_orders} unconfirmed orders "
+            f"older than {cutoff:%Y-%m-%d %H:%M}."
+        ))
+
+    def purge(self, queryset, batch_size):
+        """Delete in short transactions so writers are never blocked for long."""
+        total = 0
+        while True:
+            # No ORDER BY: SQLite would walk the whole table in id order
+            # instead of using the date index
+            ids = list(queryset.order_by().values_list("id", flat=True)[:batch_size])
+            if not ids:
+                return total
+            with transaction.atomic():
+                # Order items go with their order (CASCADE)
+                queryset.model.objects.filter(id__in=ids).delete()
+            total += len(ids)
@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from core.outbox import ORDER_DOCUMENTS_TELEGRAM, claim_digest_jobs, claim_jobs, run_digest, run_job
+
+
+def _run_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        # Each pool thread has its own DB connection
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Drain the outbox: run queued post-confirmation jobs with retries and backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Jobs run in parallel (default: 4)",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when the outbox is empty (default: 1)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run until nothing is due (waiting out an open digest window), then exit",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(options["concurrency"], 1)
+        self.stdout.write(f"Outbox worker started (concurrency {concurrency}). Press Ctrl+C to stop.")
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                close_old_connections()
+
+                # During an order spike, documents go out as digests
+                hold, digest = claim_digest_jobs()
+                if digest:
+                    ids = ", ".join(f"#{job.order_id}" for job in digest)
+                    if run_digest(digest):
+                        self.stdout.write(f"Digest done: {ids}")
+                    else:
+                        self.stdout.write(self.style.WARNING(f"Digest failed: {ids}"))
+                    continue
+
+                jobs = claim_jobs(concurrency, exclude_kinds=(ORDER_DOCUMENTS_TELEGRAM,) if hold else ())
+                if not jobs:
+                    if options["once"] and not hold:
+                        return
+                    time.sleep(options["poll_interval"])
+                    continue
+
+                for job, ok in zip(jobs, pool.map(_run_in_thread, jobs)):
+                    if ok:
+                        self.stdout.write(f"Done: {job}")
+                    else:
+                        self.stdout.write(self.style.WARNING(f"Failed (attempt {job.attempts}): {job}"))
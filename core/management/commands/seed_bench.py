@@ -0,0 +1,321 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.discount_tiers import invalidate_discount_tiers
+from core.models import Category, ColorPalette, DiscountTier, Order, OrderItem, Product
+from core.pdf_utils import PAGES
+from core.pricing import calculate_discount
+from core.product_index import PRODUCT_CODE_PREFIXES, invalidate_product_code_index
+
+# Everything the command creates is named with this prefix, so --reset can
+# find it again without touching real data
+BENCH_PREFIX = "Bench"
+
+PALETTES = (
+    ("Red Shimmer", ["#C0392B", "#E74C3C", "#F5B7B1"], "shimmer"),
+    ("Ocean Blues", ["#1B4F72", "#2E86C1", "#AED6F1"], "gradient-medium"),
+    ("Nude", ["#D7BDA5", "#E8D5C4"], "gradient-light"),
+    ("Rainbow", ["#E74C3C", "#F1C40F", "#2ECC71", "#3498DB"], "linear"),
+    ("Black", ["#17202A"], "solid"),
+)
+
+DISCOUNT_TIERS = {
+    "retail": ((1000, 5), (2500, 10), (5000, 15)),
+    "wholesale": ((5000, 10), (15000, 15), (30000, 20)),
+}
+
+# Product discounts: share of products on offer and the offers they get
+DISCOUNT_PERCENTS = (10, 20, 30)
+DISCOUNTED_SHARE = 0.2
+PRICE_OVERRIDE_SHARE = 0.05
+
+# Lines per order, as (lo, hi, weight) ranges
+BASKET_SIZES = ((1, 5, 40), (6, 15, 40), (16, 40, 20))
+
+
+def picking_sheet_codes():
+    """Every code on the picking sheet, in sheet order."""
+    return [code for page in PAGES for row in page for table in row.tables for code in table.codes]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic catalog (categories, palettes, products with "
+        "picking-sheet codes, discounts, discount tiers) and months of confirmed and printed "
+        "order history, for benchmarks. Same --seed, same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--main-categories",
+            type=int,
+            default=6,
+            help="Main categories (default: 6)",
+        )
+        parser.add_argument(
+            "--subcategories",
+            type=int,
+            default=8,
+            help="Subcategories per main category (default: 8)",
+        )
+        parser.add_argument(
+            "--products",
+            type=int,
+            default=3000,
+            help="Products, spread over the subcategories (default: 3000)",
+        )
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=6,
+            help="Months of order history (default: 6)",
+        )
+        parser.add_argument(
+            "--orders-per-day",
+            type=int,
+            default=150,
+            help="Average confirmed orders per day (default: 150)",
+        )
+        parser.add_argument(
+            "--wholesale-share",
+            type=float,
+            default=0.3,
+            help="Share of wholesale orders (default: 0.3)",
+        )
+        parser.add_argument(
+            "--queued",
+            type=int,
+            default=20,
+            help="Latest orders left unprinted, in the print queue (default: 20)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Orders per bulk_create batch and transaction (default: 1000)",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=42,
+            help="Random seed (default: 42)",
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Delete data of an earlier run first",
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        started = time.perf_counter()
+
+        if options["reset"]:
+            self.reset()
+        elif Category.objects.filter(name__startswith=f"{BENCH_PREFIX} ").exists():
+            raise CommandError("Bench data already exists; run with --reset to replace it.")
+
+        with transaction.atomic():
+            subcategories = self.create_categories(rng, options["main_categories"], options["subcategories"])
+            products = self.create_products(rng, subcategories, options["products"])
+            self.create_discount_tiers()
+
+        # bulk_create sends no post_save signals
+        invalidate_product_code_index()
+        invalidate_discount_tiers()
+
+        self.stdout.write(
+            f"Catalog: {options['main_categories']} main categories, {len(subcategories)} subcategories, "
+            f"{len(products)} products."
+        )
+
+        orders, items = self.create_orders(rng, products, options)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {orders} orders with {items} items over {options['months']} months "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
+
+    def reset(self):
+        with transaction.atomic():
+            orders, _ = Order.objects.filter(customer_name__startswith=f"{BENCH_PREFIX} ").delete()
+            Product.objects.filter(name__startswith=f"{BENCH_PREFIX} ").delete()
+            Category.objects.filter(name__startswith=f"{BENCH_PREFIX} ", parent__isnull=False).delete()
+            Category.objects.filter(name__startswith=f"{BENCH_PREFIX} ").delete()
+            ColorPalette.objects.filter(name__startswith=f"{BENCH_PREFIX} ").delete()
+        invalidate_product_code_index()
+        self.stdout.write(f"Removed earlier bench data ({orders} rows).")
+
+    # ----------------------------
+    #  Catalog
+    # ----------------------------
+
+    def create_categories(self, rng, main_count, sub_count):
+        palettes = ColorPalette.objects.bulk_create([
+            ColorPalette(name=f"{BENCH_PREFIX} {name}", colors=colors, effect_type=effect)
+            for name, colors, effect in PALETTES
+        ])
+
+        mains = Category.objects.bulk_create([
+            Category(name=f"{BENCH_PREFIX} {i + 1:02d}", display_order=i)
+            for i in range(main_count)
+        ])
+        return Category.objects.bulk_create([
+            Category(
+                name=f"{BENCH_PREFIX} {main.display_order + 1:02d}.{j + 1:02d}",
+                parent=main,
+                display_order=j,
+                color_palette=rng.choice(palettes),
+            )
+            for main in mains
+            for j in range(sub_count)
+        ])
+
+    def create_products(self, rng, subcategories, count):
+        """
+        Products spread evenly over the subcategories, coded series prefix +
+        picking-sheet code. The first products take one code of each sheet
+        cell under the first prefix, so they all show on the picking sheet;
+        past the sheet size the codes repeat under the next prefixes, which
+        the sheet shows only when the earlier series is missing.
+        """
+        sheet_codes = picking_sheet_codes()
+        products = []
+        for i in range(count):
+            category = subcategories[i * len(subcategories) // count]
+            series, cell = divmod(i, len(sheet_codes))
+            prefix = PRODUCT_CODE_PREFIXES[series % len(PRODUCT_CODE_PREFIXES)]
+            product = Product(
+                category=category,
+                name=f"{BENCH_PREFIX} {prefix} {sheet_codes[cell]}",
+                code=f"{prefix}{sheet_codes[cell]}",
+                pick_order=i + 1,
+                display_order=i,
+                price=Decimal(rng.randrange(5000, 150000, 50)) / 100,
+                unit="adet",
+            )
+            offer = rng.random()
+            if offer < PRICE_OVERRIDE_SHARE:
+                product.discount_price = (product.price * Decimal("0.75")).quantize(Decimal("0.01"))
+            elif offer < DISCOUNTED_SHARE:
+                product.discount_percent = rng.choice(DISCOUNT_PERCENTS)
+            # bulk_create skips save(), which maintains final_price
+            product.final_price = product.compute_final_price()
+            products.append(product)
+
+        return Product.objects.bulk_create(products, batch_size=1000)
+
+    def create_discount_tiers(self):
+        """Tiers per customer type, unless the database has some already."""
+        for customer_type, tiers in DISCOUNT_TIERS.items():
+            if DiscountTier.objects.filter(customer_type=customer_type, is_active=True).exists():
+                continue
+            DiscountTier.objects.bulk_create([
+                DiscountTier(
+                    customer_type=customer_type,
+                    threshold=Decimal(threshold),
+                    discount_percentage=Decimal(percentage),
+                )
+                for threshold, percentage in tiers
+            ])
+
+    # ----------------------------
+    #  Order history
+    # ----------------------------
+
+    def order_times(self, rng, options):
+        """Confirmation times, oldest first: shop hours, weekdays busier than Sundays."""
+        now = timezone.now()
+        days = options["months"] * 30
+        for day in range(days, -1, -1):
+            date = now - timedelta(days=day)
+            per_day = options["orders_per_day"] * (0.3 if date.weekday() == 6 else 1)
+            count = max(0, round(rng.gauss(per_day, per_day ** 0.5)))
+            times = sorted(
+                date.replace(hour=8, minute=0, second=0, microsecond=0)
+                + timedelta(seconds=rng.uniform(0, 12 * 3600))
+                for _ in range(count)
+            )
+            yield from (t for t in times if t < now)
+
+    def create_orders(self, rng, products, options):
+        # Popular products sell far more often than the long tail
+        # The picking sheet lists the best sellers: its products rank first
+        sheet_size = len(picking_sheet_codes())
+        on_sheet, off_sheet = products[:sheet_size], products[sheet_size:]
+        rng.shuffle(on_sheet)
+        rng.shuffle(off_sheet)
+        popularity = on_sheet + off_sheet
+        cum_weights = list(accumulate(1 / (rank + 1) for rank in range(len(popularity))))
+        ranges = [(lo, hi) for lo, hi, _ in BASKET_SIZES]
+        range_weights = [weight for _, _, weight in BASKET_SIZES]
+
+        times = list(self.order_times(rng, options))
+        queued_from = len(times) - options["queued"]
+        now = timezone.now()
+        total_items = 0
+
+        for start in range(0, len(times), options["batch_size"]):
+            orders, baskets = [], []
+            for n, created_at in enumerate(times[start:start + options["batch_size"]], start):
+                customer_type = "wholesale" if rng.random() < options["wholesale_share"] else "retail"
+                lo, hi = rng.choices(ranges, weights=range_weights)[0]
+                size = min(rng.randint(lo, hi), len(products))
+                basket = {}
+                while len(basket) < size:
+                    product = rng.choices(popularity, cum_weights=cum_weights)[0]
+                    basket[product.id] = (product, rng.randint(1, 12 if customer_type == "wholesale" else 4))
+
+                subtotal = sum(p.final_price * qty for p, qty in basket.values())
+                discount = calculate_discount(subtotal, customer_type)
+                printed = n < queued_from
+                orders.append(Order(
+                    customer_name=f"{BENCH_PREFIX} Müşteri {n + 1}",
+                    customer_phone=f"0555{n % 10000000:07d}",
+                    customer_type=customer_type,
+                    is_confirmed=True,
+                    printed=printed,
+                    printed_at=min(created_at + timedelta(minutes=rng.uniform(1, 30)), now) if printed else None,
+                    print_agent="bench" if printed else "",
+                    subtotal=subtotal,
+                    discount_percentage=discount["discount_percentage"],
+                    discount_amount=discount["discount_amount"],
+                    final_total=discount["final_total"],
+                ))
+                baskets.append((created_at, basket))
+
+            with transaction.atomic():
+                orders = Order.objects.bulk_create(orders)
+                # auto_now_add stamps "now" on insert; backdate them in bulk
+                for order, (created_at, _) in zip(orders, baskets):
+                    order.created_at = created_at
+                Order.objects.bulk_update(orders, ["created_at"])
+
+                items = [
+                    OrderItem(
+                        order=order,
+                        product=product,
+                        quantity=quantity,
+                        product_name=product.name,
+                        product_code=product.code,
+                        pick_order=product.pick_order,
+                        list_price=product.price,
+                        unit_price=product.final_price,
+                        line_total=product.final_price * quantity,
+                    )
+                    for order, (_, basket) in zip(orders, baskets)
+                    for product, quantity in basket.values()
+                ]
+                OrderItem.objects.bulk_create(items, batch_size=2000)
+
+            total_items += len(items)
+            self.stdout.write(f"  {start + len(orders)}/{len(times)} orders")
+
+        return len(times), total_items
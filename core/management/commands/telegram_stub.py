@@ -0,0 +1,168 @@
+import json
+import re
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+METHOD_RE = re.compile(r"^/bot[^/]+/(\w+)$")
+
+
+class StubState:
+    """Counters and the per-chat message log used for the 429 simulation."""
+    def __init__(self, messages_per_minute, latency):
+        self.messages_per_minute = messages_per_minute
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.sent_by_chat = {}      # chat_id -> [timestamps of accepted messages]
+        self.calls = 0
+        self.messages = 0
+        self.rejected = 0
+        self.bytes = 0
+        self.next_message_id = 1
+
+    def accept(self, chat_id, count, size):
+        """
+        Record `count` messages. Returns (retry_after, None) when the chat is
+        over its limit, else (0, first message id).
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.calls += 1
+            self.bytes += size
+            recent = [t for t in self.sent_by_chat.get(chat_id, []) if now - t < 60]
+            if self.messages_per_minute and len(recent) + count > self.messages_per_minute:
+                self.sent_by_chat[chat_id] = recent
+                self.rejected += 1
+                return int(60 - (now - recent[0])) + 1, None
+            recent.extend([now] * count)
+            self.sent_by_chat[chat_id] = recent
+            self.messages += count
+            first = self.next_message_id
+            self.next_message_id += count
+            return 0, first
+
+
+def parse_form(content_type, body):
+    """multipart/form-data or urlencoded body -> {field: str}; files are skipped."""
+    if content_type.startswith("multipart/"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        fields = {}
+        for part in message.iter_parts():
+            if part.get_filename() is None:
+                fields[part.get_param("name", header="content-disposition")] = part.get_content()
+        return fields
+
+    from urllib.parse import parse_qs
+    return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, like the real API
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            match = METHOD_RE.match(self.path)
+            if not match:
+                return self.reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+
+            method = match.group(1)
+            fields = parse_form(self.headers.get("Content-Type", ""), body)
+            chat_id = fields.get("chat_id")
+            if not chat_id:
+                return self.reply(400, {"ok": False, "error_code": 400, "description": "Bad Request: chat_id is empty"})
+
+            if method == "sendMediaGroup":
+                count = len(json.loads(fields.get("media", "[]")))
+            elif method in ("sendDocument", "sendMessage"):
+                count = 1
+            else:
+                return self.reply(404, {"ok": False, "error_code": 404, "description": f"Unknown method {method}"})
+            if state.messages_per_minute and count > state.messages_per_minute:
+                # Would never fit in the window: retrying cannot help, so no 429
+                return self.reply(400, {
+                    "ok": False,
+                    "error_code": 400,
+                    "description": f"Bad Request: {count} messages exceed the limit of {state.messages_per_minute} per minute",
+                })
+
+            if state.latency:
+                time.sleep(state.latency)
+
+            retry_after, first_id = state.accept(chat_id, count, len(body))
+            if retry_after:
+                return self.reply(429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                })
+
+            messages = [
+                {"message_id": first_id + i, "chat": {"id": chat_id}, "date": int(time.time())}
+                for i in range(count)
+            ]
+            self.reply(200, {"ok": True, "result": messages if method == "sendMediaGroup" else messages[0]})
+
+        def reply(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stub of the Telegram Bot API (sendDocument, sendMediaGroup, sendMessage) "
+        "for offline throughput tests. Point TELEGRAM_API_URL at it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=8081, help="Port to listen on (default: 8081)")
+        parser.add_argument(
+            "--messages-per-minute",
+            type=int,
+            default=20,
+            help="Per-chat limit before answering 429, like a group chat (default: 20, 0 = unlimited)",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.05,
+            help="Seconds each call takes (default: 0.05)",
+        )
+
+    def handle(self, *args, **options):
+        state = StubState(options["messages_per_minute"], options["latency"])
+        server = ThreadingHTTPServer(("127.0.0.1", options["port"]), make_handler(state))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        self.stdout.write(f"Telegram stub on http://127.0.0.1:{options['port']} - Ctrl+C to stop.")
+        started = time.monotonic()
+        try:
+            while True:
+                time.sleep(5)
+                elapsed = time.monotonic() - started
+                with state.lock:
+                    self.stdout.write(
+                        f"{elapsed:6.0f}s  calls {state.calls}  messages {state.messages}  "
+                        f"429s {state.rejected}  {state.bytes / 1024:.0f} KB  "
+                        f"({state.calls / elapsed:.1f} calls/s)"
+                    )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
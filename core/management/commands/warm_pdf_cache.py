@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Order
+from core.pdf_cache import cache_dir, get_picking_pdf, get_receipt_pdf
+
+
+class Command(BaseCommand):
+    help = "Pre-render receipt and picking PDFs of confirmed, unprinted orders into the PDF cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=200,
+            help="Maximum number of orders to warm (oldest first, default: 200)",
+        )
+
+    def handle(self, *args, **options):
+        if cache_dir() is None:
+            self.stdout.write(self.style.WARNING("PDF cache is disabled (PDF_CACHE_DIR is empty)."))
+            return
+
+        orders = (
+            Order.objects
+            .filter(is_confirmed=True, printed=False)
+            .order_by("created_at")[:options["limit"]]
+        )
+
+        count = 0
+        for order in orders:
+            get_receipt_pdf(order)
+            get_picking_pdf(order)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Warmed PDF cache for {count} orders."))
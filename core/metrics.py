@@ -0,0 +1,132 @@
+# ============================
+#  REQUEST METRICS
+# ============================
+#
+# Wall time, DB query count and DB time of every request (see
+# middleware.py) and of every outbox job, plus named spans around the
+# expensive steps, streamed to collector.py as one UDP datagram each:
+#
+#   "<tag> <ms>"                      a span, e.g. "outbox/order_documents_telegram/picking_pdf 41.2"
+#   "<tag> <ms> <queries> <db_ms>"    a request or job, e.g. "order_confirm 18.3 12 4.1"
+#
+# Requests are tagged with their URL name; span tags add "/<span>" to the
+# tag of the request or job they run in. Sending never blocks: the socket
+# is non-blocking and a dropped datagram is ignored, so with no collector
+# listening the cost is one sendto per sample. Empty METRICS_COLLECTOR
+# turns it all off.
+
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+
+
+class Sample:
+    """A request or job being measured; counts its DB queries as an execute wrapper."""
+    def __init__(self, tag):
+        self.tag = tag
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+
+_current = ContextVar("metrics_sample", default=None)
+_socket = None
+_socket_lock = threading.Lock()
+
+
+@lru_cache(maxsize=4)
+def _resolve(collector: str):
+    host, _, port = collector.rpartition(":")
+    family, _, _, _, address = socket.getaddrinfo(host or "127.0.0.1", int(port), type=socket.SOCK_DGRAM)[0]
+    return family, address
+
+
+def collector_address():
+    """(family, address) of the collector, or None when metrics are off."""
+    if not settings.METRICS_COLLECTOR:
+        return None
+    try:
+        return _resolve(settings.METRICS_COLLECTOR)
+    except (OSError, ValueError):
+        return None
+
+
+def emit(tag, ms, queries=None, db_ms=None):
+    global _socket
+    target = collector_address()
+    if target is None:
+        return
+
+    family, address = target
+    if queries is None:
+        payload = f"{tag} {ms:.3f}"
+    else:
+        payload = f"{tag} {ms:.3f} {queries} {db_ms:.3f}"
+
+    if _socket is None:
+        with _socket_lock:
+            if _socket is None:
+                sock = socket.socket(family, socket.SOCK_DGRAM)
+                sock.setblocking(False)
+                _socket = sock
+    try:
+        _socket.sendto(payload.encode("utf-8"), address)
+    except OSError:
+        pass  # collector down or buffer full: drop the sample
+
+
+@contextmanager
+def measure(tag="", count_queries=True):
+    """
+    Measure a request or job: wall time, plus query count and DB time on
+    the default connection of this thread unless count_queries is False.
+    The tag can still be set on the yielded sample.
+    """
+    if collector_address() is None:
+        yield None
+        return
+
+    sample = Sample(tag)
+    token = _current.set(sample)
+    started = time.perf_counter()
+    try:
+        if count_queries:
+            with connection.execute_wrapper(sample):
+                yield sample
+        else:
+            yield sample
+    finally:
+        _current.reset(token)
+        ms = (time.perf_counter() - started) * 1000
+        if count_queries:
+            emit(sample.tag or "unresolved", ms, sample.queries, sample.db_seconds * 1000)
+        else:
+            emit(sample.tag or "unresolved", ms)
+
+
+@contextmanager
+def span(name):
+    """Time one step of the current request or job."""
+    sample = _current.get()
+    if sample is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        emit(f"{sample.tag or 'unresolved'}/{name}", (time.perf_counter() - started) * 1000)
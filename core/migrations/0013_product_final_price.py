@@ -0,0 +1,36 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_final_price(apps, schema_editor):
+    # Historical models have no methods: mirrors Product.compute_final_price
+    Product = apps.get_model('core', 'Product')
+    products = list(Product.objects.all())
+    for p in products:
+        if p.price is None:
+            p.final_price = None
+        elif p.discount_price is not None:
+            p.final_price = p.discount_price
+        elif p.discount_percent:
+            factor = Decimal(100 - p.discount_percent) / Decimal(100)
+            p.final_price = (p.price * factor).quantize(Decimal("0.01"))
+        else:
+            p.final_price = p.price
+    Product.objects.bulk_update(products, ['final_price'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_colorpalette_remove_category_color_code_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='final_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Final price'),
+        ),
+        migrations.RunPython(backfill_final_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_snapshot(apps, schema_editor):
+    # Existing rows get the current catalog values: the prices at confirm
+    # time were never stored. Mirrors OrderItem.capture_product.
+    OrderItem = apps.get_model('core', 'OrderItem')
+    items = list(OrderItem.objects.select_related('product'))
+    for item in items:
+        product = item.product
+        item.product_name = product.name
+        item.product_code = product.code or ""
+        item.pick_order = product.pick_order
+        item.list_price = product.price
+        if product.final_price is not None:
+            item.unit_price = product.final_price
+        else:
+            item.unit_price = product.price or Decimal("0.00")
+        item.line_total = item.unit_price * item.quantity
+    OrderItem.objects.bulk_update(
+        items,
+        ['product_name', 'product_code', 'pick_order', 'list_price', 'unit_price', 'line_total'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_product_final_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_code',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='pick_order',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='list_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.RunPython(backfill_snapshot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_outboxjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DraftCart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_name', models.CharField(max_length=200)),
+                ('customer_phone', models.CharField(blank=True, max_length=50)),
+                ('customer_email', models.EmailField(blank=True, max_length=254)),
+                ('customer_note', models.TextField(blank=True)),
+                ('customer_type', models.CharField(choices=[('retail', 'Perakende'), ('wholesale', 'Toptan')], default='retail', max_length=20)),
+                ('items', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
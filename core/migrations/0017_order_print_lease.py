@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_draftcart'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='print_agent',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='print_lease',
+            field=models.CharField(blank=True, db_index=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='print_lease_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
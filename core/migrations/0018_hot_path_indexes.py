@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_order_print_lease'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='draftcart',
+            index=models.Index(fields=['updated_at'], name='draftcart_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_confirmed', True), ('printed', False)), fields=['created_at', 'id'], name='order_print_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='order_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'display_order', 'name'], name='product_active_category_idx'),
+        ),
+    ]
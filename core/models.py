@@ -86,6 +86,18 @@ class Product(models.Model):
     )
     unit = models.CharField(max_length=50, blank=True)  # e.g. "piece", "box", "kg"
 
+    # Effective selling price, stored so totals can be computed and the admin
+    # can sort/filter in SQL. Kept in sync by save(); code that bypasses
+    # save() (bulk_create, update) must set it via compute_final_price().
+    final_price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name="Final price",
+    )
+
     # Whether the product should appear in the order form
     is_active = models.BooleanField(default=True)
 
@@ -94,21 +106,33 @@ class Product(models.Model):
 
     class Meta:
         ordering = ("display_order", "name")
+        indexes = [
+            # Order form: active products of the shown categories, in display order
+            models.Index(
+                fields=["category", "display_order", "name"],
+                condition=models.Q(is_active=True),
+                name="product_active_category_idx",
+            ),
+        ]
 
     def __str__(self):
         # How the product will be shown in admin / logs
         return f"{self.name} ({self.code})" if self.code else self.name
 
-    @property
-    def final_price(self):
+    def save(self, *args, **kwargs):
+        self.final_price = self.compute_final_price()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "final_price"}
+        super().save(*args, **kwargs)
+
+    def compute_final_price(self):
         """
         Final selling price logic:
         1. If discount_price is set -> use that.
         2. Else if discount_percent > 0 -> price * (100 - discount_percent) / 100.
         3. Else -> price.
         """
-        from decimal import Decimal
-
         if self.price is None:
             return None
 
@@ -141,12 +165,31 @@ class Order(models.Model):
     is_confirmed = models.BooleanField(default=False)
     printed = models.BooleanField(default=False)
     printed_at = models.DateTimeField(null=True, blank=True)
+
+    # Print queue lease (print_queue.py): the agent that claimed the order
+    # for printing and until when no other agent may take it
+    print_lease = models.CharField(max_length=32, blank=True, db_index=True)
+    print_agent = models.CharField(max_length=100, blank=True)
+    print_lease_expires = models.DateTimeField(null=True, blank=True)
     
     subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     final_total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    class Meta:
+        indexes = [
+            # Print queue: confirmed, unprinted orders oldest first. Partial,
+            # so it only holds the few orders still waiting to be printed.
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(is_confirmed=True, printed=False),
+                name="order_print_queue_idx",
+            ),
+            # Date filters: admin, order item history, purge of stale orders
+            models.Index(fields=["created_at"], name="order_created_at_idx"),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} - {self.customer_name} ({self.created_at:%Y-%m-%d})"
 
@@ -163,8 +206,37 @@ class OrderItem(models.Model):
     )
     quantity = models.PositiveIntegerField()
 
+    # Snapshot of the product at the time the line was priced: taken when
+    # the order is confirmed (pricing.build_order_items), or on first save
+    # for items added elsewhere. Receipts and CSVs read only these, so
+    # later catalog changes never alter a historical order.
+    product_name = models.CharField(max_length=200, blank=True)
+    product_code = models.CharField(max_length=100, blank=True)
+    pick_order = models.PositiveIntegerField(null=True, blank=True)
+    list_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
     def __str__(self):
-        return f"{self.product.name} x {self.quantity}"
+        return f"{self.product_name or self.product.name} x {self.quantity}"
+
+    def capture_product(self, product=None):
+        """Copy name, code, pick order and prices from the (given) product."""
+        product = product or self.product
+        self.product_name = product.name
+        self.product_code = product.code or ""
+        self.pick_order = product.pick_order
+        self.list_price = product.price
+        self.unit_price = product.final_price if product.final_price is not None else (product.price or Decimal("0.00"))
+
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.capture_product()
+        self.line_total = self.unit_price * self.quantity
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "line_total"}
+        super().save(*args, **kwargs)
 
 class DiscountTier(models.Model):
     threshold = models.DecimalField(max_digits=10, decimal_places=2, help_text="Minimum order amount in TL")
@@ -227,4 +299,72 @@ class ColorPalette(models.Model):
     color_preview.short_description = 'Colors'
     
     def __str__(self):
-        return f"{self.name} ({self.get_effect_type_display()})"
\ No newline at end of file
+        return f"{self.name} ({self.get_effect_type_display()})"
+
+class DraftCart(models.Model):
+    """
+    A basket between order_form and order_confirm. It only becomes an Order
+    (with its OrderItems) when the customer confirms, so abandoned reviews
+    never reach the order tables; stale drafts are removed by
+    `manage.py purge_stale_orders`.
+    """
+    customer_name = models.CharField(max_length=200)
+    customer_phone = models.CharField(max_length=50, blank=True)
+    customer_email = models.EmailField(blank=True)
+    customer_note = models.TextField(blank=True)
+    customer_type = models.CharField(
+        max_length=20,
+        choices=[('retail', 'Perakende'), ('wholesale', 'Toptan')],
+        default='retail'
+    )
+
+    # {"<product id>": quantity}
+    items = models.JSONField(default=dict)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # purge_stale_orders
+        indexes = [models.Index(fields=["updated_at"], name="draftcart_updated_at_idx")]
+
+    def __str__(self):
+        return f"Draft #{self.id} - {self.customer_name} ({self.updated_at:%Y-%m-%d})"
+
+    @property
+    def quantities(self):
+        """Items as {product_id: quantity} with int keys."""
+        return {int(product_id): qty for product_id, qty in self.items.items()}
+
+
+class OutboxJob(models.Model):
+    """
+    Work to do after an order is confirmed (Telegram uploads, ...), written
+    in the same transaction as the confirmation and drained by
+    `manage.py run_outbox` (see outbox.py).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('dead', 'Dead'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    order = models.ForeignKey(Order, related_name="outbox_jobs", on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['status', 'run_after'])]
+        verbose_name = 'Outbox Job'
+        verbose_name_plural = 'Outbox Jobs'
+
+    def __str__(self):
+        return f"{self.kind} #{self.order_id} ({self.status})"
@@ -0,0 +1,274 @@
+# ============================
+#  OUTBOX
+# ============================
+#
+# Post-confirmation work (the order CSV and both PDFs to Telegram) used to
+# run inside order_confirm, so the customer waited on three uploads and a
+# Telegram outage hung or broke the checkout. order_confirm now only writes
+# OutboxJob rows in the transaction that confirms the order, and
+# `manage.py run_outbox` drains them:
+#
+#   pending --claim--> running --ok--> done
+#                         |
+#                         +--error--> pending (run_after = now + backoff)
+#                         +--error, attempts >= OUTBOX_MAX_ATTEMPTS--> dead
+#
+# Jobs are claimed with a conditional UPDATE, so several workers can drain
+# the same table. Every claim counts as an attempt. A job left "running" by
+# a killed worker is claimed again once its lease (OUTBOX_LEASE_SECONDS) has
+# expired, unless it has used up its attempts: then it is dead, so a job
+# that crashes its worker cannot loop forever. A worker records the outcome
+# only while it still holds the claim; after its lease was taken over the
+# result is dropped. Dead jobs stay in the table for the admin to inspect
+# and retry.
+#
+# Digest mode: when at least TELEGRAM_DIGEST_THRESHOLD orders confirm
+# within TELEGRAM_DIGEST_WINDOW seconds, per-order document jobs are held
+# until the oldest is a window old and then sent together as one ZIP with a
+# summary caption (run_digest). Below the threshold orders go out one by one.
+
+import io
+import random
+import traceback
+import zipfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .metrics import measure, span
+from .models import Order, OutboxJob
+from .pricing import generate_order_csv
+
+ORDER_DOCUMENTS_TELEGRAM = "order_documents_telegram"
+# Single-document jobs, still handled for rows queued before the album job
+ORDER_CSV_TELEGRAM = "order_csv_telegram"
+ORDER_PICKING_TELEGRAM = "order_picking_telegram"
+ORDER_RECEIPT_TELEGRAM = "order_receipt_telegram"
+
+
+# ============================
+#  HANDLERS
+# ============================
+
+def send_order_documents(order):
+    from .pdf_cache import get_picking_pdf, get_receipt_pdf
+    from .telegram_utils import send_order_documents_via_telegram
+
+    with span("csv"):
+        csv_content = generate_order_csv(order)
+    with span("picking_pdf"):
+        picking_pdf = get_picking_pdf(order)
+    with span("receipt_pdf"):
+        receipt_pdf = get_receipt_pdf(order)
+
+    send_order_documents_via_telegram(order, csv_content, picking_pdf, receipt_pdf)
+
+
+def send_order_csv(order):
+    from .telegram_utils import send_order_csv_via_telegram
+
+    with span("csv"):
+        csv_content = generate_order_csv(order)
+    send_order_csv_via_telegram(order, csv_content)
+
+
+def send_picking_pdf(order):
+    from .pdf_cache import get_picking_pdf
+    from .telegram_utils import send_order_picking_pdf_to_telegram
+
+    with span("picking_pdf"):
+        pdf_content = get_picking_pdf(order)
+    send_order_picking_pdf_to_telegram(order, pdf_content)
+
+
+def send_receipt_pdf(order):
+    from .pdf_cache import get_receipt_pdf
+    from .telegram_utils import send_order_receipt_pdf_to_telegram
+
+    with span("receipt_pdf"):
+        pdf_content = get_receipt_pdf(order)
+    send_order_receipt_pdf_to_telegram(order, pdf_content)
+
+
+# A handler gets the job's order and raises on failure (the job is retried)
+HANDLERS = {
+    ORDER_DOCUMENTS_TELEGRAM: send_order_documents,
+    ORDER_CSV_TELEGRAM: send_order_csv,
+    ORDER_PICKING_TELEGRAM: send_picking_pdf,
+    ORDER_RECEIPT_TELEGRAM: send_receipt_pdf,
+}
+
+ORDER_CONFIRMED_JOBS = (
+    ORDER_DOCUMENTS_TELEGRAM,
+)
+
+
+# ============================
+#  ENQUEUE
+# ============================
+
+def enqueue_order_confirmed(order: Order):
+    """Queue the post-confirmation jobs; call inside the confirming transaction."""
+    OutboxJob.objects.bulk_create([
+        OutboxJob(kind=kind, order=order) for kind in ORDER_CONFIRMED_JOBS
+    ])
+
+
+# ============================
+#  CLAIM + RUN
+# ============================
+
+def _due(now):
+    lease_expired = now - timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+    return Q(status="pending", run_after__lte=now) | Q(status="running", locked_at__lt=lease_expired)
+
+
+def _claim(queryset, limit, now) -> list:
+    claimed = []
+    for job_id, status, locked_at, attempts in (
+        queryset.order_by("id").values_list("id", "status", "locked_at", "attempts")[:limit]
+    ):
+        # Only one worker wins the row: the UPDATE re-checks what we read
+        race_free = OutboxJob.objects.filter(id=job_id, status=status, locked_at=locked_at)
+        if status == "running" and attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            # Its last attempt never finished: the worker died on it
+            race_free.update(
+                status="dead",
+                last_error="Lease expired on the last attempt",
+                locked_at=None,
+                finished_at=now,
+            )
+            continue
+        if race_free.update(status="running", locked_at=now, attempts=F("attempts") + 1):
+            claimed.append(job_id)
+
+    return list(OutboxJob.objects.filter(id__in=claimed).select_related("order").order_by("id"))
+
+
+def claim_jobs(limit: int, exclude_kinds=()) -> list:
+    """Claim up to `limit` due jobs for this worker, oldest first."""
+    now = timezone.now()
+    return _claim(OutboxJob.objects.filter(_due(now)).exclude(kind__in=exclude_kinds), limit, now)
+
+
+def claim_digest_jobs():
+    """
+    Decide how order documents go out right now. Returns (hold, jobs):
+    jobs is a batch to send with run_digest; hold means order document
+    jobs must wait because a digest window is still open.
+    """
+    window = settings.TELEGRAM_DIGEST_WINDOW
+    if not window:
+        return False, []
+
+    now = timezone.now()
+    window_start = now - timedelta(seconds=window)
+    documents = OutboxJob.objects.filter(kind=ORDER_DOCUMENTS_TELEGRAM)
+    due = documents.filter(_due(now))
+
+    recent = documents.filter(created_at__gte=window_start).count()
+    waiting = due.count()
+    if recent < settings.TELEGRAM_DIGEST_THRESHOLD and waiting < settings.TELEGRAM_DIGEST_THRESHOLD:
+        return False, []
+
+    oldest = due.order_by("id").values_list("created_at", flat=True).first()
+    if oldest is None:
+        return False, []
+    if oldest > window_start:
+        return True, []
+
+    return False, _claim(due, settings.TELEGRAM_DIGEST_MAX_ORDERS, now)
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter: base, 2×base, 4×base, ... capped."""
+    delay = min(settings.OUTBOX_RETRY_BASE * 2 ** (attempts - 1), settings.OUTBOX_RETRY_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _finish(job, **fields) -> bool:
+    """Record a claimed job's outcome, unless another worker took over its lease."""
+    return bool(
+        OutboxJob.objects
+        .filter(id=job.id, status="running", locked_at=job.locked_at)
+        .update(locked_at=None, **fields)
+    )
+
+
+def _job_failed(job, error, final=False) -> bool:
+    # The claim already counted this attempt
+    if final or job.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        return _finish(job, status="dead", last_error=error, finished_at=timezone.now())
+    run_after = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+    return _finish(job, status="pending", last_error=error, run_after=run_after)
+
+
+def _job_done(job) -> bool:
+    return _finish(job, status="done", finished_at=timezone.now())
+
+
+def run_job(job: OutboxJob) -> bool:
+    """Run one claimed job and record the outcome. Returns True on success."""
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown outbox job kind: {job.kind}")
+        with measure(f"outbox/{job.kind}"):
+            handler(job.order)
+    except Exception:
+        _job_failed(job, traceback.format_exc(limit=5), final=handler is None)
+        return False
+
+    _job_done(job)
+    return True
+
+
+def build_digest_zip(orders) -> bytes:
+    """One ZIP with every order's CSV, picking list and receipt."""
+    from .pdf_cache import get_picking_pdf, get_receipt_pdf
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for order in orders:
+            with span("csv"):
+                archive.writestr(f"order_{order.id}.csv", generate_order_csv(order))
+            with span("picking_pdf"):
+                archive.writestr(f"order_{order.id}_picking.pdf", get_picking_pdf(order))
+            with span("receipt_pdf"):
+                archive.writestr(f"order_{order.id}_receipt.pdf", get_receipt_pdf(order))
+    return buffer.getvalue()
+
+
+def run_digest(jobs) -> bool:
+    """Send claimed order document jobs as one digest message; all succeed or fail together."""
+    from .telegram_utils import send_order_digest_via_telegram
+
+    if len(jobs) == 1:
+        return run_job(jobs[0])
+
+    orders = [job.order for job in jobs]
+    try:
+        with measure("outbox/digest"):
+            send_order_digest_via_telegram(orders, build_digest_zip(orders))
+    except Exception:
+        error = traceback.format_exc(limit=5)
+        for job in jobs:
+            _job_failed(job, error)
+        return False
+
+    for job in jobs:
+        _job_done(job)
+    return True
+
+
+def requeue_jobs(queryset) -> int:
+    """Send dead (or any) jobs back to the queue with a fresh attempt budget."""
+    return queryset.update(
+        status="pending",
+        attempts=0,
+        run_after=timezone.now(),
+        locked_at=None,
+        finished_at=None,
+    )
@@ -0,0 +1,182 @@
+# ============================
+#  PDF ARTIFACT CACHE
+# ============================
+#
+# On-disk cache for receipt and picking PDFs. File names carry the order
+# id, the template version and a hash of everything the PDF shows (items,
+# products, totals, customer fields). Editing an order changes the hash, so
+# the old file is never served again and is removed on the next write.
+# The directory is capped at PDF_CACHE_MAX_BYTES; least recently served
+# files are evicted first.
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import Order
+from .pdf_service import render_order_pdf
+from .pdf_utils import PICKING_LAYOUT_VERSION, RECEIPT_TEMPLATE_VERSION
+from .pricing import prefetched_items
+
+TEMPLATE_VERSIONS = {
+    "picking": f"picking-{PICKING_LAYOUT_VERSION}",
+    "receipt": f"receipt-{RECEIPT_TEMPLATE_VERSION}",
+}
+
+
+def cache_dir():
+    """Cache directory, or None when the cache is disabled."""
+    path = getattr(settings, "PDF_CACHE_DIR", None)
+    return Path(path) if path else None
+
+
+def order_digest(order: Order) -> str:
+    """Hash of everything the order's PDFs are built from."""
+    h = hashlib.sha256()
+    h.update(repr((
+        order.customer_name,
+        order.customer_phone,
+        order.customer_email,
+        order.customer_note,
+        order.customer_type,
+        order.created_at.isoformat() if order.created_at else "",
+        str(order.subtotal),
+        str(order.discount_percentage),
+        str(order.discount_amount),
+        str(order.final_total),
+    )).encode("utf-8"))
+
+    # Receipts read the items' price snapshot; the picking sheet maps
+    # products to sheet codes through the live catalog code.
+    items = prefetched_items(order)
+    if items is not None:
+        # Prefetched with select_related("product")
+        rows = [
+            (i.product_id, i.quantity, i.product_name, i.pick_order, i.unit_price, i.line_total, i.product.code)
+            for i in sorted(items, key=lambda i: i.id)
+        ]
+    else:
+        rows = (
+            order.items
+            .order_by("id")
+            .values_list(
+                "product_id",
+                "quantity",
+                "product_name",
+                "pick_order",
+                "unit_price",
+                "line_total",
+                "product__code",
+            )
+        )
+    for row in rows:
+        h.update(repr(row).encode("utf-8"))
+
+    return h.hexdigest()[:32]
+
+
+def cache_path(kind: str, order: Order, digest: str) -> Path:
+    version = TEMPLATE_VERSIONS[kind]
+    return cache_dir() / f"{kind}_{order.id}_{version}_{digest}.pdf"
+
+
+def get_order_pdf(kind: str, order: Order) -> bytes:
+    """
+    Return the receipt/picking PDF for this order, from the cache when it
+    is current, otherwise built and written to the cache.
+    """
+    if cache_dir() is None:
+        return render_order_pdf(kind, order)
+
+    path = cache_path(kind, order, order_digest(order))
+    try:
+        pdf_bytes = path.read_bytes()
+    except FileNotFoundError:
+        pass
+    else:
+        # Mark as recently used for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return pdf_bytes
+
+    pdf_bytes = render_order_pdf(kind, order)
+    _write(kind, order, path, pdf_bytes)
+    return pdf_bytes
+
+
+def get_receipt_pdf(order: Order) -> bytes:
+    return get_order_pdf("receipt", order)
+
+
+def get_picking_pdf(order: Order) -> bytes:
+    return get_order_pdf("picking", order)
+
+
+def _write(kind, order, path, pdf_bytes):
+    directory = path.parent
+    directory.mkdir(parents=True, exist_ok=True)
+
+    # Write-then-rename so readers never see a partial file
+    fd, tmp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_name, path)
+    except OSError:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        return
+
+    # Older versions of this order's PDF can never be served again
+    for stale in directory.glob(f"{kind}_{order.id}_*.pdf"):
+        if stale != path:
+            _unlink(stale)
+
+    evict(exclude=path)
+
+
+def evict(exclude=None):
+    """Delete least recently used files until the cache fits its size cap."""
+    directory = cache_dir()
+    max_bytes = getattr(settings, "PDF_CACHE_MAX_BYTES", 0)
+    if directory is None or not max_bytes or not directory.exists():
+        return
+
+    entries = []
+    total = 0
+    with os.scandir(directory) as it:
+        for entry in it:
+            if not entry.name.endswith(".pdf"):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, Path(entry.path)))
+            total += st.st_size
+
+    if total <= max_bytes:
+        return
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        if path == exclude:
+            continue
+        _unlink(path)
+        total -= size
+
+
+def _unlink(path):
+    try:
+        path.unlink()
+    except OSError:
+        pass
@@ -0,0 +1,158 @@
+# ============================
+#  PDF RENDERING SERVICE
+# ============================
+#
+# Picking and receipt PDFs are CPU-bound ReportLab work. With
+# PDF_RENDER_WORKERS > 0 they are rendered in a bounded process pool
+# instead of the request thread: the web process takes an OrderSnapshot
+# (a picklable copy of everything the builders read, so workers never
+# touch the DB; see pdf_worker.py), submits it and waits up to
+# PDF_RENDER_TIMEOUT seconds. At most PDF_RENDER_MAX_QUEUE jobs may be in flight per web process;
+# beyond that callers get PdfRenderUnavailable instead of piling up.
+#
+# With PDF_RENDER_WORKERS = 0 (the default) everything renders inline.
+
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .models import Order
+from .pdf_worker import OrderSnapshot, init_worker, render_in_worker, render_snapshot
+
+
+class PdfRenderUnavailable(Exception):
+    """The render pool is full, timed out or broken; try again later."""
+
+
+# ============================
+#  POOL + METRICS
+# ============================
+
+_lock = threading.Lock()
+_pool = None
+_metrics = {
+    "queue_depth": 0,
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "timeouts": 0,
+    "render_ms_total": 0.0,
+    "render_ms_max": 0.0,
+    "wait_ms_total": 0.0,
+}
+
+
+def pool_enabled() -> bool:
+    return getattr(settings, "PDF_RENDER_WORKERS", 0) > 0
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn: never fork a web worker with open DB connections/threads
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(os.environ.get("DJANGO_SETTINGS_MODULE", "warehouse_orders.settings"),),
+            )
+        return _pool
+
+
+def _reset_pool(broken):
+    global _pool
+    with _lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+@atexit.register
+def shutdown_pool():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _job_done(future):
+    with _lock:
+        _metrics["queue_depth"] -= 1
+        if future.cancelled() or future.exception() is not None:
+            _metrics["failed"] += 1
+            return
+        _, render_ms = future.result()
+        _metrics["completed"] += 1
+        _metrics["render_ms_total"] += render_ms
+        _metrics["render_ms_max"] = max(_metrics["render_ms_max"], render_ms)
+
+
+def get_render_metrics() -> dict:
+    """Queue depth, job counters and render/wait times of this process's pool."""
+    with _lock:
+        metrics = dict(_metrics)
+    completed = metrics["completed"]
+    metrics["render_ms_avg"] = metrics["render_ms_total"] / completed if completed else 0.0
+    metrics["wait_ms_avg"] = metrics["wait_ms_total"] / completed if completed else 0.0
+    metrics["workers"] = getattr(settings, "PDF_RENDER_WORKERS", 0)
+    metrics["max_queue"] = getattr(settings, "PDF_RENDER_MAX_QUEUE", 0)
+    return metrics
+
+
+def render_order_pdf(kind: str, order: Order) -> bytes:
+    """
+    Render the "picking" or "receipt" PDF for an order, in the process pool
+    when it is enabled, otherwise inline.
+
+    Raises PdfRenderUnavailable when the pool is full, the job exceeds
+    PDF_RENDER_TIMEOUT or the pool broke.
+    """
+    snapshot = OrderSnapshot(order, kind)
+
+    if not pool_enabled():
+        return render_snapshot(snapshot)
+
+    with _lock:
+        if _metrics["queue_depth"] >= settings.PDF_RENDER_MAX_QUEUE:
+            _metrics["rejected"] += 1
+            raise PdfRenderUnavailable("PDF render queue is full")
+        _metrics["queue_depth"] += 1
+        _metrics["submitted"] += 1
+
+    pool = _get_pool()
+    started = time.perf_counter()
+    try:
+        future = pool.submit(render_in_worker, snapshot)
+    except (BrokenProcessPool, RuntimeError) as e:
+        with _lock:
+            _metrics["queue_depth"] -= 1
+            _metrics["failed"] += 1
+        _reset_pool(pool)
+        raise PdfRenderUnavailable(f"PDF render pool unavailable: {e}") from e
+    future.add_done_callback(_job_done)
+
+    try:
+        pdf_bytes, _ = future.result(timeout=settings.PDF_RENDER_TIMEOUT)
+    except FutureTimeoutError as e:
+        # A running job cannot be interrupted; it keeps its queue slot until done
+        future.cancel()
+        with _lock:
+            _metrics["timeouts"] += 1
+        raise PdfRenderUnavailable("PDF render timed out") from e
+    except BrokenProcessPool as e:
+        _reset_pool(pool)
+        raise PdfRenderUnavailable("PDF render worker crashed") from e
+
+    with _lock:
+        _metrics["wait_ms_total"] += (time.perf_counter() - started) * 1000
+    return pdf_bytes
@@ -1,6 +1,9 @@
 from io import BytesIO
+from copy import copy
+from functools import lru_cache
 from math import ceil
 import os
+import threading
 from decimal import Decimal
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib import colors
@@ -12,10 +15,15 @@ from reportlab.platypus import (
     Paragraph,
     PageBreak,
     Spacer,
-    Image
+    Image,
+    Frame,
 )
+from reportlab.pdfgen import canvas
+from pypdf import PdfReader, PdfWriter
 
-from .models import Product, Order
+from .models import Order
+from .pricing import get_order_lines
+from .product_index import get_product_code_index
 from django.conf import settings
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
@@ -23,6 +31,18 @@ from reportlab.pdfbase.ttfonts import TTFont
 FONT_PATH = os.path.join(settings.BASE_DIR, "fonts", "DejaVuSans.ttf")
 pdfmetrics.registerFont(TTFont("DejaVu", FONT_PATH))
 
+# Every render shares the registered TTFont. On save ReportLab subsets it
+# for the document by seeking through the shared font file, so two saves
+# at once read each other's glyphs (KeyError in makeSubset).
+_font_subset_lock = threading.Lock()
+
+
+class FontSafeCanvas(canvas.Canvas):
+    """Canvas whose save (font subsetting) runs one document at a time."""
+    def save(self):
+        with _font_subset_lock:
+            super().save()
+
 # ============================
 #  PRODUCT CODE DEFINITIONS
 # ============================
@@ -230,176 +250,207 @@ PAGES = [
 
 
 # ============================
-#  PDF BUILDER
+#  COMPILED LAYOUT
 # ============================
+#
+# Nothing in PAGES depends on the order: row counts, column widths,
+# row heights, styles and the code cells are the same for every picking
+# list. They are resolved once per process (and per layout version) into a
+# CompiledPickingLayout, so a render only has to fill in the quantities.
+#
+# The prebuilt flowables are never handed to ReportLab directly: it keeps
+# wrap and draw state (sizes, canv) on the flowable, so concurrent renders
+# would trample each other. Each render takes a shallow copy with fresh(),
+# which shares only the parsed text.
+#
+# Bump PICKING_LAYOUT_VERSION whenever PAGES or the picking styles change.
 
-def build_full_picking_pdf(order: Order) -> bytes:
-    """
-    Build a multi-page picking PDF with support for side-by-side tables.
-    
-    Layout:
-    • Page 1: Header + customer info + large Gel Polish grid
-    • Pages 2-3: Category tables (single or side-by-side)
-    
-    Each product cell has TWO rows:
-      - Top row: Product code (001, CE25, etc.)
-      - Bottom row: Quantity ordered (blank if none)
-    """
-    buffer = BytesIO()
+PICKING_LAYOUT_VERSION = 1
 
-    page_size = landscape(A4)
-    page_width, page_height = page_size
-    margin = 20
+# Total gap between side-by-side tables
+TABLE_SPACING = 30
 
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=page_size,
-        leftMargin=margin,
-        rightMargin=margin,
-        topMargin=margin,
-        bottomMargin=margin,
-    )
 
-    styles = getSampleStyleSheet()
+def fresh(flowable):
+    """This render's own copy of a prebuilt flowable."""
+    return copy(flowable)
 
-    # Header styles
-    header_title_style = ParagraphStyle(
-        "HeaderTitle",
-        parent=styles["Title"],
-        fontName="DejaVu",
-        fontSize=18,
-        leading=20,
-        alignment=1,  # center
-        textColor=colors.HexColor("#4B2E83"),
-    )
 
-    header_subtitle_style = ParagraphStyle(
-        "HeaderSubtitle",
-        parent=styles["Normal"],
-        fontName="DejaVu",
-        fontSize=11,
-        leading=13,
-        alignment=1,
-        textColor=colors.HexColor("#4B2E83"),
-    )
+class CompiledTable:
+    """A TableLayout with its geometry resolved and its code cells prebuilt."""
+    def __init__(self, layout, logical_rows, table_width, row_height, styles):
+        self.codes = layout.codes
+        self.num_cols = layout.num_cols
+        self.logical_rows = logical_rows
+        self.table_width = table_width
+        self.col_widths = [table_width / layout.num_cols] * layout.num_cols
+        self.row_heights = [row_height] * (2 * logical_rows)
 
-    header_info_value_style = ParagraphStyle(
-        "HeaderInfoValue",
-        parent=styles["Normal"],
-        fontName="DejaVu",
-        fontSize=9,
-        leading=11,
-        alignment=0,
-    )
+        self.label = (
+            Paragraph(layout.label, styles["table_title"]) if layout.label else None
+        )
 
-    # Category title style
-    table_title_style = ParagraphStyle(
-        "TableTitle",
-        parent=styles["Heading3"],
-        fontName="DejaVu",
-        fontSize=12,
-        leading=14,
-        alignment=1,
-        textColor=colors.HexColor("#4B2E83"),
-        spaceAfter=4,
-        spaceBefore=8,
-    )
+        # Code rows never change; pad the last one to fill the grid
+        blank_code = Paragraph("", styles["code"])
+        code_cells = [Paragraph(code, styles["code"]) for code in layout.codes]
+        code_cells += [blank_code] * (logical_rows * layout.num_cols - len(code_cells))
+        self.code_rows = [
+            code_cells[i:i + layout.num_cols]
+            for i in range(0, len(code_cells), layout.num_cols)
+        ]
+
+        self.style = TableStyle([
+            ("GRID", (0, 0), (-1, -1), 0.3, colors.lightgrey),
+            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+            ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+        ])
 
-    # Note styles
-    note_title_style = ParagraphStyle(
-        "NoteTitle",
-        parent=styles["Heading2"],
-        fontName="DejaVu",
-        fontSize=16,
-        leading=18,
-        alignment=0,
-        textColor=colors.HexColor("#4B2E83"),
-        spaceBefore=0,
-        spaceAfter=10,
-    )
 
-    note_body_style = ParagraphStyle(
-        "NoteBody",
-        parent=styles["Normal"],
-        fontName="DejaVu",
-        fontSize=10,
-        leading=13,
-        alignment=0,
-    )
+class CompiledTableRow:
+    """A TableRow whose tables are compiled; side-by-side rows get a container."""
+    def __init__(self, tables):
+        self.tables = tables
+
+        if len(tables) > 1:
+            # Alternating table widths and spacer widths
+            self.container_col_widths = []
+            for i, table in enumerate(tables):
+                self.container_col_widths.append(table.table_width)
+                if i < len(tables) - 1:
+                    self.container_col_widths.append(TABLE_SPACING)
+            self.container_style = TableStyle([
+                ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ])
+        else:
+            self.container_col_widths = None
+            self.container_style = None
+
+
+class CompiledPickingLayout:
+    """Everything in the picking PDF that does not depend on the order."""
+    def __init__(self, version, pages, styles, page_size, margin):
+        self.version = version
+        self.pages = pages          # List of pages, each a list of CompiledTableRow
+        self.styles = styles        # Name -> ParagraphStyle
+        self.page_size = page_size
+        self.margin = margin
+
+        self.header_title = Paragraph("SİPARİŞ LİSTESİ", styles["header_title"])
+        self.header_subtitle = Paragraph(
+            "MASTER BEST SİPARİŞ LİSTESİ – GEL POLISH", styles["header_subtitle"]
+        )
+        self.note_title = Paragraph("MÜŞTERİ NOTU", styles["note_title"])
 
-    # Cell styles
-    code_style = ParagraphStyle(
-        "CodeCell",
-        parent=styles["Normal"],
-        fontName="DejaVu",
-        fontSize=10,
-        leading=10,
-        alignment=1,   # center
-        spaceBefore=0,
-        spaceAfter=0,
-    )
+        # Shared quantity cells for codes that were not ordered and for padding
+        self.empty_qty_cell = Paragraph("-", styles["qty"])
+        self.blank_qty_cell = Paragraph("", styles["qty"])
 
-    qty_style = ParagraphStyle(
-        "QtyCell",
-        parent=styles["Normal"],
-        fontName="DejaVu",
-        fontSize=10,
-        leading=9,
-        alignment=1,   # center
-        textColor=colors.darkred,
-        spaceBefore=0,
-        spaceAfter=0,
-    )
+    def qty_cell(self, qty):
+        if not qty:
+            return fresh(self.empty_qty_cell)
+        return Paragraph(str(qty), self.styles["qty"])
 
-    # Map order data
-    qty_by_product_id = {
-        item.product_id: item.quantity for item in order.items.all()
-    }
 
-    # Map layout codes to products
-    products_by_code = {}
-    for p in Product.objects.filter(is_active=True):
-        if not p.code:
-            continue
-        raw = p.code.strip()
-        if len(raw) <= 4:
-            continue
-        suffix = raw[4:]  # Extract suffix after "MBKO"
-        products_by_code[suffix] = p
+def _build_picking_styles():
+    styles = getSampleStyleSheet()
 
-    elements = []
+    return {
+        # Header styles
+        "header_title": ParagraphStyle(
+            "HeaderTitle",
+            parent=styles["Title"],
+            fontName="DejaVu",
+            fontSize=18,
+            leading=20,
+            alignment=1,  # center
+            textColor=colors.HexColor("#4B2E83"),
+        ),
+        "header_subtitle": ParagraphStyle(
+            "HeaderSubtitle",
+            parent=styles["Normal"],
+            fontName="DejaVu",
+            fontSize=11,
+            leading=13,
+            alignment=1,
+            textColor=colors.HexColor("#4B2E83"),
+        ),
+        "header_info_value": ParagraphStyle(
+            "HeaderInfoValue",
+            parent=styles["Normal"],
+            fontName="DejaVu",
+            fontSize=9,
+            leading=11,
+            alignment=0,
+        ),
+        # Category title style
+        "table_title": ParagraphStyle(
+            "TableTitle",
+            parent=styles["Heading3"],
+            fontName="DejaVu",
+            fontSize=12,
+            leading=14,
+            alignment=1,
+            textColor=colors.HexColor("#4B2E83"),
+            spaceAfter=4,
+            spaceBefore=8,
+        ),
+        # Note styles
+        "note_title": ParagraphStyle(
+            "NoteTitle",
+            parent=styles["Heading2"],
+            fontName="DejaVu",
+            fontSize=16,
+            leading=18,
+            alignment=0,
+            textColor=colors.HexColor("#4B2E83"),
+            spaceBefore=0,
+            spaceAfter=10,
+        ),
+        "note_body": ParagraphStyle(
+            "NoteBody",
+            parent=styles["Normal"],
+            fontName="DejaVu",
+            fontSize=10,
+            leading=13,
+            alignment=0,
+        ),
+        # Cell styles
+        "code": ParagraphStyle(
+            "CodeCell",
+            parent=styles["Normal"],
+            fontName="DejaVu",
+            fontSize=10,
+            leading=10,
+            alignment=1,   # center
+            spaceBefore=0,
+            spaceAfter=0,
+        ),
+        "qty": ParagraphStyle(
+            "QtyCell",
+            parent=styles["Normal"],
+            fontName="DejaVu",
+            fontSize=10,
+            leading=9,
+            alignment=1,   # center
+            textColor=colors.darkred,
+            spaceBefore=0,
+            spaceAfter=0,
+        ),
+    }
 
-    # ========== BUILD PAGES ==========
-    for page_idx, page_rows in enumerate(PAGES):
-        # ---------- PAGE 1 HEADER ----------
-        if page_idx == 0:
-            elements.append(Paragraph("SİPARİŞ LİSTESİ", header_title_style))
-            elements.append(Paragraph("MASTER BEST SİPARİŞ LİSTESİ – GEL POLISH", header_subtitle_style))
-            elements.append(Spacer(1, 8))
 
-            # Customer info
-            lines = []
-            if order.customer_name:
-                lines.append(f"<b>İsim Soyisim:</b> {order.customer_name}")
-            if order.customer_phone:
-                lines.append(f"<b>Telefon:</b> {order.customer_phone}")
-            if order.customer_email:
-                lines.append(f"<b>E-posta:</b> {order.customer_email}")
-            
-            # Customer type
-            if hasattr(order, 'customer_type') and order.customer_type:
-                type_display = "Toptan" if order.customer_type == "wholesale" else "Perakende"
-                lines.append(f"<b>Müşteri Tipi:</b> {type_display}")
-            
-            lines.append(f"<b>Tarih:</b> {order.created_at.strftime('%d.%m.%Y')}")
-
-            info_html = "<br/>".join(lines)
-            elements.append(Paragraph(info_html, header_info_value_style))
-            elements.append(Spacer(1, 10))
+@lru_cache(maxsize=None)
+def _compile_picking_layout(version):
+    page_size = landscape(A4)
+    page_width, page_height = page_size
+    margin = 20
+    inner_width = page_width - 2 * margin
 
-        # ---------- CALCULATE AVAILABLE SPACE ----------
-        inner_width = page_width - 2 * margin
+    styles = _build_picking_styles()
+    pages = []
 
+    for page_idx, page_rows in enumerate(PAGES):
+        # ---------- CALCULATE AVAILABLE SPACE ----------
         # Reserve space for headers
         if page_idx == 0:
             header_reserved = 120
@@ -418,173 +469,216 @@ def build_full_picking_pdf(order: Order) -> bytes:
         base_inner_height = available_height * compression
 
         # ---------- COUNT TOTAL ROWS FOR THIS PAGE ----------
-        total_physical_rows_on_page = 0
+        # All tables in a row use the logical row count of the tallest one
+        logical_rows_per_row = [
+            max(ceil(len(t.codes) / t.num_cols) for t in table_row.tables)
+            for table_row in page_rows
+        ]
 
-        for table_row in page_rows:
-            # Find the table in this row with the most logical rows
-            max_logical_rows_in_row = 0
-            for table_layout in table_row.tables:
-                num_cells = len(table_layout.codes)
-                logical_rows = ceil(num_cells / table_layout.num_cols)
-                max_logical_rows_in_row = max(max_logical_rows_in_row, logical_rows)
-            
-            # Each logical row = 2 physical rows (code + qty)
-            physical_rows = 2 * max_logical_rows_in_row
-            total_physical_rows_on_page += physical_rows
-
-        # Calculate uniform row height
+        # Each logical row = 2 physical rows (code + qty)
+        total_physical_rows_on_page = sum(2 * rows for rows in logical_rows_per_row)
+
+        # Uniform row height
         row_height = base_inner_height / max(1, total_physical_rows_on_page)
 
+        # ---------- COMPILE TABLE ROWS ----------
+        compiled_rows = []
+        for table_row, logical_rows in zip(page_rows, logical_rows_per_row):
+            total_cols = sum(t.num_cols for t in table_row.tables)
+            num_gaps = len(table_row.tables) - 1
+            available_table_width = inner_width - TABLE_SPACING * num_gaps
+
+            compiled_rows.append(CompiledTableRow([
+                CompiledTable(
+                    table_layout,
+                    logical_rows,
+                    # Proportional to its columns, from available width
+                    available_table_width * (table_layout.num_cols / total_cols),
+                    row_height,
+                    styles,
+                )
+                for table_layout in table_row.tables
+            ]))
+
+        pages.append(compiled_rows)
+
+    return CompiledPickingLayout(version, pages, styles, page_size, margin)
+
+
+def get_picking_layout() -> CompiledPickingLayout:
+    """Return the compiled picking layout for the current layout version."""
+    return _compile_picking_layout(PICKING_LAYOUT_VERSION)
+
+
+# ============================
+#  PDF BUILDER
+# ============================
+
+def get_picking_quantities(order: Order) -> dict:
+    """
+    Return {layout code: ordered quantity} for the codes in this order.
+
+    Codes come from the cached product code index, so this costs one query
+    for the order's items (none if they are already prefetched).
+    """
+    codes_by_product_id = get_product_code_index().codes_by_product_id
+
+    qty_by_code = {}
+    for item in order.items.all():
+        for code in codes_by_product_id.get(item.product_id, ()):
+            qty_by_code[code] = item.quantity
+
+    return qty_by_code
+
+
+def build_picking_customer_info(order: Order, layout: CompiledPickingLayout) -> Paragraph:
+    """Customer info block shown under the page 1 header."""
+    lines = []
+    if order.customer_name:
+        lines.append(f"<b>İsim Soyisim:</b> {order.customer_name}")
+    if order.customer_phone:
+        lines.append(f"<b>Telefon:</b> {order.customer_phone}")
+    if order.customer_email:
+        lines.append(f"<b>E-posta:</b> {order.customer_email}")
+
+    # Customer type
+    if hasattr(order, 'customer_type') and order.customer_type:
+        type_display = "Toptan" if order.customer_type == "wholesale" else "Perakende"
+        lines.append(f"<b>Müşteri Tipi:</b> {type_display}")
+
+    lines.append(f"<b>Tarih:</b> {order.created_at.strftime('%d.%m.%Y')}")
+
+    info_html = "<br/>".join(lines)
+    return Paragraph(info_html, layout.styles["header_info_value"])
+
+
+def build_full_picking_pdf(order: Order, qty_by_code=None) -> bytes:
+    """
+    Build the picking PDF with the engine selected by
+    settings.PICKING_PDF_ENGINE ("platypus" or "canvas").
+
+    qty_by_code can be passed when the quantities are already known (e.g.
+    an order snapshot rendered in a worker process without DB access).
+    """
+    if getattr(settings, "PICKING_PDF_ENGINE", "platypus") == "canvas":
+        return build_picking_pdf_canvas(order, qty_by_code)
+    return build_picking_pdf_platypus(order, qty_by_code)
+
+
+def build_picking_pdf_platypus(order: Order, qty_by_code=None) -> bytes:
+    """
+    Build a multi-page picking PDF with support for side-by-side tables.
+    
+    Layout:
+    • Page 1: Header + customer info + large Gel Polish grid
+    • Pages 2-3: Category tables (single or side-by-side)
+    
+    Each product cell has TWO rows:
+      - Top row: Product code (001, CE25, etc.)
+      - Bottom row: Quantity ordered (blank if none)
+
+    The grid itself comes from the compiled layout; only the customer
+    header, the quantity cells and the note are built here.
+    """
+    layout = get_picking_layout()
+    styles = layout.styles
+
+    buffer = BytesIO()
+
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=layout.page_size,
+        leftMargin=layout.margin,
+        rightMargin=layout.margin,
+        topMargin=layout.margin,
+        bottomMargin=layout.margin,
+    )
+
+    if qty_by_code is None:
+        qty_by_code = get_picking_quantities(order)
+
+    elements = []
+
+    # ========== BUILD PAGES ==========
+    for page_idx, page_rows in enumerate(layout.pages):
+        # ---------- PAGE 1 HEADER ----------
+        if page_idx == 0:
+            elements.append(fresh(layout.header_title))
+            elements.append(fresh(layout.header_subtitle))
+            elements.append(Spacer(1, 8))
+
+            elements.append(build_picking_customer_info(order, layout))
+            elements.append(Spacer(1, 10))
+
         # ---------- BUILD TABLE ROWS ----------
         for table_row in page_rows:
-            # Calculate how many logical rows this row needs
-            # (all tables in the row use the same number of logical rows)
-            max_logical_rows = 0
-            for table_layout in table_row.tables:
-                num_cells = len(table_layout.codes)
-                logical_rows = ceil(num_cells / table_layout.num_cols)
-                max_logical_rows = max(max_logical_rows, logical_rows)
+            tables = []
 
-            physical_rows = 2 * max_logical_rows
+            for compiled in table_row.tables:
+                # Quantity cells, padded to fill the grid
+                qty_cells = []
+                for code in compiled.codes:
+                    qty_cells.append(layout.qty_cell(qty_by_code.get(code, 0)))
 
-            # Calculate total columns across all tables in this row
-            total_cols = sum(t.num_cols for t in table_row.tables)
-            
-            # Define spacing between tables
-            SPACING_PX = 30  # Total gap between tables
-            num_gaps = len(table_row.tables) - 1  # Number of gaps between tables
-            total_spacing = SPACING_PX * num_gaps
-            
-            # Available width for tables (minus spacing)
-            available_table_width = inner_width - total_spacing
-
-            # Build each table in this row
-            table_elements = []
-            col_widths_list = []
-
-            for table_layout in table_row.tables:
-                codes = table_layout.codes
-                num_cols = table_layout.num_cols
-
-                # Calculate this table's width (proportional to its columns, from available width)
-                table_width = available_table_width * (num_cols / total_cols)
-                col_width = table_width / num_cols
-
-                # Build code and quantity lists
-                codes_flat = []
-                qtys_flat = []
-
-                for code in codes:
-                    product = products_by_code.get(code)
-                    if product:
-                        qty = qty_by_product_id.get(product.id, 0)
-                    else:
-                        qty = 0
-
-                    qty_text = "-" if qty == 0 else str(qty)
-                    codes_flat.append(Paragraph(code, code_style))
-                    qtys_flat.append(Paragraph(qty_text, qty_style))
-
-                # Pad to fill grid
-                total_slots = max_logical_rows * num_cols
-                while len(codes_flat) < total_slots:
-                    codes_flat.append(Paragraph("", code_style))
-                    qtys_flat.append(Paragraph("", qty_style))
+                padding = compiled.logical_rows * compiled.num_cols - len(qty_cells)
+                qty_cells += [fresh(layout.blank_qty_cell) for _ in range(padding)]
 
                 # Build table data (alternating code/qty rows)
                 data = []
-                idx = 0
-                for _ in range(max_logical_rows):
-                    code_row = []
-                    qty_row = []
-                    for _ in range(num_cols):
-                        code_row.append(codes_flat[idx])
-                        qty_row.append(qtys_flat[idx])
-                        idx += 1
-                    data.append(code_row)
-                    data.append(qty_row)
-
-                # Create table
+                for row_idx, code_row in enumerate(compiled.code_rows):
+                    start = row_idx * compiled.num_cols
+                    data.append([fresh(cell) for cell in code_row])
+                    data.append(qty_cells[start:start + compiled.num_cols])
+
                 table = Table(
                     data,
-                    colWidths=[col_width] * num_cols,
-                    rowHeights=[row_height] * physical_rows,
+                    colWidths=compiled.col_widths,
+                    rowHeights=compiled.row_heights,
                 )
-                table.setStyle(TableStyle([
-                    ("GRID", (0, 0), (-1, -1), 0.3, colors.lightgrey),
-                    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-                    ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-                ]))
-
-                # Add label and table
-                if table_layout.label:
-                    table_elements.append(Paragraph(table_layout.label, table_title_style))
-                
-                table_elements.append(table)
-                col_widths_list.append(table_width)
+                table.setStyle(compiled.style)
+                tables.append(table)
 
             # If multiple tables in this row, arrange them side-by-side
-            if len(table_row.tables) > 1:
-                # Create a container table with labels above each table AND spacers between
-                container_data = []
-                
-                # Build column widths: alternating table widths and spacer widths
-                final_col_widths = []
-                for i, width in enumerate(col_widths_list):
-                    final_col_widths.append(width)
-                    # Add spacer width after each table except the last one
-                    if i < len(col_widths_list) - 1:
-                        final_col_widths.append(SPACING_PX)
-                
-                # Row 1: Labels with spacers
+            if table_row.container_col_widths:
+                # Container table with labels above each table AND spacers between
                 label_row = []
-                for i, table_layout in enumerate(table_row.tables):
-                    if table_layout.label:
-                        label_row.append(Paragraph(table_layout.label, table_title_style))
-                    else:
-                        label_row.append("")
-                    # Add spacer after each label except the last one
-                    if i < len(table_row.tables) - 1:
-                        label_row.append("")  # Empty spacer cell
-                container_data.append(label_row)
-                
-                # Row 2: Tables with spacers
                 table_row_data = []
-                for i, table_layout in enumerate(table_row.tables):
-                    # Get the actual table (skip the label paragraph)
-                    table_elem = table_elements[i * 2 + 1] if table_layout.label else table_elements[i]
-                    table_row_data.append(table_elem)
+                for i, (compiled, table) in enumerate(zip(table_row.tables, tables)):
+                    label_row.append(fresh(compiled.label) if compiled.label else "")
+                    table_row_data.append(table)
                     # Add spacer after each table except the last one
-                    if i < len(table_row.tables) - 1:
-                        table_row_data.append("")  # Empty spacer cell
-                container_data.append(table_row_data)
-
-                container_table = Table(container_data, colWidths=final_col_widths)
-                container_table.setStyle(TableStyle([
-                    ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                ]))
-                
+                    if i < len(tables) - 1:
+                        label_row.append("")
+                        table_row_data.append("")
+
+                container_table = Table(
+                    [label_row, table_row_data],
+                    colWidths=table_row.container_col_widths,
+                )
+                container_table.setStyle(table_row.container_style)
                 elements.append(container_table)
-                elements.append(Spacer(1, 10))
             else:
                 # Single table - add normally
-                for elem in table_elements:
-                    elements.append(elem)
-                elements.append(Spacer(1, 10))
+                compiled = table_row.tables[0]
+                if compiled.label:
+                    elements.append(fresh(compiled.label))
+                elements.append(tables[0])
+
+            elements.append(Spacer(1, 10))
 
         # Page break between pages (except last)
-        if page_idx != len(PAGES) - 1:
+        if page_idx != len(layout.pages) - 1:
             elements.append(PageBreak())
 
     # Add customer note if present
     if order.customer_note:
         elements.append(PageBreak())
-        elements.append(Paragraph("MÜŞTERİ NOTU", note_title_style))
+        elements.append(fresh(layout.note_title))
         elements.append(Spacer(1, 12))
         note_text = order.customer_note.replace("\n", "<br/>")
-        elements.append(Paragraph(note_text, note_body_style))
+        elements.append(Paragraph(note_text, styles["note_body"]))
 
-    doc.build(elements)
+    doc.build(elements, canvasmaker=FontSafeCanvas)
 
     pdf_bytes = buffer.getvalue()
     buffer.close()
@@ -592,89 +686,331 @@ def build_full_picking_pdf(order: Order) -> bytes:
 
 
 # ============================
-#  TELEGRAM FUNCTIONS
+#  CANVAS PICKING RENDERER
 # ============================
+#
+# Alternative engine for build_full_picking_pdf (PICKING_PDF_ENGINE =
+# "canvas"). The compiled layout is laid out once with platypus as a probe,
+# recording where every table, label and code cell lands. Each order then
+# draws the static part of a page as a form XObject straight from those
+# positions and stamps the customer header, quantities and note with
+# direct canvas calls.
+
+
+class _ProbedTable(Table):
+    """Table that remembers where it was drawn (page, absolute origin)."""
+    def draw(self):
+        self.probed_at = (self.canv.getPageNumber(),) + self.canv.absolutePosition(0, 0)
+        super().draw()
+
+
+class _ProbedParagraph(Paragraph):
+    """Paragraph that remembers where it was drawn (page, absolute origin)."""
+    def draw(self):
+        self.probed_at = (self.canv.getPageNumber(),) + self.canv.absolutePosition(0, 0)
+        super().draw()
+
+
+class PickingPageBackground:
+    """Static content and quantity slots of one picking page."""
+    def __init__(self, index):
+        self.index = index
+        self.form_name = f"picking_page_{index}"
+        self.grids = []         # (xlist, ylist) per table
+        self.labels = []        # (paragraph, x, y), already wrapped
+        self.code_text = []     # (x, baseline, code) for single-line codes
+        self.code_paras = []    # (paragraph, x, y) for codes that wrap
+        self.qty_slots = []     # (code, center x, baseline)
+
+    def draw_form(self, canv):
+        canv.beginForm(self.form_name)
+
+        canv.setLineWidth(0.3)
+        canv.setStrokeColor(colors.lightgrey)
+        canv.setLineCap(1)
+        for xlist, ylist in self.grids:
+            canv.grid(xlist, ylist)
+
+        for para, x, y in self.labels + self.code_paras:
+            # Already wrapped; the copy keeps the wrap, not the canvas
+            fresh(para).drawOn(canv, x, y)
+
+        tx = canv.beginText()
+        tx.setFont("DejaVu", 10)
+        tx.setFillColor(colors.black)
+        for x, y, code in self.code_text:
+            tx.setTextOrigin(x, y)
+            tx.textOut(code)
+        canv.drawText(tx)
+
+        canv.endForm()
+
+
+class PickingBackground:
+    """Per-page backgrounds plus what is needed to place the order header."""
+    def __init__(self, layout, pages, probe_info_height):
+        self.layout = layout
+        self.pages = pages
+        # Page 1 content sits below the customer info block; a taller or
+        # shorter block shifts it by the height difference.
+        self.probe_info_height = probe_info_height
+
+
+def _picking_frame(layout):
+    """The same frame SimpleDocTemplate uses for the picking PDF."""
+    page_width, page_height = layout.page_size
+    return Frame(
+        layout.margin,
+        layout.margin,
+        page_width - 2 * layout.margin,
+        page_height - 2 * layout.margin,
+    )
 
-import requests
 
-TELEGRAM_BOT_TOKEN = getattr(settings, "TELEGRAM_BOT_TOKEN", "")
-TELEGRAM_CHAT_ID = getattr(settings, "TELEGRAM_CHAT_ID", "")
+def _probe_picking_story(layout, info):
+    """Blank-order story mirroring build_picking_pdf_platypus, with probes."""
+    styles = layout.styles
+    elements = []
+    probes = []     # (compiled table, probed table)
+    labels = []
 
-def send_order_receipt_pdf_to_telegram(order: Order, pdf_content: bytes):
-    """Send customer receipt PDF to Telegram."""
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendDocument"
+    def probed_label(compiled):
+        if not compiled.label:
+            return ""
+        label = _ProbedParagraph(compiled.label.text, styles["table_title"])
+        labels.append(label)
+        return label
 
-    files = {
-        "document": (
-            f"order_{order.id}_receipt.pdf",
-            pdf_content,
-            "application/pdf",
-        )
-    }
+    for page_idx, page_rows in enumerate(layout.pages):
+        if page_idx == 0:
+            elements.append(fresh(layout.header_title))
+            elements.append(fresh(layout.header_subtitle))
+            elements.append(Spacer(1, 8))
+            elements.append(info)
+            elements.append(Spacer(1, 10))
 
-    # Build caption with customer type
-    type_emoji = "🏪" if hasattr(order, 'customer_type') and order.customer_type == "wholesale" else "🛍️"
-    type_text = "Toptan" if hasattr(order, 'customer_type') and order.customer_type == "wholesale" else "Perakende"
-    
-    caption = f"📄 Müşteri Fişi - Sipariş #{order.id}\n"
-    caption += f"{type_emoji} Müşteri Tipi: {type_text}\n"
-    caption += f"👤 {order.customer_name}\n"
-    caption += f"📞 {order.customer_phone}"
-
-    data = {
-        "chat_id": TELEGRAM_CHAT_ID,
-        "caption": caption,
-    }
+        for table_row in page_rows:
+            tables = []
+            for compiled in table_row.tables:
+                data = []
+                for code_row in compiled.code_rows:
+                    data.append([fresh(cell) for cell in code_row])
+                    data.append([fresh(layout.blank_qty_cell) for _ in range(compiled.num_cols)])
+                table = _ProbedTable(
+                    data,
+                    colWidths=compiled.col_widths,
+                    rowHeights=compiled.row_heights,
+                )
+                table.setStyle(compiled.style)
+                tables.append(table)
+                probes.append((compiled, table))
 
-    try:
-        response = requests.post(url, data=data, files=files)
-        response.raise_for_status()
-    except Exception as e:
-        print(f"Failed to send receipt to Telegram: {e}")
-
-def send_order_picking_pdf_to_telegram(order: Order, pdf_content):
-    """Send picking PDF to Telegram."""
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendDocument"
-
-    files = {
-        "document": (
-            f"order_{order.id}_picking.pdf",
-            pdf_content,
-            "application/pdf",
-        )
-    }
+            if table_row.container_col_widths:
+                label_row = []
+                table_row_data = []
+                for i, (compiled, table) in enumerate(zip(table_row.tables, tables)):
+                    label_row.append(probed_label(compiled))
+                    table_row_data.append(table)
+                    if i < len(tables) - 1:
+                        label_row.append("")
+                        table_row_data.append("")
+                container_table = Table(
+                    [label_row, table_row_data],
+                    colWidths=table_row.container_col_widths,
+                )
+                container_table.setStyle(table_row.container_style)
+                elements.append(container_table)
+            else:
+                label = probed_label(table_row.tables[0])
+                if label:
+                    elements.append(label)
+                elements.append(tables[0])
 
-    # Build caption with customer type
-    type_emoji = "🏪" if hasattr(order, 'customer_type') and order.customer_type == "wholesale" else "🛍️"
-    type_text = "Toptan" if hasattr(order, 'customer_type') and order.customer_type == "wholesale" else "Perakende"
-    
-    caption = f"📦 Picking List - Sipariş #{order.id}\n"
-    caption += f"{type_emoji} Müşteri Tipi: {type_text}\n"
-    caption += f"👤 {order.customer_name}"
+            elements.append(Spacer(1, 10))
 
-    data = {
-        "chat_id": TELEGRAM_CHAT_ID,
-        "caption": caption,
-    }
+        if page_idx != len(layout.pages) - 1:
+            elements.append(PageBreak())
 
-    response = requests.post(url, data=data, files=files)
-    response.raise_for_status()
+    return elements, probes, labels
 
 
-# ============================
-#  RECEIPT PDF BUILDER
-# ============================
+@lru_cache(maxsize=None)
+def _compile_picking_background(version):
+    layout = _compile_picking_layout(version)
+    code_style = layout.styles["code"]
+    qty_style = layout.styles["qty"]
+
+    # Lay out a blank order once and record where everything landed
+    info = Paragraph("<b>Tarih:</b> 01.01.2000", layout.styles["header_info_value"])
+    elements, probes, labels = _probe_picking_story(layout, info)
+
+    doc = SimpleDocTemplate(
+        BytesIO(),
+        pagesize=layout.page_size,
+        leftMargin=layout.margin,
+        rightMargin=layout.margin,
+        topMargin=layout.margin,
+        bottomMargin=layout.margin,
+    )
+    doc.build(elements, canvasmaker=FontSafeCanvas)
+
+    pages = [PickingPageBackground(i) for i in range(len(layout.pages))]
+
+    for label in labels:
+        page_no, x, y = label.probed_at
+        pages[page_no - 1].labels.append((label, x, y))
+
+    for compiled, table in probes:
+        page_no, x0, y0 = table.probed_at
+        page = pages[page_no - 1]
 
-def build_order_receipt_pdf(order: Order) -> bytes:
+        xlist = [x0 + x for x in table._colpositions]
+        ylist = [y0 + y for y in table._rowpositions]
+        page.grids.append((xlist, ylist))
+
+        for row_idx, code_row in enumerate(compiled.code_rows):
+            code_bottom, qty_bottom = ylist[2 * row_idx + 1], ylist[2 * row_idx + 2]
+            code_height = ylist[2 * row_idx] - code_bottom
+            qty_height = code_bottom - qty_bottom
+
+            for col_idx, code in enumerate(compiled.codes[row_idx * compiled.num_cols:(row_idx + 1) * compiled.num_cols]):
+                left, right = xlist[col_idx], xlist[col_idx + 1]
+                center = (left + right) / 2
+
+                # Same placement as a VALIGN MIDDLE paragraph cell
+                para = Paragraph(code, code_style)
+                w, h = para.wrap(right - left - 12, code_height - 6)
+                bottom = code_bottom + (code_height - h) / 2
+                if len(para.blPara.lines) == 1:
+                    x = center - pdfmetrics.stringWidth(code, "DejaVu", code_style.fontSize) / 2
+                    page.code_text.append((x, bottom + h - code_style.fontSize, code))
+                else:
+                    page.code_paras.append((para, left + (right - left - w) / 2, bottom))
+
+                baseline = qty_bottom + (qty_height - qty_style.leading) / 2 \
+                    + qty_style.leading - qty_style.fontSize
+                page.qty_slots.append((code, center, baseline))
+
+    return PickingBackground(layout, pages, info.height)
+
+
+def get_picking_background() -> PickingBackground:
+    """Return the probed canvas background for the current layout version."""
+    return _compile_picking_background(PICKING_LAYOUT_VERSION)
+
+
+def _draw_flowables(canv, layout, elements):
+    """Flow elements through picking frames, starting new pages as needed."""
+    frame = _picking_frame(layout)
+    while elements:
+        if frame.add(elements[0], canv):
+            elements.pop(0)
+            continue
+        parts = frame.split(elements[0], canv)
+        if parts:
+            elements[0:1] = parts
+            if frame.add(elements[0], canv):
+                elements.pop(0)
+                continue
+        if frame._atTop:
+            # Does not fit on an empty page either; drop it like a clipped cell
+            elements.pop(0)
+            continue
+        canv.showPage()
+        frame = _picking_frame(layout)
+
+
+def build_picking_pdf_canvas(order: Order, qty_by_code=None) -> bytes:
     """
-    Build a Turkish PDF receipt for the given order.
-    
-    Columns: #, Ürün, Adet, Birim Fiyatı, Satır Toplamı
-    Includes: Master Best header, customer info, totals with discount
+    Build the picking PDF with direct canvas calls.
+
+    Looks the same as build_picking_pdf_platypus: the static grid, labels
+    and codes of each page come from the probed background as a form
+    XObject; only the header, quantities and note are drawn per order.
     """
+    background = get_picking_background()
+    layout = background.layout
+    qty_style = layout.styles["qty"]
+
+    if qty_by_code is None:
+        qty_by_code = get_picking_quantities(order)
+
     buffer = BytesIO()
+    canv = FontSafeCanvas(buffer, pagesize=layout.page_size)
+
+    for page in background.pages:
+        page.draw_form(canv)
+
+    for page in background.pages:
+        offset = 0
+        if page.index == 0:
+            info = build_picking_customer_info(order, layout)
+            _draw_flowables(canv, layout, [
+                fresh(layout.header_title),
+                fresh(layout.header_subtitle),
+                Spacer(1, 8),
+                info,
+            ])
+            offset = background.probe_info_height - info.height
+
+        canv.saveState()
+        canv.translate(0, offset)
+        canv.doForm(page.form_name)
+        canv.restoreState()
+
+        tx = canv.beginText()
+        tx.setFont("DejaVu", qty_style.fontSize)
+        tx.setFillColor(qty_style.textColor)
+        for code, center, baseline in page.qty_slots:
+            qty = qty_by_code.get(code, 0)
+            text = str(qty) if qty else "-"
+            width = pdfmetrics.stringWidth(text, "DejaVu", qty_style.fontSize)
+            tx.setTextOrigin(center - width / 2, baseline + offset)
+            tx.textOut(text)
+        canv.drawText(tx)
+
+        canv.showPage()
 
-    doc = SimpleDocTemplate(
+    # Add customer note if present
+    if order.customer_note:
+        note_text = order.customer_note.replace("\n", "<br/>")
+        _draw_flowables(canv, layout, [
+            fresh(layout.note_title),
+            Spacer(1, 12),
+            Paragraph(note_text, layout.styles["note_body"]),
+        ])
+        canv.showPage()
+
+    canv.save()
+
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+    return pdf_bytes
+
+
+# ============================
+#  RECEIPT PDF BUILDER
+# ============================
+
+# Bump whenever the receipt layout changes (cached receipts are keyed by it)
+RECEIPT_TEMPLATE_VERSION = 1
+
+
+def get_receipt_lines(order: Order) -> list:
+    """Receipt rows in pick order: product name, quantity, unit price, line total."""
+    return [
+        {
+            "name": line["name"],
+            "quantity": line["quantity"],
+            "unit_price": line["unit_price"],
+            "line_total": line["line_total"],
+        }
+        for line in get_order_lines(order)
+    ]
+
+
+def _receipt_doc(buffer):
+    return SimpleDocTemplate(
         buffer,
         pagesize=A4,
         leftMargin=40,
@@ -683,6 +1019,47 @@ def build_order_receipt_pdf(order: Order) -> bytes:
         bottomMargin=40,
     )
 
+
+def build_order_receipt_pdf(order: Order, lines=None) -> bytes:
+    """
+    Build a Turkish PDF receipt for the given order.
+    
+    Columns: #, Ürün, Adet, Birim Fiyatı, Satır Toplamı
+    Includes: Master Best header, customer info, totals with discount
+
+    lines defaults to get_receipt_lines(order).
+    """
+    if lines is None:
+        lines = get_receipt_lines(order)
+
+    buffer = BytesIO()
+    doc = _receipt_doc(buffer)
+    doc.build(build_receipt_elements(order, lines), canvasmaker=FontSafeCanvas)
+
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+    return pdf_bytes
+
+
+def merge_pdfs(pdfs) -> bytes:
+    """
+    Concatenate PDFs into one (e.g. the cached receipts of a print batch).
+    Fonts and images that repeat across the parts are stored once.
+    """
+    writer = PdfWriter()
+    for pdf_bytes in pdfs:
+        writer.append(PdfReader(BytesIO(pdf_bytes)))
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+
+    buffer = BytesIO()
+    writer.write(buffer)
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+    return pdf_bytes
+
+
+def build_receipt_elements(order: Order, lines) -> list:
+    """Flowables of one order's receipt."""
     styles = getSampleStyleSheet()
     base_font = "DejaVu" if "DejaVu" in pdfmetrics.getRegisteredFontNames() else "Helvetica"
 
@@ -805,26 +1182,17 @@ def build_order_receipt_pdf(order: Order) -> bytes:
     ]]
 
     ara_toplam = Decimal("0.00")
-    ordered_items = (
-        order.items
-        .select_related("product")
-        .order_by("product__pick_order", "product__display_order", "product__name")
-    )
     
-    for idx, item in enumerate(ordered_items, start=1):
-        product = item.product
-        qty = item.quantity
-        unit_price = product.final_price or product.price or Decimal("0.00")
-        line_total = (unit_price or Decimal("0.00")) * qty
-        ara_toplam += line_total
+    for idx, line in enumerate(lines, start=1):
+        ara_toplam += line["line_total"]
 
-        unit_price_str = f"{unit_price:.2f} ₺"
-        line_total_str = f"{line_total:.2f} ₺"
+        unit_price_str = f"{line['unit_price']:.2f} ₺"
+        line_total_str = f"{line['line_total']:.2f} ₺"
 
         data.append([
             Paragraph(str(idx), table_cell_style),
-            Paragraph(product.name, table_cell_style),
-            Paragraph(str(qty), table_cell_right_style),
+            Paragraph(line["name"], table_cell_style),
+            Paragraph(str(line["quantity"]), table_cell_right_style),
             Paragraph(unit_price_str, table_cell_right_style),
             Paragraph(line_total_str, table_cell_right_style),
         ])
@@ -886,8 +1254,139 @@ def build_order_receipt_pdf(order: Order) -> bytes:
     )
     elements.append(Paragraph(footer_text, footer_style))
 
-    doc.build(elements)
+    return elements
+
+# ============================
+#  WAVE PICKING PDF BUILDER
+# ============================
+
+def build_wave_pdf(wave) -> bytes:
+    """
+    Build the wave sheet for a batch of orders (see core.waves).
+
+    Page(s): tote legend (tote -> order), then one route table in pick
+    order with the total to pick and its split over the totes.
+    """
+    buffer = BytesIO()
+
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        leftMargin=30,
+        rightMargin=30,
+        topMargin=30,
+        bottomMargin=30,
+    )
+
+    styles = getSampleStyleSheet()
+
+    title_style = ParagraphStyle(
+        "WaveTitle",
+        parent=styles["Title"],
+        fontName="DejaVu",
+        fontSize=16,
+        leading=18,
+        alignment=1,
+        textColor=colors.HexColor("#4B2E83"),
+    )
+
+    info_style = ParagraphStyle(
+        "WaveInfo",
+        parent=styles["Normal"],
+        fontName="DejaVu",
+        fontSize=9,
+        leading=11,
+        alignment=0,
+    )
+
+    cell_style = ParagraphStyle(
+        "WaveCell",
+        parent=styles["Normal"],
+        fontName="DejaVu",
+        fontSize=9,
+        leading=11,
+        alignment=0,
+    )
+
+    qty_style = ParagraphStyle(
+        "WaveQty",
+        parent=cell_style,
+        alignment=2,
+        textColor=colors.darkred,
+    )
+
+    elements = []
+
+    elements.append(Paragraph("TOPLU TOPLAMA LİSTESİ", title_style))
+    elements.append(Spacer(1, 6))
+
+    created = [order.created_at for order in wave.orders]
+    info_lines = [
+        f"<b>Sipariş sayısı:</b> {len(wave.orders)}",
+        f"<b>Ürün çeşidi:</b> {len(wave.lines)}",
+        f"<b>Toplam adet:</b> {wave.total_quantity}",
+    ]
+    if created:
+        info_lines.append(
+            f"<b>Siparişler:</b> {min(created).strftime('%d.%m.%Y %H:%M')} – "
+            f"{max(created).strftime('%d.%m.%Y %H:%M')}"
+        )
+    elements.append(Paragraph("<br/>".join(info_lines), info_style))
+    elements.append(Spacer(1, 10))
+
+    # Tote legend
+    legend = [[
+        Paragraph("<b>Kasa</b>", cell_style),
+        Paragraph("<b>Sipariş</b>", cell_style),
+        Paragraph("<b>Müşteri</b>", cell_style),
+    ]]
+    for tote, order in enumerate(wave.orders, start=1):
+        type_display = "Toptan" if order.customer_type == "wholesale" else "Perakende"
+        legend.append([
+            Paragraph(f"T{tote}", cell_style),
+            Paragraph(f"#{order.id}", cell_style),
+            Paragraph(f"{order.customer_name} ({type_display})", cell_style),
+        ])
+
+    legend_table = Table(legend, colWidths=[40, 60, 300], hAlign="LEFT", repeatRows=1)
+    legend_table.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    ]))
+    elements.append(legend_table)
+    elements.append(Spacer(1, 14))
+
+    # Route
+    route = [[
+        Paragraph("<b>#</b>", cell_style),
+        Paragraph("<b>Raf</b>", cell_style),
+        Paragraph("<b>Ürün</b>", cell_style),
+        Paragraph("<b>Kod</b>", cell_style),
+        Paragraph("<b>Adet</b>", cell_style),
+        Paragraph("<b>Kasalar</b>", cell_style),
+    ]]
+    for idx, line in enumerate(wave.lines, start=1):
+        route.append([
+            Paragraph(str(idx), cell_style),
+            Paragraph(str(line.pick_order), cell_style),
+            Paragraph(line.name, cell_style),
+            Paragraph(line.code, cell_style),
+            Paragraph(str(line.total_quantity), qty_style),
+            Paragraph(line.tote_breakdown, cell_style),
+        ])
+
+    route_table = Table(route, colWidths=[25, 35, 185, 70, 45, 175], hAlign="LEFT", repeatRows=1)
+    route_table.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.whitesmoke]),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    ]))
+    elements.append(route_table)
+
+    doc.build(elements, canvasmaker=FontSafeCanvas)
 
     pdf_bytes = buffer.getvalue()
     buffer.close()
-    return pdf_bytes
\ No newline at end of file
+    return pdf_bytes
@@ -0,0 +1,70 @@
+# ============================
+#  PDF WORKER PROCESS SIDE
+# ============================
+#
+# Code that runs inside the PDF render pool (see pdf_service.py). Pool
+# workers are spawned fresh, so this module must be importable before
+# Django is set up: Django and the PDF builders are imported lazily.
+
+import os
+import time
+
+
+class OrderSnapshot:
+    """Picklable copy of everything the PDF builders read from an order."""
+
+    FIELDS = (
+        "id",
+        "created_at",
+        "customer_name",
+        "customer_phone",
+        "customer_email",
+        "customer_note",
+        "customer_type",
+        "subtotal",
+        "discount_percentage",
+        "discount_amount",
+        "final_total",
+    )
+
+    def __init__(self, order, kind):
+        from .pdf_utils import get_picking_quantities, get_receipt_lines
+
+        for field in self.FIELDS:
+            setattr(self, field, getattr(order, field))
+
+        self.kind = kind
+        self.qty_by_code = get_picking_quantities(order) if kind == "picking" else None
+        self.receipt_lines = get_receipt_lines(order) if kind == "receipt" else None
+
+
+def render_snapshot(snapshot: OrderSnapshot) -> bytes:
+    from .pdf_utils import build_full_picking_pdf, build_order_receipt_pdf
+
+    if snapshot.kind == "picking":
+        return build_full_picking_pdf(snapshot, snapshot.qty_by_code)
+    if snapshot.kind == "receipt":
+        return build_order_receipt_pdf(snapshot, snapshot.receipt_lines)
+    raise ValueError(f"Unknown PDF kind: {snapshot.kind}")
+
+
+def init_worker(settings_module):
+    """Set up Django and pre-warm fonts and the compiled picking layout."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+
+    import django
+    django.setup()
+
+    from django.conf import settings
+
+    # Importing pdf_utils registers the DejaVu font
+    from . import pdf_utils
+    pdf_utils.get_picking_layout()
+    if getattr(settings, "PICKING_PDF_ENGINE", "platypus") == "canvas":
+        pdf_utils.get_picking_background()
+
+
+def render_in_worker(snapshot):
+    started = time.perf_counter()
+    pdf_bytes = render_snapshot(snapshot)
+    return pdf_bytes, (time.perf_counter() - started) * 1000
@@ -0,0 +1,206 @@
+# ============================
+#  ORDER PRICING
+# ============================
+#
+# One place that prices a cart: line items with unit price and line total,
+# the subtotal and the applicable discount. Unit prices come from the
+# stored Product.final_price column in a single query whatever the cart
+# size. Used by order_success and order_confirm on the DraftCart.
+#
+# On confirm the priced lines become the order's OrderItems
+# (build_order_items); receipts, CSVs and reports then read only those
+# (get_order_lines, generate_order_csv) and never join the catalog again.
+
+import csv
+import io
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, Value
+from django.db.models.functions import Coalesce
+
+from .discount_tiers import get_tier_table
+from .models import OrderItem, Product
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+CENT = Decimal("0.01")
+
+
+class OrderPricing:
+    def __init__(self, lines, subtotal, customer_type):
+        self.lines = lines          # [{product, name, code, pick_order, quantity, unit_price, line_total}]
+        self.subtotal = subtotal
+        self.customer_type = customer_type
+        self._discount_info = None
+
+    @property
+    def discount_info(self):
+        if self._discount_info is None:
+            self._discount_info = calculate_discount(self.subtotal, self.customer_type)
+        return self._discount_info
+
+
+def get_cart_pricing(quantities, customer_type) -> OrderPricing:
+    """
+    Price a cart ({product_id: quantity}) from the database in one query.
+    Lines are in pick order; unknown product ids are dropped.
+    """
+    products = (
+        Product.objects
+        .filter(id__in=quantities)
+        .annotate(
+            current_unit_price=Coalesce(
+                F("final_price"),
+                F("price"),
+                Value(Decimal("0.00")),
+                output_field=MONEY,
+            ),
+        )
+        .order_by("pick_order", "display_order", "name")
+    )
+
+    lines = []
+    subtotal = Decimal("0.00")
+    for product in products:
+        quantity = quantities[product.id]
+        # SQLite returns computed decimals unscaled; quantize to the model's 2 places
+        unit_price = product.current_unit_price.quantize(CENT)
+        line_total = unit_price * quantity
+        subtotal += line_total
+        lines.append({
+            "product": product,
+            "name": product.name,
+            "code": product.code or "",
+            "pick_order": product.pick_order,
+            "quantity": quantity,
+            "unit_price": unit_price,
+            "line_total": line_total,
+        })
+
+    return OrderPricing(lines, subtotal, customer_type)
+
+
+def build_order_items(order, pricing: OrderPricing) -> list:
+    """Unsaved OrderItems for the priced lines, product snapshot included."""
+    items = []
+    for line in pricing.lines:
+        item = OrderItem(order=order, product=line["product"], quantity=line["quantity"])
+        item.capture_product(line["product"])
+        item.unit_price = line["unit_price"]
+        item.line_total = line["line_total"]
+        items.append(item)
+    return items
+
+
+def prefetched_items(order):
+    """The order's items if they were prefetched (e.g. for a print batch), else None."""
+    return getattr(order, "_prefetched_objects_cache", {}).get("items")
+
+
+def get_order_lines(order) -> list:
+    """
+    An order's lines in pick order, from its own rows only (no catalog join):
+    dicts with product_id, name, code, pick_order, quantity, unit_price, line_total.
+    """
+    items = prefetched_items(order)
+    if items is not None:
+        # Same order as the query below; NULL pick orders first, as in SQLite
+        rows = [
+            (i.product_id, i.product_name, i.product_code, i.pick_order, i.quantity, i.unit_price, i.line_total)
+            for i in sorted(items, key=lambda i: (i.pick_order is not None, i.pick_order or 0, i.product_name, i.id))
+        ]
+    else:
+        rows = (
+            OrderItem.objects
+            .filter(order_id=order.pk)
+            .order_by("pick_order", "product_name", "id")
+            .values_list(
+                "product_id",
+                "product_name",
+                "product_code",
+                "pick_order",
+                "quantity",
+                "unit_price",
+                "line_total",
+            )
+        )
+
+    return [
+        {
+            "product_id": product_id,
+            "name": name,
+            "code": code,
+            "pick_order": pick_order,
+            "quantity": quantity,
+            "unit_price": unit_price,
+            "line_total": line_total,
+        }
+        for product_id, name, code, pick_order, quantity, unit_price, line_total in rows
+    ]
+
+
+def generate_order_csv(order):
+    """
+    Return CSV text for a single order in warehouse pick order.
+
+    Columns:
+        RowNumber ; PickOrder ; ProductName ; ProductCode ; Quantity
+    """
+
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=';')
+
+    # Header row
+    writer.writerow(["SatırNo", "RafSırası", "ÜrünAdı", "ÜrünKodu", "Adet"])
+    #writer.writerow(["RowNumber", "PickOrder", "ProductName", "ProductCode", "Quantity"])
+
+    # Data rows
+    # Lines come sorted by picking order (and name as fallback)
+    for idx, line in enumerate(get_order_lines(order), start=1):
+        writer.writerow([
+            idx,                 # RowNumber
+            line["pick_order"],  # PickOrder
+            line["name"],        # ProductName
+            line["code"],        # ProductCode
+            line["quantity"],    # Quantity
+        ])
+
+    csv_content = output.getvalue()
+    output.close()
+    return csv_content
+
+
+def calculate_discount(subtotal, customer_type='retail'):
+    """Calculate discount based on order subtotal and customer type"""
+    discount_tiers = get_tier_table(customer_type)
+
+    tier = discount_tiers.current_tier(subtotal)
+    if tier is not None:
+        discount_amount = subtotal * (tier.discount_percentage / 100)
+        return {
+            'tier': tier,
+            'discount_percentage': tier.discount_percentage,
+            'discount_amount': discount_amount,
+            'final_total': subtotal - discount_amount,
+            'next_tier': get_next_tier(subtotal, discount_tiers)
+        }
+
+    # No discount applies
+    return {
+        'tier': None,
+        'discount_percentage': 0,
+        'discount_amount': 0,
+        'final_total': subtotal,
+        'next_tier': get_next_tier(subtotal, discount_tiers)
+    }
+
+
+def get_next_tier(current_total, discount_tiers):
+    """Get the next available discount tier"""
+    tier = discount_tiers.next_tier(current_total)
+    if tier is None:
+        return None
+    return {
+        'threshold': tier.threshold,
+        'percentage': tier.discount_percentage,
+        'remaining': tier.threshold - current_total
+    }
@@ -0,0 +1,107 @@
+# ============================
+#  PRINT QUEUE LEASES
+# ============================
+#
+# Several print agents can drain the queue at the same time. An agent
+# claims a batch of confirmed, unprinted orders under a lease (random
+# token, agent id, expiry); other agents skip leased orders until the
+# lease expires, e.g. because the agent or its printer died, and then the
+# orders are back in the queue. Marking printed is keyed by the lease, so
+# an agent can safely repeat it.
+#
+# Agents wait for work on a long-poll (views.print_queue_wait) instead of
+# polling. Whenever an order enters the queue its stamp file is bumped
+# (see signals.py), so a waiting request notices it with an os.stat per
+# tick rather than a query.
+
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .invalidation import bump_stamp, current_stamp
+from .models import Order
+
+STAMP_NAME = "print_queue"
+
+
+def _claimable(now):
+    return Q(is_confirmed=True, printed=False) & (
+        Q(print_lease_expires__isnull=True) | Q(print_lease_expires__lt=now)
+    )
+
+
+def print_queue(now=None):
+    """Orders waiting for an agent, oldest first."""
+    now = now or timezone.now()
+    return Order.objects.filter(_claimable(now)).order_by("created_at", "id")
+
+
+def claim_print_batch(agent: str, limit: int, lease_seconds=None):
+    """
+    Lease up to `limit` queued orders to `agent`, oldest first.
+    Returns (lease, orders); orders is empty when nothing is queued.
+    """
+    now = timezone.now()
+    lease = secrets.token_hex(16)
+    lease_seconds = lease_seconds or settings.PRINT_LEASE_SECONDS
+    claim = {
+        "print_lease": lease,
+        "print_agent": agent[:100],
+        "print_lease_expires": now + timedelta(seconds=lease_seconds),
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        # Rows another agent is claiming right now are skipped, not waited for
+        with transaction.atomic():
+            ids = list(
+                print_queue(now)
+                .select_for_update(skip_locked=True)
+                .values_list("id", flat=True)[:limit]
+            )
+            Order.objects.filter(id__in=ids).update(**claim)
+    else:
+        ids = list(print_queue(now).values_list("id", flat=True)[:limit])
+        # The UPDATE re-checks the lease: orders another agent claimed in
+        # between are left out of this batch
+        Order.objects.filter(_claimable(now), id__in=ids).update(**claim)
+
+    orders = list(Order.objects.filter(print_lease=lease).order_by("created_at", "id"))
+    return lease, orders
+
+
+def mark_lease_printed(lease: str, order_ids=None) -> int:
+    """
+    Mark the orders of a lease as printed (only `order_ids` of them when
+    given); returns how many changed.
+    Also works after the lease expired, as long as no other agent took the
+    orders in the meantime. Repeating it changes nothing.
+    """
+    orders = Order.objects.filter(print_lease=lease, printed=False)
+    if order_ids is not None:
+        orders = orders.filter(id__in=order_ids)
+    return orders.update(printed=True, printed_at=timezone.now())
+
+
+def release_lease(lease: str) -> int:
+    """Put the unprinted orders of a lease back in the queue right away."""
+    released = (
+        Order.objects
+        .filter(print_lease=lease, printed=False)
+        .update(print_lease="", print_agent="", print_lease_expires=None)
+    )
+    if released:
+        notify_print_queue()
+    return released
+
+
+def notify_print_queue():
+    """Wake up agents waiting for orders, in every process."""
+    bump_stamp(STAMP_NAME)
+
+
+def print_queue_stamp() -> int:
+    return current_stamp(STAMP_NAME)
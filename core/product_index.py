@@ -0,0 +1,101 @@
+# ============================
+#  PRODUCT CODE INDEX
+# ============================
+#
+# Maps picking-sheet codes ("001", "CE25", "NB03", ...) to active product
+# ids. Built once per process and rebuilt only after a Product is saved or
+# deleted (see signals.py), so a picking render does not scan the catalog.
+# It also keeps the set of active product ids, which the order form checks
+# posted baskets against.
+
+import threading
+
+from .invalidation import bump_stamp, current_stamp
+from .models import Product
+
+STAMP_NAME = "product_code_index"
+
+# Catalog code = series prefix + picking-sheet code, e.g. MBKO + 063G,
+# MBNS + NB03, MBTC + CTC15. When two products end up with the same sheet
+# code, the prefix listed first wins.
+PRODUCT_CODE_PREFIXES = (
+    "MBKO",  # Kalıcı oje: gel polish, cat eyes, candy, disco, new cateyes
+    "MBGP",  # Gel polish (single items)
+    "MBPG",  # Painting gel, poly gel
+    "MBLG",  # Liner gel
+    "MBRB",  # Rubber base
+    "MBSG",  # Structure base
+    "MBBG",  # Builder gel
+    "MBNS",  # Non stick builder gel
+    "MBCL",  # Cateyes liner gel
+    "MBPR",  # Primer
+    "MBBC",  # Base coat
+    "MBTC",  # Top coat
+    "MBBL",  # Builder liquid
+)
+
+
+def split_product_code(code: str):
+    """
+    Split a catalog code into (series prefix, picking-sheet code).
+    Returns (None, None) for codes without a known prefix.
+    """
+    code = (code or "").strip()
+    for prefix in PRODUCT_CODE_PREFIXES:
+        if code.startswith(prefix) and len(code) > len(prefix):
+            return prefix, code[len(prefix):]
+    return None, None
+
+
+class ProductCodeIndex:
+    def __init__(self, stamp, product_id_by_code, active_product_ids):
+        self.stamp = stamp
+        self.active_product_ids = active_product_ids
+        self.product_id_by_code = product_id_by_code
+        self.codes_by_product_id = {}
+        for code, product_id in product_id_by_code.items():
+            self.codes_by_product_id.setdefault(product_id, []).append(code)
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def _build_index(stamp):
+    rank = {prefix: i for i, prefix in enumerate(PRODUCT_CODE_PREFIXES)}
+    best = {}
+    active_product_ids = set()
+    for product_id, code in Product.objects.filter(is_active=True).values_list("id", "code"):
+        active_product_ids.add(product_id)
+        prefix, sheet = split_product_code(code)
+        if sheet is None:
+            continue
+        priority = rank[prefix]
+        if sheet not in best or priority < best[sheet][0]:
+            best[sheet] = (priority, product_id)
+
+    return ProductCodeIndex(
+        stamp,
+        {code: pid for code, (_, pid) in best.items()},
+        frozenset(active_product_ids),
+    )
+
+
+def get_product_code_index() -> ProductCodeIndex:
+    """Return the code index, rebuilding it if products changed anywhere."""
+    global _index
+    stamp = current_stamp(STAMP_NAME)
+    index = _index
+    if index is not None and index.stamp == stamp:
+        return index
+
+    with _lock:
+        if _index is None or _index.stamp != stamp:
+            # Read the stamp before querying: a save during the build
+            # leaves the index stale and it is rebuilt on next use.
+            _index = _build_index(stamp)
+        return _index
+
+
+def invalidate_product_code_index():
+    bump_stamp(STAMP_NAME)
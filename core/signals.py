@@ -0,0 +1,31 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .discount_tiers import invalidate_discount_tiers
+from .models import DiscountTier, Order, Product
+from .print_queue import notify_print_queue
+from .product_index import invalidate_product_code_index
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, using, **kwargs):
+    # Bump the stamp only once the change is visible: a worker rebuilding
+    # before the commit would cache the old rows under the new stamp
+    transaction.on_commit(invalidate_product_code_index, using=using)
+
+
+@receiver(post_save, sender=DiscountTier)
+@receiver(post_delete, sender=DiscountTier)
+def discount_tier_changed(sender, using, **kwargs):
+    # After commit, as for products: a stale table would price orders wrong
+    # until the next tier edit
+    transaction.on_commit(invalidate_discount_tiers, using=using)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, using, **kwargs):
+    if instance.is_confirmed and not instance.printed:
+        # Waiting print agents must not look before the order is committed
+        transaction.on_commit(notify_print_queue, using=using)
@@ -1,26 +1,274 @@
+# ============================
+#  TELEGRAM BOT API CLIENT
+# ============================
+#
+# All Telegram traffic goes through one TelegramClient per process: a
+# keep-alive requests.Session (one TLS handshake, reused), timeouts on
+# every call and a per-chat token bucket so we stay under Telegram's chat
+# limits instead of collecting 429s. An order's CSV and both PDFs go out as
+# a single sendMediaGroup album.
+#
+# TELEGRAM_API_URL points the client elsewhere, e.g. at the offline stub
+# (`manage.py telegram_stub`) for throughput tests.
+
+import json
+import threading
+import time
+
 import requests
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metrics import span
+
+
+class TelegramError(Exception):
+    """The Bot API call failed or returned ok=false."""
+
+
+class TokenBucket:
+    """Allows `rate` tokens per second on average, bursts up to `capacity`."""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        """Block until `cost` tokens are available, then take them."""
+        cost = min(cost, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                wait = (cost - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TelegramClient:
+    def __init__(self, token, api_url, timeout, messages_per_minute, burst):
+        self.base_url = f"{api_url.rstrip('/')}/bot{token}"
+        self.timeout = timeout
+        self.messages_per_minute = messages_per_minute
+        self.burst = burst
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=10))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=10))
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(chat_id)
+            if bucket is None:
+                bucket = TokenBucket(self.messages_per_minute / 60, self.burst)
+                self._buckets[chat_id] = bucket
+            return bucket
+
+    def call(self, method, chat_id, data, files=None, messages=1):
+        """
+        POST a Bot API method for one chat, `messages` counting against its
+        rate limit. A 429 is waited out once (if the wait fits in the
+        timeout); anything else raises TelegramError.
+        """
+        with span("telegram_wait"):
+            self._bucket(chat_id).acquire(messages)
+        data = {"chat_id": chat_id, **data}
+
+        for attempt in range(2):
+            try:
+                with span(f"telegram_{method}"):
+                    response = self.session.post(
+                        f"{self.base_url}/{method}", data=data, files=files, timeout=self.timeout,
+                    )
+                payload = response.json()
+            except (requests.RequestException, ValueError) as e:
+                raise TelegramError(f"{method} failed: {e}") from e
+
+            if response.status_code == 429 and attempt == 0:
+                retry_after = payload.get("parameters", {}).get("retry_after", 1)
+                if retry_after <= self.timeout:
+                    time.sleep(retry_after)
+                    continue
+
+            if not payload.get("ok"):
+                raise TelegramError(f"{method} failed: {response.status_code} {payload.get('description', '')}")
+            return payload["result"]
+
+    def send_document(self, chat_id, filename, content, mime_type, caption=""):
+        return self.call(
+            "sendDocument",
+            chat_id,
+            {"caption": caption},
+            files={"document": (filename, content, mime_type)},
+        )
+
+    def send_documents(self, chat_id, documents):
+        """
+        Send up to 10 documents as one album (sendMediaGroup).
+        documents: [(filename, content, mime_type, caption)]
+        """
+        media = []
+        files = {}
+        for i, (filename, content, mime_type, caption) in enumerate(documents):
+            name = f"file{i}"
+            files[name] = (filename, content, mime_type)
+            media.append({"type": "document", "media": f"attach://{name}", "caption": caption})
+
+        return self.call(
+            "sendMediaGroup",
+            chat_id,
+            {"media": json.dumps(media, ensure_ascii=False)},
+            files=files,
+            messages=len(documents),
+        )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide client, or None when Telegram is not configured."""
+    global _client
+    if not settings.TELEGRAM_BOT_TOKEN or not settings.TELEGRAM_CHAT_ID:
+        return None
+
+    with _client_lock:
+        if _client is None:
+            _client = TelegramClient(
+                settings.TELEGRAM_BOT_TOKEN,
+                settings.TELEGRAM_API_URL,
+                settings.TELEGRAM_TIMEOUT,
+                settings.TELEGRAM_MESSAGES_PER_MINUTE,
+                settings.TELEGRAM_BURST,
+            )
+        return _client
+
+
+# ============================
+#  ORDER MESSAGES
+# ============================
+
+def _customer_type_line(order):
+    if order.customer_type == "wholesale":
+        return "🏪 Müşteri Tipi: Toptan"
+    return "🛍️ Müşteri Tipi: Perakende"
+
+
+def csv_caption(order):
+    return f"New order #{order.id} from {order.customer_name}"
+
+
+def picking_caption(order):
+    caption = f"📦 Picking List - Sipariş #{order.id}\n"
+    caption += f"{_customer_type_line(order)}\n"
+    caption += f"👤 {order.customer_name}"
+    return caption
+
+
+def receipt_caption(order):
+    caption = f"📄 Müşteri Fişi - Sipariş #{order.id}\n"
+    caption += f"{_customer_type_line(order)}\n"
+    caption += f"👤 {order.customer_name}\n"
+    caption += f"📞 {order.customer_phone}"
+    return caption
+
+
+# Telegram rejects longer document captions
+CAPTION_LIMIT = 1024
+
+
+def digest_caption(orders):
+    """Summary of a batch: one line per order, trimmed to the caption limit."""
+    header = f"📦 {len(orders)} yeni sipariş (#{orders[0].id} – #{orders[-1].id})\n"
+    lines = []
+    for order in orders:
+        type_emoji = "🏪" if order.customer_type == "wholesale" else "🛍️"
+        lines.append(f"{type_emoji} #{order.id} {order.customer_name} – {order.final_total} ₺")
+
+    caption = header + "\n".join(lines)
+    while len(caption) > CAPTION_LIMIT and lines:
+        lines.pop()
+        rest = len(orders) - len(lines)
+        caption = header + "\n".join(lines) + f"\n… +{rest} sipariş"
+    return caption
+
+
+# Errors propagate from all senders: the outbox worker retries the upload
+
+def send_order_documents_via_telegram(order, csv_content: str, picking_pdf: bytes, receipt_pdf: bytes):
+    """CSV, picking list and receipt of an order as one album."""
+    client = get_client()
+    if client is None:
+        return
+
+    client.send_documents(settings.TELEGRAM_CHAT_ID, [
+        (f"order_{order.id}.csv", csv_content.encode("utf-8"), "text/csv", csv_caption(order)),
+        (f"order_{order.id}_picking.pdf", picking_pdf, "application/pdf", picking_caption(order)),
+        (f"order_{order.id}_receipt.pdf", receipt_pdf, "application/pdf", receipt_caption(order)),
+    ])
+
+
+def send_order_digest_via_telegram(orders, zip_content: bytes):
+    """Many orders in one message: a ZIP of their documents plus a summary caption."""
+    client = get_client()
+    if client is None:
+        return
+
+    client.send_document(
+        settings.TELEGRAM_CHAT_ID,
+        f"orders_{orders[0].id}-{orders[-1].id}.zip",
+        zip_content,
+        "application/zip",
+        digest_caption(orders),
+    )
 
 
 def send_order_csv_via_telegram(order, csv_content: str):
-    token = getattr(settings, "TELEGRAM_BOT_TOKEN", "")
-    chat_id = getattr(settings, "TELEGRAM_CHAT_ID", "")
+    client = get_client()
+    if client is None:
+        return
+
+    client.send_document(
+        settings.TELEGRAM_CHAT_ID,
+        f"order_{order.id}.csv",
+        csv_content.encode("utf-8"),
+        "text/csv",
+        csv_caption(order),
+    )
+
+
+def send_order_picking_pdf_to_telegram(order, pdf_content: bytes):
+    """Send picking PDF to Telegram."""
+    client = get_client()
+    if client is None:
+        return
+
+    client.send_document(
+        settings.TELEGRAM_CHAT_ID,
+        f"order_{order.id}_picking.pdf",
+        pdf_content,
+        "application/pdf",
+        picking_caption(order),
+    )
+
 
-    if not token or not chat_id:
-        # No config set — you may want to log this or skip silently
+def send_order_receipt_pdf_to_telegram(order, pdf_content: bytes):
+    """Send customer receipt PDF to Telegram."""
+    client = get_client()
+    if client is None:
         return
 
-    url = f"https://api.telegram.org/bot{token}/sendDocument"
-    files = {
-        "document": (f"order_{order.id}.csv", csv_content.encode("utf-8"), "text/csv")
-    }
-    data = {
-        "chat_id": chat_id,
-        "caption": f"New order #{order.id} from {order.customer_name}",
-    }
-
-    try:
-        requests.post(url, data=data, files=files, timeout=10)
-    except Exception:
-        # In production you'd log the error; here we just ignore failures
-        pass
+    client.send_document(
+        settings.TELEGRAM_CHAT_ID,
+        f"order_{order.id}_receipt.pdf",
+        pdf_content,
+        "application/pdf",
+        receipt_caption(order),
+    )
@@ -1,3 +1,779 @@
-from django.test import TestCase
+import json
+import os
+import re
+import socket
+import tempfile
+import threading
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from http.server import ThreadingHTTPServer
+from io import BytesIO
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import urlopen
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.db import connection, transaction
+from django.db.models import Prefetch, Q
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from pypdf import PdfReader
+
+from .discount_tiers import get_tier_table, invalidate_discount_tiers
+from .management.commands.telegram_stub import StubState, make_handler
+from .models import Category, DiscountTier, DraftCart, Order, OrderItem, OutboxJob, Product
+from .outbox import (
+    ORDER_CONFIRMED_JOBS,
+    ORDER_DOCUMENTS_TELEGRAM,
+    claim_digest_jobs,
+    claim_jobs,
+    run_digest,
+    run_job,
+)
+from .pdf_cache import get_receipt_pdf, order_digest
+from .pdf_utils import build_full_picking_pdf, build_picking_pdf_canvas, build_picking_pdf_platypus
+from .print_queue import claim_print_batch, mark_lease_printed, print_queue, release_lease
+from .pricing import calculate_discount, get_order_lines
+from .product_index import get_product_code_index, invalidate_product_code_index, split_product_code
+from .telegram_utils import CAPTION_LIMIT, digest_caption
+
+
+class OrderWriteQueryCountTests(TestCase):
+    """
+    Creating and confirming an order must cost the same number of SQL
+    statements whatever the basket size (bulk writes, no per-line queries).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Test")
+        products = [
+            Product(
+                category=category,
+                name=f"Ürün {i:03d}",
+                code=f"MBKO{i:03d}",
+                pick_order=i,
+                price=Decimal("100.00"),
+                discount_percent=10 if i % 2 else 0,
+            )
+            for i in range(1, 101)
+        ]
+        for product in products:
+            product.final_price = product.compute_final_price()
+        Product.objects.bulk_create(products)
+        cls.product_ids = list(Product.objects.order_by("id").values_list("id", flat=True))
+        # bulk_create sends no signals; rebuild the active ids up front
+        invalidate_product_code_index()
+        get_product_code_index()
+
+    def place_order(self, lines):
+        """Run the funnel for `lines` products; return the statements of form POST and confirm."""
+        kwargs = {"customer_type": "retail"}
+        self.client.post(reverse("customer_info", kwargs=kwargs), {
+            "customer_name": "Test Müşteri",
+            "customer_phone": "05550000000",
+        })
+
+        basket = {f"qty_{pid}": 2 for pid in self.product_ids[:lines]}
+        with CaptureQueriesContext(connection) as form_queries:
+            self.client.post(reverse("order_form", kwargs=kwargs), basket)
+
+        # Edit every line on the review page: change one, drop one
+        edits = {f"qty_{pid}": 3 for pid in self.product_ids[:lines]}
+        edits[f"qty_{self.product_ids[0]}"] = 0
+        with CaptureQueriesContext(connection) as confirm_queries:
+            response = self.client.post(reverse("order_confirm", kwargs=kwargs), edits)
+
+        self.assertTemplateUsed(response, "order_confirmed.html")
+        order = Order.objects.latest("id")
+        self.assertTrue(order.is_confirmed)
+        self.assertEqual(order.items.count(), lines - 1)
+        return len(form_queries), len(confirm_queries)
+
+    def test_order_form_keeps_only_active_posted_products(self):
+        kwargs = {"customer_type": "retail"}
+        self.client.post(reverse("customer_info", kwargs=kwargs), {
+            "customer_name": "Test Müşteri",
+            "customer_phone": "05550000000",
+        })
+        first, second = self.product_ids[:2]
+        self.client.post(reverse("order_form", kwargs=kwargs), {
+            f"qty_{first}": 2,
+            f"qty_{second}": "abc",
+            "qty_999999": 5,
+            "qty_x": 1,
+            "customer_note": "",
+        })
+        self.assertEqual(DraftCart.objects.get().quantities, {first: 2})
+
+    def test_statement_count_does_not_depend_on_basket_size(self):
+        small = self.place_order(5)
+        large = self.place_order(100)
+        self.assertEqual(small, large)
+
+    def test_confirm_statement_count(self):
+        form_statements, confirm_statements = self.place_order(5)
+        # session, draft INSERT, session UPDATE (in a savepoint); the posted
+        # ids are checked against the cached active ids, not the catalog
+        self.assertEqual(form_statements, 5)
+        # session, draft, pricing; then one savepoint with the order, items
+        # and outbox INSERTs and the draft DELETE; session UPDATE
+        self.assertEqual(confirm_statements, 12)
+
+    def test_confirmed_order_keeps_its_price_snapshot(self):
+        kwargs = {"customer_type": "retail"}
+        self.client.post(reverse("customer_info", kwargs=kwargs), {
+            "customer_name": "Test Müşteri",
+            "customer_phone": "05550000000",
+        })
+        first, second = self.product_ids[:2]
+        self.client.post(reverse("order_form", kwargs=kwargs), {f"qty_{first}": 3, f"qty_{second}": 2})
+        self.client.post(reverse("order_confirm", kwargs=kwargs))
+
+        order = Order.objects.get()
+        # Ürün 001 is 10% off
+        snapshot = [
+            ("Ürün 001", "MBKO001", 1, Decimal("100.00"), Decimal("90.00"), 3, Decimal("270.00")),
+            ("Ürün 002", "MBKO002", 2, Decimal("100.00"), Decimal("100.00"), 2, Decimal("200.00")),
+        ]
+        fields = ("product_name", "product_code", "pick_order", "list_price", "unit_price", "quantity", "line_total")
+        self.assertEqual(list(order.items.order_by("pick_order").values_list(*fields)), snapshot)
+        self.assertEqual((order.subtotal, order.final_total), (Decimal("470.00"), Decimal("470.00")))
+
+        # Later catalog edits do not reach the confirmed order
+        Product.objects.filter(id__in=[first, second]).update(name="Yeni", code="MBKO999", price=1, final_price=1)
+        lines = [(line["name"], line["code"], line["unit_price"], line["line_total"]) for line in get_order_lines(order)]
+        self.assertEqual(lines, [(name, code, unit, total) for name, code, _, _, unit, _, total in snapshot])
+
+    def test_racing_confirms_create_one_order(self):
+        kwargs = {"customer_type": "retail"}
+        self.client.post(reverse("customer_info", kwargs=kwargs), {
+            "customer_name": "Test Müşteri",
+            "customer_phone": "05550000000",
+        })
+        self.client.post(reverse("order_form", kwargs=kwargs), {f"qty_{self.product_ids[0]}": 2})
+        draft = DraftCart.objects.get()
+
+        first = self.client.post(reverse("order_confirm", kwargs=kwargs))
+        # The second request read the draft before the first one deleted it
+        with mock.patch("core.views.get_draft_cart", return_value=draft):
+            second = self.client.post(reverse("order_confirm", kwargs=kwargs))
+
+        order = Order.objects.get()
+        self.assertEqual(first.context["order"], order)
+        self.assertEqual(second.context["order"], order)
+        self.assertEqual(OutboxJob.objects.count(), len(ORDER_CONFIRMED_JOBS))
+
+
+class SessionModeTests(TestCase):
+    """The order funnel works in every SESSION_MODE; the non-db ones never touch django_session."""
+
+    ENGINES = {
+        "cache": "django.contrib.sessions.backends.cache",
+        "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Test")
+        cls.product = Product.objects.create(
+            category=category, name="Ürün", code="MBKO001", pick_order=1, price=Decimal("10.00"),
+        )
+
+    def setUp(self):
+        # The order form checks posted ids against the cached active ids
+        invalidate_product_code_index()
+        self.addCleanup(invalidate_product_code_index)
+
+    def run_funnel(self, client, name):
+        kwargs = {"customer_type": "wholesale"}
+        client.post(reverse("customer_info", kwargs=kwargs), {"customer_name": name, "customer_phone": "0555"})
+        client.post(reverse("order_form", kwargs=kwargs), {f"qty_{self.product.id}": 3})
+        return client.post(reverse("order_confirm", kwargs=kwargs))
+
+    def test_funnel_without_session_table(self):
+        for mode, engine in self.ENGINES.items():
+            with self.subTest(mode=mode), self.settings(SESSION_ENGINE=engine, SESSION_CACHE_ALIAS="default"):
+                response = self.run_funnel(Client(), f"Müşteri {mode}")
+                order = Order.objects.get(customer_name=f"Müşteri {mode}")
+                self.assertEqual(response.context["order"], order)
+                self.assertEqual((order.customer_type, order.items.get().quantity), ("wholesale", 3))
+        self.assertFalse(Session.objects.exists())
+
+    def test_repeated_page_view_does_not_write_the_session(self):
+        url = reverse("customer_info", kwargs={"customer_type": "retail"})
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        writes = [q["sql"] for q in queries if "django_session" in q["sql"] and not q["sql"].startswith("SELECT")]
+        self.assertEqual(writes, [])
+
+
+class ProductCodeIndexTests(TestCase):
+    def test_earlier_prefix_wins_the_sheet_code(self):
+        category = Category.objects.create(name="Test")
+        gel_polish, kalici, _, inactive, primer = Product.objects.bulk_create([
+            Product(category=category, name="Gel polish 001", code="MBGP001", pick_order=1),
+            Product(category=category, name="Kalıcı oje 001", code="MBKO001", pick_order=2),
+            Product(category=category, name="Builder gel", code="MBBG", pick_order=3),
+            Product(category=category, name="Eski", code="MBKO002", pick_order=4, is_active=False),
+            Product(category=category, name="Primer 002", code="MBPR002", pick_order=5),
+        ])
+        invalidate_product_code_index()
+        self.addCleanup(invalidate_product_code_index)
+
+        index = get_product_code_index()
+        # MBKO is listed before MBGP; inactive products and bare prefixes never map
+        self.assertEqual(index.product_id_by_code["001"], kalici.id)
+        self.assertEqual(index.product_id_by_code["002"], primer.id)
+        self.assertNotIn(gel_polish.id, index.codes_by_product_id)
+        self.assertNotIn(inactive.id, index.active_product_ids)
+        self.assertEqual(split_product_code("MBBG"), (None, None))
+
+
+class DiscountTierCacheTests(TestCase):
+    def test_tier_boundaries(self):
+        DiscountTier.objects.bulk_create([
+            DiscountTier(threshold=Decimal(threshold), discount_percentage=Decimal(percentage))
+            for threshold, percentage in (("2500", "10"), ("1000", "5"), ("5000", "15"))
+        ])
+        DiscountTier.objects.create(threshold=Decimal("500"), discount_percentage=Decimal("50"), is_active=False)
+        DiscountTier.objects.create(customer_type="wholesale", threshold=Decimal("1"), discount_percentage=Decimal("30"))
+        invalidate_discount_tiers()
+        # The rollback after the test does not reach the process-wide engine
+        self.addCleanup(invalidate_discount_tiers)
+
+        table = get_tier_table("retail")
+        cases = (
+            ("0", None, 1000),
+            ("999.99", None, 1000),
+            ("1000", 5, 2500),      # reaching a threshold applies it
+            ("2499.99", 5, 2500),
+            ("2500", 10, 5000),
+            ("5000", 15, None),
+            ("100000", 15, None),
+        )
+        for subtotal, current, following in cases:
+            with self.subTest(subtotal=subtotal):
+                tier, next_tier = table.current_tier(Decimal(subtotal)), table.next_tier(Decimal(subtotal))
+                self.assertEqual(tier and tier.discount_percentage, current)
+                self.assertEqual(next_tier and next_tier.threshold, following)
+
+        info = calculate_discount(Decimal("1000"), "retail")
+        self.assertEqual((info["discount_amount"], info["final_total"]), (Decimal("50"), Decimal("950")))
+        self.assertEqual(info["next_tier"]["remaining"], Decimal("1500"))
+
+    def test_tier_edit_applies_after_commit(self):
+        self.assertIsNone(get_tier_table("retail").current_tier(Decimal("1500")))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                DiscountTier.objects.create(threshold=Decimal("1000"), discount_percentage=Decimal("10"))
+                # Not committed: other workers must keep the old table
+                self.assertIsNone(get_tier_table("retail").current_tier(Decimal("1500")))
+
+        self.assertEqual(get_tier_table("retail").current_tier(Decimal("1500")).discount_percentage, 10)
+
+
+class PickingPdfTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = Order.objects.create(customer_name="Müşteri", customer_note="Not\nikinci satır", is_confirmed=True)
+        cls.qty_by_code = {"001": 2, "CE25": 1}
+
+    def page_words(self, pdf):
+        return [Counter(page.extract_text().split()) for page in PdfReader(BytesIO(pdf)).pages]
+
+    def test_engines_render_the_same_sheet(self):
+        qty_by_code = {**self.qty_by_code, "NB03": 17}
+        platypus = self.page_words(build_picking_pdf_platypus(self.order, qty_by_code))
+        canvas = self.page_words(build_picking_pdf_canvas(self.order, qty_by_code))
+
+        self.assertEqual(len(canvas), len(platypus))
+        for page, (expected, actual) in enumerate(zip(platypus, canvas)):
+            self.assertEqual(actual, expected, f"page {page + 1}")
+        self.assertTrue(any(words["17"] for words in canvas))
+
+    def test_concurrent_renders_do_not_share_flowables(self):
+        for engine in ("platypus", "canvas"):
+            with self.subTest(engine=engine), self.settings(PICKING_PDF_ENGINE=engine):
+                build_full_picking_pdf(self.order, self.qty_by_code)  # compile once
+                with ThreadPoolExecutor(max_workers=8) as pool:
+                    pdfs = list(pool.map(
+                        lambda _: build_full_picking_pdf(self.order, self.qty_by_code), range(32),
+                    ))
+                self.assertTrue(all(pdf.startswith(b"%PDF") for pdf in pdfs))
+
+
+class PdfCacheTests(TestCase):
+    """Cached PDFs are keyed by what they show: an edit that changes the PDF changes the key."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Test")
+        cls.product = Product.objects.create(
+            category=category, name="Ürün", code="MBKO001", pick_order=1, price=Decimal("100.00"),
+        )
+        cls.order = Order.objects.create(
+            customer_name="Müşteri",
+            is_confirmed=True,
+            subtotal=Decimal("200.00"),
+            final_total=Decimal("200.00"),
+        )
+        cls.item = OrderItem.objects.create(
+            order=cls.order,
+            product=cls.product,
+            quantity=2,
+            product_name="Ürün",
+            product_code="MBKO001",
+            unit_price=Decimal("100.00"),
+            line_total=Decimal("200.00"),
+        )
+
+    def assertDigestChanges(self, edit):
+        before = order_digest(self.order)
+        edit()
+        self.order.refresh_from_db()
+        self.assertNotEqual(order_digest(self.order), before)
+
+    def test_product_code_edit_changes_digest(self):
+        # The picking sheet places items by the live product code
+        self.assertDigestChanges(lambda: Product.objects.filter(id=self.product.id).update(code="MBKO002"))
+
+    def test_order_edits_change_digest(self):
+        self.assertDigestChanges(lambda: OrderItem.objects.filter(id=self.item.id).update(quantity=3))
+        self.assertDigestChanges(lambda: Order.objects.filter(id=self.order.id).update(customer_note="Acil"))
+        # Re-pricing under a new tier rewrites the order's discount snapshot
+        self.assertDigestChanges(lambda: Order.objects.filter(id=self.order.id).update(
+            discount_percentage=Decimal("10"),
+            discount_amount=Decimal("20.00"),
+            final_total=Decimal("180.00"),
+        ))
+
+    def test_catalog_price_and_tier_edits_keep_confirmed_pdfs(self):
+        # Confirmed PDFs show the order's price snapshot, not the live catalog
+        before = order_digest(self.order)
+        self.product.price = Decimal("150.00")
+        self.product.save()
+        DiscountTier.objects.create(threshold=Decimal("100"), discount_percentage=Decimal("10"))
+        self.assertEqual(order_digest(self.order), before)
+
+    def test_edited_order_replaces_its_cached_pdf(self):
+        with tempfile.TemporaryDirectory() as cache, self.settings(PDF_CACHE_DIR=cache):
+            get_receipt_pdf(self.order)
+            (first,) = os.listdir(cache)
+            Order.objects.filter(id=self.order.id).update(customer_note="Acil")
+            self.order.refresh_from_db()
+            get_receipt_pdf(self.order)
+            (second,) = os.listdir(cache)
+        self.assertNotEqual(first, second)
+
+
+class PrintQueueLeaseTests(TestCase):
+    """Agents printing from the same queue never get the same order twice."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Order.objects.bulk_create([
+            Order(customer_name=f"Müşteri {i}", is_confirmed=True) for i in range(5)
+        ])
+        Order.objects.create(customer_name="Taslak")  # not confirmed: never printed
+
+    def test_agents_get_disjoint_batches(self):
+        _, first = claim_print_batch("station-1", 3)
+        _, second = claim_print_batch("station-2", 3)
+        _, third = claim_print_batch("station-3", 3)
+
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertEqual(third, [])
+        self.assertFalse({o.id for o in first} & {o.id for o in second})
+
+    def test_expired_lease_returns_to_queue(self):
+        lease, orders = claim_print_batch("station-1", 5)
+        Order.objects.filter(print_lease=lease).update(
+            print_lease_expires=timezone.now() - timedelta(seconds=1),
+        )
+
+        new_lease, retaken = claim_print_batch("station-2", 5)
+        self.assertEqual([o.id for o in retaken], [o.id for o in orders])
+        # The first agent lost the orders: its late mark changes nothing
+        self.assertEqual(mark_lease_printed(lease), 0)
+        self.assertEqual(mark_lease_printed(new_lease), 5)
+
+    def test_mark_printed_is_idempotent(self):
+        lease, _ = claim_print_batch("station-1", 2)
+        self.assertEqual(mark_lease_printed(lease), 2)
+        self.assertEqual(mark_lease_printed(lease), 0)
+        self.assertEqual(Order.objects.filter(printed=True).count(), 2)
+
+    def test_released_orders_can_be_claimed_again(self):
+        lease, orders = claim_print_batch("station-1", 2)
+        self.assertEqual(release_lease(lease), 2)
+        _, retaken = claim_print_batch("station-2", 2)
+        self.assertEqual([o.id for o in retaken], [o.id for o in orders])
+
+    def test_print_batch_endpoint_leases_to_agent(self):
+        headers = {"X-Print-Token": "t", "X-Print-Agent": "station-1"}
+        with self.settings(PRINT_API_TOKEN="t"):
+            response = self.client.get(reverse("print_batch_pdf"), {"limit": 5}, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.client.get(reverse("print_batch_pdf"), headers=headers).status_code, 204)
+
+            manifest = {"manifest": response["X-Print-Manifest"]}
+            for _ in range(2):
+                marked = self.client.post(
+                    reverse("mark_batch_printed"), manifest, content_type="application/json", headers=headers,
+                )
+            self.assertEqual(marked.json()["updated"], 0)
+
+        self.assertEqual(Order.objects.filter(printed=True, print_agent="station-1").count(), 5)
+
+    def test_bad_order_is_left_out_of_the_batch(self):
+        bad = Order.objects.filter(is_confirmed=True).order_by("created_at", "id").first()
+        Order.objects.filter(id=bad.id).update(customer_note="<b>x")  # rejected by the Paragraph parser
+        headers = {"X-Print-Token": "t", "X-Print-Agent": "station-1"}
+
+        with self.settings(PRINT_API_TOKEN="t"):
+            with self.assertLogs("core.views", "ERROR"):
+                response = self.client.get(reverse("print_batch_pdf"), {"limit": 5}, headers=headers)
+            self.assertEqual(response["X-Print-Skipped-Ids"], str(bad.id))
+            self.assertEqual(len(response["X-Print-Order-Ids"].split(",")), 4)
+
+            marked = self.client.post(
+                reverse("mark_batch_printed"), {"manifest": response["X-Print-Manifest"]},
+                content_type="application/json", headers=headers,
+            )
+        self.assertEqual(marked.json()["updated"], 4)
+        bad.refresh_from_db()
+        self.assertFalse(bad.printed)
+        self.assertEqual(bad.print_lease, response["X-Print-Lease"])  # retried once the lease expires
+
+    def test_batch_of_only_bad_orders_is_not_an_empty_queue(self):
+        Order.objects.filter(is_confirmed=True).update(customer_note="<b>x")
+        headers = {"X-Print-Token": "t", "X-Print-Agent": "station-1"}
+
+        with self.settings(PRINT_API_TOKEN="t"), self.assertLogs("core.views", "ERROR"):
+            response = self.client.get(reverse("print_batch_pdf"), {"limit": 2}, headers=headers)
+        self.assertEqual(response.status_code, 500)
+        skipped = [int(i) for i in response["X-Print-Skipped-Ids"].split(",")]
+        self.assertEqual(len(skipped), 2)
+        self.assertEqual(
+            set(Order.objects.filter(print_lease=response["X-Print-Lease"]).values_list("id", flat=True)),
+            set(skipped),
+        )
+
+    def test_batch_statement_count_does_not_depend_on_size(self):
+        category = Category.objects.create(name="Test")
+        products = [
+            Product.objects.create(category=category, name=f"Ürün {i}", code=f"MBKO{i:03d}", pick_order=i, price=10)
+            for i in range(1, 4)
+        ]
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, product=p, quantity=2, product_name=p.name, product_code=p.code,
+                pick_order=p.pick_order, unit_price=p.final_price, line_total=p.final_price * 2,
+            )
+            for order in Order.objects.filter(is_confirmed=True)
+            for p in products
+        ])
+        headers = {"X-Print-Token": "t", "X-Print-Agent": "station-1"}
+
+        counts = []
+        with tempfile.TemporaryDirectory() as cache, self.settings(PRINT_API_TOKEN="t", PDF_CACHE_DIR=cache):
+            for limit in (1, 4):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(reverse("print_batch_pdf"), {"limit": limit}, headers=headers)
+                self.assertEqual(len(response["X-Print-Order-Ids"].split(",")), limit)
+                counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+        # Prefetched items give the same receipt lines and cache key as queried ones
+        order = Order.objects.filter(is_confirmed=True).first()
+        prefetched = Order.objects.prefetch_related(
+            Prefetch("items", queryset=OrderItem.objects.select_related("product"))
+        ).get(id=order.id)
+        self.assertEqual(get_order_lines(prefetched), get_order_lines(order))
+        self.assertEqual(order_digest(prefetched), order_digest(order))
+
+
+class PrintQueueWaitTests(TestCase):
+    headers = {"X-Print-Token": "t"}
+
+    def wait(self, timeout):
+        with self.settings(PRINT_API_TOKEN="t"):
+            return self.client.get(reverse("print_queue_wait"), {"timeout": timeout}, headers=self.headers)
+
+    def test_times_out_when_queue_is_empty(self):
+        Order.objects.create(customer_name="Taslak")
+        self.assertEqual(self.wait(0).status_code, 204)
+
+    def test_answers_at_once_when_orders_are_queued(self):
+        Order.objects.create(customer_name="Müşteri", is_confirmed=True)
+        response = self.wait(30)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"queued": 1})
+
+    def test_non_finite_timeout_falls_back_to_default(self):
+        with mock.patch("core.views.PRINT_WAIT_DEFAULT", 0):
+            for timeout in ("nan", "inf", "-inf"):
+                self.assertEqual(self.wait(timeout).status_code, 204)
+
+
+class ProductAdminTests(TestCase):
+    def test_final_price_filter(self):
+        category = Category.objects.create(name="Test")
+        for i, price in enumerate(("50.00", "100.00", "300.00", "1500.00")):
+            Product.objects.create(
+                category=category, name=f"Ürün {price}", pick_order=i, price=Decimal(price), discount_percent=20,
+            )
+        Product.objects.create(category=category, name="Fiyatsız", pick_order=9)
+        self.client.force_login(User.objects.create_superuser("admin"))
+
+        url = reverse("admin:core_product_changelist")
+        # 20% off: 40, 80, 240, 1200
+        for value, expected in (("0-100", 2), ("100-250", 1), ("250-500", 0), ("1000-", 1), ("none", 1)):
+            response = self.client.get(url, {"final_price_range": value})
+            self.assertEqual(response.context["cl"].result_count, expected, value)
+
+
+class OutboxDigestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Test")
+        product = Product.objects.create(
+            category=category, name="Ürün", code="MBKO001", pick_order=1, price=Decimal("10.00"),
+        )
+        cls.orders = []
+        for i in range(3):
+            order = Order.objects.create(
+                customer_name=f"Müşteri {i}", is_confirmed=True, final_total=Decimal("20.00"),
+            )
+            OrderItem.objects.create(order=order, product=product, quantity=2)
+            OutboxJob.objects.create(kind=ORDER_DOCUMENTS_TELEGRAM, order=order)
+            cls.orders.append(order)
+
+    def test_digest_waits_for_the_window_then_sends_every_document(self):
+        with self.settings(TELEGRAM_DIGEST_WINDOW=60, TELEGRAM_DIGEST_THRESHOLD=3):
+            self.assertEqual(claim_digest_jobs(), (True, []))
+
+            OutboxJob.objects.update(created_at=timezone.now() - timedelta(seconds=61))
+            hold, jobs = claim_digest_jobs()
+        self.assertFalse(hold)
+        self.assertEqual([job.order for job in jobs], self.orders)
+
+        with mock.patch("core.telegram_utils.send_order_digest_via_telegram") as send:
+            self.assertTrue(run_digest(jobs))
+        orders, zip_content = send.call_args.args
+        self.assertEqual(orders, self.orders)
+
+        with zipfile.ZipFile(BytesIO(zip_content)) as archive:
+            names = archive.namelist()
+            self.assertEqual(names, [
+                name
+                for order in self.orders
+                for name in (f"order_{order.id}.csv", f"order_{order.id}_picking.pdf", f"order_{order.id}_receipt.pdf")
+            ])
+            self.assertIn("MBKO001", archive.read(names[0]).decode())
+            self.assertTrue(archive.read(names[1]).startswith(b"%PDF"))
+        self.assertEqual(OutboxJob.objects.filter(status="done").count(), 3)
+
+    def test_caption_is_trimmed_to_the_limit(self):
+        orders = [
+            Order(id=i, customer_name="Çok uzun bir müşteri adı", final_total=Decimal("1234.50"))
+            for i in range(1, 201)
+        ]
+        caption = digest_caption(orders)
+        self.assertLessEqual(len(caption), CAPTION_LIMIT)
+        self.assertTrue(caption.startswith("📦 200 yeni sipariş (#1 – #200)"))
+        shown = caption.count("₺")
+        self.assertTrue(caption.endswith(f"… +{200 - shown} sipariş"))
+
+
+class WaveSheetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("depo", is_staff=True)
+        Order.objects.bulk_create([
+            Order(customer_name=f"Müşteri {i}", is_confirmed=True) for i in range(3)
+        ])
+
+    def test_limit_is_clamped(self):
+        self.client.force_login(self.staff)
+        for limit, totes in (("-5", 1), ("0", 1), ("2", 2), ("100000", 3)):
+            response = self.client.get(reverse("wave_csv"), {"limit": limit})
+            self.assertEqual(response.status_code, 200, limit)
+            self.assertEqual(response.content.decode().count("\r\nT"), totes, limit)
+
+
+class OutboxRetryTests(TestCase):
+    """Every claim is an attempt; only the worker holding the claim records the outcome."""
+
+    def setUp(self):
+        self.calls = []
+        patcher = mock.patch.dict("core.outbox.HANDLERS", {"test": self.handler})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.fail_next = True
+        order = Order.objects.create(customer_name="Müşteri", is_confirmed=True)
+        self.job = OutboxJob.objects.create(kind="test", order=order)
+
+    def handler(self, order):
+        self.calls.append(order.id)
+        if self.fail_next:
+            raise RuntimeError("Telegram down")
+
+    def make_due(self):
+        OutboxJob.objects.filter(id=self.job.id).update(run_after=timezone.now())
+
+    def expire_lease(self):
+        expired = timezone.now() - timedelta(seconds=301)
+        OutboxJob.objects.filter(id=self.job.id).update(locked_at=expired)
+
+    def test_failed_job_backs_off_then_succeeds(self):
+        (job,) = claim_jobs(1)
+        self.assertEqual(job.attempts, 1)
+        self.assertFalse(run_job(job))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("pending", 1))
+        self.assertIn("Telegram down", job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(claim_jobs(1), [])
+
+        self.make_due()
+        self.fail_next = False
+        (job,) = claim_jobs(1)
+        self.assertTrue(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("done", 2))
+
+    def test_job_is_dead_after_max_attempts(self):
+        with self.settings(OUTBOX_MAX_ATTEMPTS=2):
+            for _ in range(2):
+                (job,) = claim_jobs(1)
+                run_job(job)
+                self.make_due()
+
+            self.assertEqual(claim_jobs(1), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("dead", 2))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_expired_lease_is_reclaimed_and_late_result_dropped(self):
+        self.fail_next = False
+        (stuck,) = claim_jobs(1)
+        self.expire_lease()
+        (job,) = claim_jobs(1)
+        self.assertEqual(job.attempts, 2)
+
+        # The first worker comes back after losing its lease
+        run_job(stuck)
+        self.assertEqual(OutboxJob.objects.get(id=job.id).status, "running")
+        self.assertTrue(run_job(job))
+        self.assertEqual(OutboxJob.objects.get(id=job.id).status, "done")
+
+    def test_worker_dying_on_last_attempt_kills_job(self):
+        with self.settings(OUTBOX_MAX_ATTEMPTS=1):
+            claim_jobs(1)
+            self.expire_lease()
+            self.assertEqual(claim_jobs(1), [])
+
+        job = OutboxJob.objects.get(id=self.job.id)
+        self.assertEqual((job.status, job.attempts), ("dead", 1))
+        self.assertEqual(self.calls, [])
+
+
+class TelegramStubTests(TestCase):
+    def setUp(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(StubState(messages_per_minute=2, latency=0)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f"http://127.0.0.1:{server.server_address[1]}/botTOKEN/sendMediaGroup"
+
+    def send_album(self, size):
+        media = json.dumps([{"type": "document", "media": f"attach://f{i}"} for i in range(size)])
+        body = urlencode({"chat_id": "1", "media": media}).encode()
+        try:
+            with urlopen(self.url, body) as response:
+                return response.status
+        except HTTPError as error:
+            return error.code
+
+    def test_album_larger_than_the_rate_limit_is_rejected(self):
+        self.assertEqual(self.send_album(3), 400)
+        self.assertEqual(self.send_album(2), 200)
+        self.assertEqual(self.send_album(2), 429)
+
+
+class HotQueryPlanTests(TestCase):
+    """
+    The queries that run on every order, print poll or purge must be
+    answered from an index. EXPLAIN QUERY PLAN reports a full table scan as
+    "SCAN <table>" without "USING ... INDEX".
+    """
+
+    FULL_SCAN = re.compile(r"\bSCAN (\w+)\b(?! USING (?:COVERING )?INDEX)(?! USING INTEGER PRIMARY KEY)")
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        scans = self.FULL_SCAN.findall(plan)
+        self.assertFalse(scans, f"full scan of {', '.join(scans)}:\n{queryset.query}\n{plan}")
+
+    def test_print_queue(self):
+        self.assertUsesIndex(print_queue()[:20])
+        self.assertUsesIndex(print_queue().values_list("id", flat=True)[:20])
+
+    def test_print_lease(self):
+        self.assertUsesIndex(Order.objects.filter(print_lease="abc", printed=False))
+
+    def test_order_form_products(self):
+        self.assertUsesIndex(
+            Product.objects.filter(is_active=True, category_id__in=[1, 2, 3]).order_by("display_order", "name")
+        )
+
+    def test_order_items_by_date_and_category(self):
+        since = timezone.now() - timedelta(days=7)
+        self.assertUsesIndex(OrderItem.objects.filter(order__created_at__gte=since))
+        self.assertUsesIndex(OrderItem.objects.filter(product__category_id=1))
+
+    def test_outbox_due_jobs(self):
+        now = timezone.now()
+        due = OutboxJob.objects.filter(
+            Q(status="pending", run_after__lte=now) | Q(status="running", locked_at__lt=now)
+        )
+        self.assertUsesIndex(due.order_by("id").values_list("id", "status", "locked_at", "attempts")[:4])
+
+    def test_stale_basket_purge(self):
+        cutoff = timezone.now() - timedelta(days=2)
+        drafts = DraftCart.objects.filter(updated_at__lt=cutoff)
+        orders = Order.objects.filter(is_confirmed=False, created_at__lt=cutoff)
+        for queryset in (drafts, orders):
+            self.assertUsesIndex(queryset.order_by().values_list("id", flat=True)[:500])
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.collector = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.collector.bind(("127.0.0.1", 0))
+        self.collector.settimeout(2)
+        self.addCleanup(self.collector.close)
+
+    def test_request_sample_is_tagged_with_url_name(self):
+        host, port = self.collector.getsockname()
+        with self.settings(METRICS_COLLECTOR=f"{host}:{port}"):
+            self.client.get(reverse("customer_info", kwargs={"customer_type": "retail"}))
+
+        tag, ms, queries, db_ms = self.collector.recv(512).decode().split()
+        self.assertEqual(tag, "customer_info")
+        self.assertGreater(float(ms), 0)
+        self.assertGreaterEqual(int(queries), 1)
+        self.assertGreaterEqual(float(db_ms), 0)
@@ -24,9 +24,18 @@ urlpatterns = [
     path('admin/order/<int:order_id>/csv/', views.order_csv_admin, name='order_csv_admin'),
     path('order/<int:order_id>/receipt/', views.order_receipt_pdf, name='order_receipt_pdf'),
     path('order/<int:order_id>/picking/', views.order_picking_pdf, name='order_picking_pdf'),
+    path('wave/csv/', views.wave_sheet, {'fmt': 'csv'}, name='wave_csv'),
+    path('wave/pdf/', views.wave_sheet, {'fmt': 'pdf'}, name='wave_pdf'),
     
     
     path('api/orders-to-print/', views.orders_to_print, name='orders_to_print'),
     path('api/order/<int:order_id>/picking-pdf/', views.order_picking_pdf_for_print, name='order_picking_pdf_for_print'),
     path('api/order/<int:order_id>/mark-printed/', views.mark_order_printed, name='mark_order_printed'),
+    path('api/print-batch/', views.print_batch_pdf, name='print_batch_pdf'),
+    path('api/print-batch/mark-printed/', views.mark_batch_printed, name='mark_batch_printed'),
+    path('api/print-queue/wait/', views.print_queue_wait, name='print_queue_wait'),
+    path('api/print-queue/claim/', views.claim_print_lease, name='claim_print_lease'),
+    path('api/print-queue/<str:lease>/mark-printed/', views.mark_lease_printed_view, name='mark_lease_printed'),
+    path('api/print-queue/<str:lease>/release/', views.release_print_lease, name='release_print_lease'),
+    path('api/pdf-render-metrics/', views.pdf_render_metrics, name='pdf_render_metrics'),
 ]
@@ -1,57 +1,52 @@
+import asyncio
 import json
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, HttpResponseForbidden, Http404, HttpResponseNotAllowed, JsonResponse
-from .models import Category, Product, Order, OrderItem, DiscountTier
-from .telegram_utils import send_order_csv_via_telegram
-from decimal import Decimal
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, Http404, HttpResponseNotAllowed, JsonResponse
+from .models import Category, DraftCart, Product, Order, OrderItem
 from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
-from django.core.serializers.json import DjangoJSONEncoder
 from io import BytesIO
-from .pdf_utils import build_full_picking_pdf, send_order_picking_pdf_to_telegram, build_order_receipt_pdf, send_order_receipt_pdf_to_telegram
+from .metrics import span
+from .outbox import enqueue_order_confirmed
+from .pdf_utils import build_wave_pdf, merge_pdfs
+from .discount_tiers import get_tier_table
+from .pdf_cache import get_picking_pdf, get_receipt_pdf
+from .print_queue import claim_print_batch, mark_lease_printed, print_queue, print_queue_stamp, release_lease
+from .product_index import get_product_code_index
+from .pricing import build_order_items, generate_order_csv, get_cart_pricing
+from .pdf_service import PdfRenderUnavailable, get_render_metrics
+from .waves import build_wave, generate_wave_csv, select_wave_orders
 
 from django.conf import settings
+from django.core import signing
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django.utils import timezone
-import csv
-import io
+from django.utils.dateparse import parse_datetime
+import logging
+import math
 
+logger = logging.getLogger(__name__)
 
-def generate_order_csv(order):
-    """
-    Return CSV text for a single order in warehouse pick order.
 
-    Columns:
-        RowNumber ; PickOrder ; ProductName ; ProductCode ; Quantity
+def remember(request, **values):
     """
-    # Get items already sorted by product picking order (and name as fallback)
-    ordered_items = (
-        order.items
-        .select_related("product")
-        .order_by("product__pick_order", "product__name")
-    )
-
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=';')
-
-    # Header row
-    writer.writerow(["SatırNo", "RafSırası", "ÜrünAdı", "ÜrünKodu", "Adet"])
-    #writer.writerow(["RowNumber", "PickOrder", "ProductName", "ProductCode", "Quantity"])
+    Store funnel values in the session, touching it only when something
+    changed: an unmodified session is not saved again (no session write).
+    """
+    for key, value in values.items():
+        if request.session.get(key) != value:
+            request.session[key] = value
 
-    # Data rows
-    for idx, item in enumerate(ordered_items, start=1):
-        p = item.product
-        writer.writerow([
-            idx,                 # RowNumber
-            p.pick_order,        # PickOrder
-            p.name,              # ProductName
-            p.code or "",        # ProductCode
-            item.quantity,       # Quantity
-        ])
 
-    csv_content = output.getvalue()
-    output.close()
-    return csv_content
+def get_draft_cart(request):
+    """The session's DraftCart, or None."""
+    draft_id = request.session.get("draft_cart_id")
+    if not draft_id:
+        return None
+    return DraftCart.objects.filter(id=draft_id).first()
 
 
 def customer_info(request, customer_type='retail'):
@@ -60,13 +55,9 @@ def customer_info(request, customer_type='retail'):
         customer_type = 'retail'
     
     # Store in session
-    request.session['customer_type'] = customer_type
+    remember(request, customer_type=customer_type)
     
-    # Get discount tiers for this customer type
-    discount_tiers = DiscountTier.objects.filter(
-    is_active=True,
-    customer_type=customer_type
-    ).order_by('threshold').values('threshold', 'discount_percentage')
+    discount_tiers = get_tier_table(customer_type).rows
     
     if request.method == "POST":
         customer_name = request.POST.get("customer_name", "").strip()
@@ -90,10 +81,13 @@ def customer_info(request, customer_type='retail'):
                 "discount_tiers": discount_tiers,
             })
         
-        request.session["customer_name"] = customer_name
-        request.session["customer_phone"] = customer_phone
-        request.session["customer_email"] = customer_email
-        request.session["customer_note"] = customer_note
+        remember(
+            request,
+            customer_name=customer_name,
+            customer_phone=customer_phone,
+            customer_email=customer_email,
+            customer_note=customer_note,
+        )
         
         return redirect("order_form", customer_type=customer_type)
     
@@ -105,49 +99,54 @@ def customer_info(request, customer_type='retail'):
         "discount_tiers": discount_tiers,
     })
 
+def parse_basket(data):
+    """
+    {product_id: quantity} from the posted qty_<id> fields. Only the posted
+    keys are read and checked against the cached active ids, so the cost
+    follows the basket size, not the catalog size.
+    """
+    active_product_ids = get_product_code_index().active_product_ids
+    basket = {}
+    for key, raw in data.items():
+        if not key.startswith("qty_"):
+            continue
+
+        try:
+            product_id = int(key[len("qty_"):])
+            qty = int(raw)
+        except ValueError:
+            continue
+
+        if qty > 0 and product_id in active_product_ids:
+            basket[product_id] = qty
+    return basket
+
+
 def order_form(request, customer_type='retail'):
     # Validate customer_type
     if customer_type not in ['retail', 'wholesale']:
         customer_type = 'retail'
     
     # Store in session
-    request.session['customer_type'] = customer_type
+    remember(request, customer_type=customer_type)
     
     # Check if customer info exists in session
     if not request.session.get("customer_name"):
         return redirect("customer_info", customer_type=customer_type)
     
-    products = Product.objects.filter(is_active=True)
     main_categories = (
         Category.objects
         .filter(parent__isnull=True)
         .order_by("display_order", "name")
-        .prefetch_related("subcategories__products")
+        .prefetch_related(
+            Prefetch("products", queryset=Product.objects.filter(is_active=True)),
+            Prefetch("subcategories__products", queryset=Product.objects.filter(is_active=True)),
+        )
     )
 
     if request.method == "POST":
-        customer_name = request.session.get("customer_name")
-        customer_phone = request.session.get("customer_phone")
-        customer_email = request.session.get("customer_email", "")
-        customer_note = request.session.get("customer_note", "")
-
         errors = []
-        selected_items = []
-
-        for p in products:
-            field_name = f"qty_{p.id}"
-            qty_raw = request.POST.get(field_name)
-
-            try:
-                qty = int(qty_raw) if qty_raw is not None else 0
-            except ValueError:
-                qty = 0
-
-            if qty > 0:
-                selected_items.append({
-                    "product": p,
-                    "quantity": qty,
-                })
+        selected_items = parse_basket(request.POST)
 
         if not selected_items:
             errors.append("Lütfen en az bir ürün seçiniz.")
@@ -156,41 +155,29 @@ def order_form(request, customer_type='retail'):
             return render(request, "order_form.html", {
                 "main_categories": main_categories,
                 "error_list": errors,
-                "discount_tiers": json.dumps(list(discount_tiers), cls=DjangoJSONEncoder),
+                "discount_tiers": get_tier_table(customer_type).json,
             })
 
-        # Create Order with customer_type
-        order = Order.objects.create(
-            customer_name=customer_name,
-            customer_phone=customer_phone,
-            customer_email=customer_email,
-            customer_note=customer_note,
-            customer_type=customer_type,
-        )
-
-        for item in selected_items:
-            OrderItem.objects.create(
-                order=order,
-                product=item["product"],
-                quantity=item["quantity"],
-            )
+        # Keep the basket as a draft; the Order is only written on confirm
+        draft = get_draft_cart(request) or DraftCart()
+        draft.customer_name = request.session.get("customer_name")
+        draft.customer_phone = request.session.get("customer_phone")
+        draft.customer_email = request.session.get("customer_email", "")
+        draft.customer_note = request.session.get("customer_note", "")
+        draft.customer_type = customer_type
+        draft.items = {str(product_id): qty for product_id, qty in selected_items.items()}
+        draft.save()
 
-        request.session["last_order_id"] = order.id
+        remember(request, draft_cart_id=draft.id)
 
         return redirect("order_success", customer_type=customer_type)
 
-    # Get discount tiers for this customer type
-    discount_tiers = DiscountTier.objects.filter(
-        is_active=True,
-        customer_type=customer_type
-    ).order_by('threshold').values('threshold', 'discount_percentage')
-    
     return render(request, "order_form.html", {
         "main_categories": main_categories,
         "customer_name": request.session.get("customer_name"),
         "customer_phone": request.session.get("customer_phone"),
         "customer_email": request.session.get("customer_email"),
-        "discount_tiers": json.dumps(list(discount_tiers), cls=DjangoJSONEncoder),
+        "discount_tiers": get_tier_table(customer_type).json,
         "customer_type": customer_type,
     })
 
@@ -209,63 +196,32 @@ def order_success(request, customer_type='retail'):
     if customer_type not in ['retail', 'wholesale']:
         customer_type = 'retail'
     
-    order_id = request.session.get("last_order_id")
-    if not order_id:
+    draft = get_draft_cart(request)
+    if draft is None:
         return redirect("customer_info", customer_type=customer_type)
 
-    try:
-        order = Order.objects.prefetch_related("items__product").get(id=order_id)
-    except Order.DoesNotExist:
-        return redirect("customer_info", customer_type=customer_type)
-
-    raw_items = list(order.items.select_related("product").all())
-
-    lines = []
-    subtotal = Decimal("0.00")
-
-    for oi in sorted(raw_items, key=lambda i: i.product.pick_order):
-        product = oi.product
-
-        if product.final_price is not None:
-            unit_price = product.final_price
-        elif product.price is not None:
-            unit_price = product.price
-        else:
-            unit_price = Decimal("0.00")
-
-        line_total = unit_price * oi.quantity
-        subtotal += line_total
-
-        lines.append({
-            "order_item": oi,
-            "product": product,
-            "quantity": oi.quantity,
-            "unit_price": unit_price,
-            "line_total": line_total,
-        })
-
-    # Calculate discount
-    discount_info = calculate_discount(subtotal, customer_type)
-    
-    # ADD THESE LINES FOR JSON:
-    discount_tiers = DiscountTier.objects.filter(
-        is_active=True,
-        customer_type=customer_type
-    ).order_by('threshold').values('threshold', 'discount_percentage')
-    
-    discount_tiers_json = json.dumps(list(discount_tiers), cls=DjangoJSONEncoder)
+    pricing = get_cart_pricing(draft.quantities, customer_type)
 
     context = {
-        "order": order,
-        "items": lines,
-        "subtotal": subtotal,
-        "discount_info": discount_info,
+        "order": draft,
+        "items": pricing.lines,
+        "subtotal": pricing.subtotal,
+        "discount_info": pricing.discount_info,
         "customer_type": customer_type,
-        "discount_tiers": discount_tiers_json,  # ADD THIS
+        "discount_tiers": get_tier_table(customer_type).json,
     }
     return render(request, "order_success.html", context)
 
 
+def already_confirmed(request, customer_type):
+    """Confirm posted twice: show the order the first one created."""
+    order_id = request.session.get("last_order_id")
+    order = Order.objects.filter(id=order_id, is_confirmed=True).first() if order_id else None
+    if order is not None:
+        return render(request, "order_confirmed.html", {"order": order})
+    return redirect("customer_info", customer_type=customer_type)
+
+
 def order_confirm(request, customer_type='retail'):
     if request.method != "POST":
         return redirect("customer_info", customer_type=customer_type)
@@ -274,69 +230,63 @@ def order_confirm(request, customer_type='retail'):
     if customer_type not in ['retail', 'wholesale']:
         customer_type = 'retail'
 
-    order_id = request.session.get("last_order_id")
-    if not order_id:
-        return redirect("customer_info", customer_type=customer_type)
-
-    try:
-        order = Order.objects.prefetch_related("items__product").get(id=order_id)
-    except Order.DoesNotExist:
-        return redirect("customer_info", customer_type=customer_type)
-
-    if order.is_confirmed:
-        return render(request, "order_confirmed.html", {"order": order})
+    draft = get_draft_cart(request)
+    if draft is None:
+        return already_confirmed(request, customer_type)
 
     # Update item quantities
-    for item in order.items.all():
-        field_name = f"qty_{item.id}"
-        if field_name not in request.POST:
+    quantities = draft.quantities
+    for product_id in list(quantities):
+        raw = request.POST.get(f"qty_{product_id}")
+        if raw is None:
             continue
 
-        raw = request.POST.get(field_name)
         try:
             new_qty = int(raw)
-        except (TypeError, ValueError):
+        except ValueError:
             continue
 
         if new_qty <= 0:
-            item.quantity = 0
-            item.delete()
-            continue
-
-        if new_qty != item.quantity:
-            item.quantity = new_qty
-            item.save()
+            del quantities[product_id]
+        else:
+            quantities[product_id] = new_qty
 
-    if not order.items.exists():
+    with span("pricing"):
+        pricing = get_cart_pricing(quantities, customer_type)
+    if not pricing.lines:
         return redirect("customer_info", customer_type=customer_type)
 
-    # Calculate and save discount
-    subtotal = Decimal("0.00")
-    for item in order.items.all():
-        product = item.product
-        unit_price = product.final_price or product.price or Decimal("0.00")
-        subtotal += unit_price * item.quantity
-    
-    discount_info = calculate_discount(subtotal, customer_type)
-    
-    order.subtotal = subtotal
-    order.discount_percentage = discount_info['discount_percentage']
-    order.discount_amount = discount_info['discount_amount']
-    order.final_total = discount_info['final_total']
-    order.customer_type = customer_type
-    order.is_confirmed = True
-    order.save()
-
-    # Generate CSV and PDFs
-    csv_content = generate_order_csv(order)
-    send_order_csv_via_telegram(order, csv_content)
-    
-    pdf_content = build_full_picking_pdf(order)
-    send_order_picking_pdf_to_telegram(order, pdf_content)
+    discount_info = pricing.discount_info
+
+    with span("save_order"), transaction.atomic():
+        # Claim the draft first: of two confirms racing for it (double
+        # submit), only the one that deletes it creates the order
+        deleted, _ = DraftCart.objects.filter(id=draft.id).delete()
+        if deleted:
+            order = Order.objects.create(
+                customer_name=draft.customer_name,
+                customer_phone=draft.customer_phone,
+                customer_email=draft.customer_email,
+                customer_note=draft.customer_note,
+                customer_type=customer_type,
+                subtotal=pricing.subtotal,
+                discount_percentage=discount_info['discount_percentage'],
+                discount_amount=discount_info['discount_amount'],
+                final_total=discount_info['final_total'],
+                is_confirmed=True,
+            )
+            # Items carry the price snapshot from the lines priced above
+            OrderItem.objects.bulk_create(build_order_items(order, pricing))
+
+            # CSV and PDFs go to Telegram from the outbox worker (run_outbox)
+            enqueue_order_confirmed(order)
+
+    if not deleted:
+        return already_confirmed(request, customer_type)
+
+    request.session.pop("draft_cart_id", None)
+    remember(request, last_order_id=order.id)
 
-    receipt_pdf = build_order_receipt_pdf(order)
-    send_order_receipt_pdf_to_telegram(order, receipt_pdf)
-    
     return render(request, "order_confirmed.html", {"order": order})
 
 
@@ -346,7 +296,7 @@ def order_csv_admin(request, order_id):
         return HttpResponseForbidden("Not allowed")
 
     try:
-        order = Order.objects.prefetch_related("items__product").get(id=order_id)
+        order = Order.objects.get(id=order_id)
     except Order.DoesNotExist:
         return HttpResponse("Order not found", status=404)
 
@@ -358,6 +308,54 @@ def order_csv_admin(request, order_id):
     return response
 
 
+def pdf_unavailable_response():
+    """503 for PDF downloads while the render pool is saturated."""
+    response = HttpResponse("PDF şu anda oluşturulamıyor, lütfen tekrar deneyin.", status=503)
+    response["Retry-After"] = "5"
+    return response
+
+
+WAVE_MAX_ORDERS = 200
+
+
+def wave_sheet(request, fmt):
+    """
+    Wave picking sheet (CSV or PDF) for confirmed, unprinted orders.
+
+    Query params (all optional):
+        since, until - ISO datetimes bounding created_at
+        limit        - maximum number of orders (default 50, max 200)
+    """
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return HttpResponseForbidden("Not allowed")
+
+    since = until = None
+    try:
+        if request.GET.get("since"):
+            since = parse_datetime(request.GET["since"])
+        if request.GET.get("until"):
+            until = parse_datetime(request.GET["until"])
+        limit = min(max(int(request.GET.get("limit", 50)), 1), WAVE_MAX_ORDERS)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid since/until/limit")
+    if (request.GET.get("since") and since is None) or (request.GET.get("until") and until is None):
+        return HttpResponseBadRequest("Invalid since/until/limit")
+
+    wave = build_wave(select_wave_orders(since=since, until=until, limit=limit))
+    if not wave.orders:
+        return HttpResponse("Toplanacak sipariş yok.", status=404)
+
+    stamp = timezone.localtime().strftime("%Y%m%d_%H%M")
+    if fmt == "csv":
+        response = HttpResponse(generate_wave_csv(wave), content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="wave_{stamp}.csv"'
+        return response
+
+    response = HttpResponse(build_wave_pdf(wave), content_type="application/pdf")
+    response["Content-Disposition"] = f'inline; filename="wave_{stamp}.pdf"'
+    return response
+
+
 #@login_required  
 def order_receipt_pdf(request, order_id):
     """
@@ -368,7 +366,10 @@ def order_receipt_pdf(request, order_id):
     if not order.is_confirmed:
         raise Http404("Bu sipariş için fiş henüz mevcut değil (onaylanmamış).")
 
-    pdf_bytes = build_order_receipt_pdf(order)
+    try:
+        pdf_bytes = get_receipt_pdf(order)
+    except PdfRenderUnavailable:
+        return pdf_unavailable_response()
 
     filename = f"order_{order.id}_fis.pdf"
     response = HttpResponse(pdf_bytes, content_type="application/pdf")
@@ -386,7 +387,10 @@ def order_picking_pdf(request, order_id):
     if not order.is_confirmed:
         raise Http404("Picking PDF is only available for confirmed orders.")
 
-    pdf_bytes = build_full_picking_pdf(order)
+    try:
+        pdf_bytes = get_picking_pdf(order)
+    except PdfRenderUnavailable:
+        return pdf_unavailable_response()
 
     response = HttpResponse(pdf_bytes, content_type="application/pdf")
     response["Content-Disposition"] = (
@@ -409,11 +413,8 @@ def orders_to_print(request):
     if not check_print_token(request):
         return HttpResponseForbidden("Forbidden")
 
-    orders = (
-        Order.objects
-        .filter(is_confirmed=True, printed=False)
-        .order_by("created_at")[:20]
-    )
+    # Orders leased to an agent are not listed until the lease expires
+    orders = print_queue()[:20]
 
     data = []
     for o in orders:
@@ -441,13 +442,223 @@ def order_picking_pdf_for_print(request, order_id):
     except Order.DoesNotExist:
         return HttpResponse(status=404)
 
-    pdf_bytes = build_order_receipt_pdf(order)
+    try:
+        pdf_bytes = get_receipt_pdf(order)
+    except PdfRenderUnavailable:
+        return pdf_unavailable_response()
 
     response = HttpResponse(pdf_bytes, content_type="application/pdf")
     # filename is not so important for the script, but nice to have:
     response["Content-Disposition"] = f'inline; filename="picking_order_{order.id}.pdf"'
     return response
 
+PRINT_MANIFEST_SALT = "core.print-batch-manifest"
+PRINT_BATCH_MAX = 50
+
+
+def get_print_agent(request):
+    """Agent id sent by the print agent; defaults to its address."""
+    return request.headers.get("X-Print-Agent") or request.META.get("REMOTE_ADDR", "")
+
+
+def print_batch_pdf(request):
+    """
+    One PDF with the print documents of the next N queued orders
+    (oldest first, ?limit=, default 20, max 50), leased to the calling
+    agent (X-Print-Agent) so other agents skip them.
+
+    The response carries the included order ids in X-Print-Order-Ids, the
+    lease in X-Print-Lease (held for X-Print-Lease-Seconds) and a signed
+    X-Print-Manifest to pass to mark_batch_printed afterwards. Orders whose
+    receipt failed to render are listed in X-Print-Skipped-Ids.
+    Returns 204 when nothing is queued, and 500 (with X-Print-Skipped-Ids
+    and X-Print-Lease) when no order of the batch could be rendered.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
+    if not check_print_token(request):
+        return HttpResponseForbidden("Forbidden")
+
+    try:
+        limit = min(max(int(request.GET.get("limit", 20)), 1), PRINT_BATCH_MAX)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid limit")
+
+    lease, orders = claim_print_batch(get_print_agent(request), limit)
+    if not orders:
+        return HttpResponse(status=204)
+
+    # One query for the items (and catalog codes) of the whole batch
+    prefetch_related_objects(orders, Prefetch("items", queryset=OrderItem.objects.select_related("product")))
+
+    receipts, order_ids, skipped_ids = [], [], []
+    for order in orders:
+        try:
+            receipts.append(get_receipt_pdf(order))
+        except PdfRenderUnavailable:
+            # Let another agent (or the next poll) take the orders right away
+            release_lease(lease)
+            return pdf_unavailable_response()
+        except Exception:
+            # One bad order must not hold up the queue: it stays leased but
+            # out of the manifest, and is retried when the lease expires
+            logger.exception("Receipt of order %s failed to render, left out of print batch %s", order.id, lease)
+            skipped_ids.append(order.id)
+            continue
+        order_ids.append(order.id)
+
+    if not order_ids:
+        # Not an empty queue: these orders are stuck until someone looks
+        response = HttpResponse("No receipt of the print batch could be rendered", status=500)
+        response["X-Print-Skipped-Ids"] = ",".join(str(i) for i in skipped_ids)
+        response["X-Print-Lease"] = lease
+        response["X-Print-Lease-Seconds"] = str(settings.PRINT_LEASE_SECONDS)
+        return response
+
+    pdf_bytes = merge_pdfs(receipts)
+    response = HttpResponse(pdf_bytes, content_type="application/pdf")
+    response["Content-Disposition"] = f'inline; filename="print_batch_{order_ids[0]}_{order_ids[-1]}.pdf"'
+    response["X-Print-Order-Ids"] = ",".join(str(i) for i in order_ids)
+    response["X-Print-Lease"] = lease
+    response["X-Print-Lease-Seconds"] = str(settings.PRINT_LEASE_SECONDS)
+    response["X-Print-Manifest"] = signing.dumps({"lease": lease, "order_ids": order_ids}, salt=PRINT_MANIFEST_SALT)
+    if skipped_ids:
+        response["X-Print-Skipped-Ids"] = ",".join(str(i) for i in skipped_ids)
+    return response
+
+
+@csrf_exempt
+def mark_batch_printed(request):
+    """Mark every order of a print batch manifest as printed (one UPDATE)."""
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    if not check_print_token(request):
+        return HttpResponseForbidden("Forbidden")
+
+    try:
+        manifest = json.loads(request.body or b"{}").get("manifest", "")
+        manifest = signing.loads(manifest, salt=PRINT_MANIFEST_SALT)
+        lease, order_ids = manifest["lease"], manifest["order_ids"]
+    except (ValueError, AttributeError, KeyError, TypeError, signing.BadSignature):
+        return JsonResponse({"error": "Invalid manifest"}, status=400)
+
+    # Orders left out of the batch stay leased and unprinted
+    updated = mark_lease_printed(lease, order_ids)
+
+    return JsonResponse({"status": "ok", "order_ids": order_ids, "updated": updated})
+
+
+@csrf_exempt
+def claim_print_lease(request):
+    """
+    Lease the next queued orders to an agent.
+    JSON body: {"agent": "...", "limit": 20} (agent defaults to X-Print-Agent).
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    if not check_print_token(request):
+        return HttpResponseForbidden("Forbidden")
+
+    try:
+        data = json.loads(request.body or b"{}")
+        agent = str(data.get("agent") or get_print_agent(request))
+        limit = min(max(int(data.get("limit", 20)), 1), PRINT_BATCH_MAX)
+    except (ValueError, AttributeError, TypeError):
+        return JsonResponse({"error": "Invalid request"}, status=400)
+
+    lease, orders = claim_print_batch(agent, limit)
+    if not orders:
+        return HttpResponse(status=204)
+
+    return JsonResponse({
+        "lease": lease,
+        "expires_at": orders[0].print_lease_expires.isoformat(),
+        "orders": [{"id": o.id, "created_at": o.created_at.isoformat()} for o in orders],
+    })
+
+
+@csrf_exempt
+def mark_lease_printed_view(request, lease):
+    """Mark the orders of a lease as printed. Safe to repeat."""
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    if not check_print_token(request):
+        return HttpResponseForbidden("Forbidden")
+
+    return JsonResponse({"status": "ok", "lease": lease, "updated": mark_lease_printed(lease)})
+
+
+@csrf_exempt
+def release_print_lease(request, lease):
+    """Give the unprinted orders of a lease back to the queue."""
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    if not check_print_token(request):
+        return HttpResponseForbidden("Forbidden")
+
+    return JsonResponse({"status": "ok", "lease": lease, "released": release_lease(lease)})
+
+
+PRINT_WAIT_DEFAULT = 25
+PRINT_WAIT_MAX = 60
+PRINT_WAIT_TICK = 0.5       # seconds between stamp checks
+PRINT_WAIT_RECHECK = 10     # query anyway this often: leases expire silently
+
+
+async def print_queue_wait(request):
+    """
+    Long-poll for print agents: answers as soon as orders are queued
+    ({"queued": n}), or 204 after ?timeout= seconds (default 25, max 60).
+    Async, so under ASGI a waiting agent does not hold a worker.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
+    if not check_print_token(request):
+        return HttpResponseForbidden("Forbidden")
+
+    try:
+        timeout = float(request.GET.get("timeout", PRINT_WAIT_DEFAULT))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid timeout")
+    # float() accepts "nan" and "inf"; a nan deadline would never pass
+    if not math.isfinite(timeout):
+        timeout = PRINT_WAIT_DEFAULT
+    timeout = min(max(timeout, 0), PRINT_WAIT_MAX)
+
+    count_queued = sync_to_async(lambda: print_queue().count())
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    checked_stamp, checked_at = None, None
+
+    while True:
+        stamp = print_queue_stamp()
+        now = loop.time()
+        if stamp != checked_stamp or now - checked_at >= PRINT_WAIT_RECHECK:
+            queued = await count_queued()
+            if queued:
+                return JsonResponse({"queued": queued})
+            checked_stamp, checked_at = stamp, now
+
+        if now >= deadline:
+            return HttpResponse(status=204)
+        await asyncio.sleep(min(PRINT_WAIT_TICK, deadline - now))
+
+
+def pdf_render_metrics(request):
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
+    if not check_print_token(request):
+        return HttpResponseForbidden("Forbidden")
+
+    return JsonResponse(get_render_metrics())
+
 @csrf_exempt
 def mark_order_printed(request, order_id):
     if request.method != "POST":
@@ -468,44 +679,3 @@ def mark_order_printed(request, order_id):
     return JsonResponse({"status": "ok", "order_id": order.id})
 
 
-def calculate_discount(subtotal, customer_type='retail'):
-    """Calculate discount based on order subtotal and customer type"""
-    discount_tiers = DiscountTier.objects.filter(
-        is_active=True,
-        customer_type=customer_type
-    ).order_by('-threshold')
-    
-    for tier in discount_tiers:
-        if subtotal >= tier.threshold:
-            discount_amount = subtotal * (tier.discount_percentage / 100)
-            return {
-                'tier': tier,
-                'discount_percentage': tier.discount_percentage,
-                'discount_amount': discount_amount,
-                'final_total': subtotal - discount_amount,
-                'next_tier': get_next_tier(subtotal, discount_tiers)
-            }
-    
-    # No discount applies
-    return {
-        'tier': None,
-        'discount_percentage': 0,
-        'discount_amount': 0,
-        'final_total': subtotal,
-        'next_tier': get_next_tier(subtotal, discount_tiers)
-    }
-
-
-def get_next_tier(current_total, tiers):
-    """Get the next available discount tier"""
-    for tier in reversed(tiers):
-        if current_total < tier.threshold:
-            remaining = tier.threshold - current_total
-            return {
-                'threshold': tier.threshold,
-                'percentage': tier.discount_percentage,
-                'remaining': remaining
-            }
-    return None
-
-
@@ -0,0 +1,142 @@
+# ============================
+#  WAVE (BATCH) PICKING
+# ============================
+#
+# A wave merges many confirmed, unprinted orders into one walk through the
+# warehouse: every product appears once, in Product.pick_order, with the
+# total to pick and how it splits over the orders' totes. Tote N is the
+# N-th order of the wave (oldest first). Totals and per-tote splits are
+# aggregated in SQL, so a wave costs the same few queries however many
+# orders it holds.
+
+import csv
+import io
+
+from django.db.models import Count, Sum
+
+from .models import Order, OrderItem
+
+
+class WaveLine:
+    """One stop on the route: a product, its total and per-tote quantities."""
+    def __init__(self, product_id, name, code, pick_order, total_quantity, order_count):
+        self.product_id = product_id
+        self.name = name
+        self.code = code or ""
+        self.pick_order = pick_order
+        self.total_quantity = total_quantity
+        self.order_count = order_count
+        self.totes = []  # [(tote number, quantity)]
+
+    @property
+    def tote_breakdown(self):
+        """Human readable split, e.g. "T1×3, T4×2"."""
+        return ", ".join(f"T{tote}×{qty}" for tote, qty in self.totes)
+
+
+class Wave:
+    def __init__(self, orders, lines):
+        self.orders = orders    # Orders in tote order (tote 1 = orders[0])
+        self.lines = lines      # WaveLine list in pick order
+
+    @property
+    def total_quantity(self):
+        return sum(line.total_quantity for line in self.lines)
+
+
+def select_wave_orders(since=None, until=None, limit=None):
+    """Confirmed, unprinted orders in a created_at window, oldest first."""
+    orders = Order.objects.filter(is_confirmed=True, printed=False)
+    if since is not None:
+        orders = orders.filter(created_at__gte=since)
+    if until is not None:
+        orders = orders.filter(created_at__lt=until)
+    orders = orders.order_by("created_at", "id")
+    if limit:
+        orders = orders[:limit]
+    return orders
+
+
+def build_wave(orders) -> Wave:
+    """Aggregate the items of the given orders into one pick route."""
+    orders = list(orders)
+    tote_by_order_id = {order.id: tote for tote, order in enumerate(orders, start=1)}
+
+    items = OrderItem.objects.filter(order_id__in=tote_by_order_id, quantity__gt=0)
+
+    # One row per product: GROUP BY product
+    totals = (
+        items
+        .values(
+            "product_id",
+            "product__name",
+            "product__code",
+            "product__pick_order",
+        )
+        .annotate(
+            total_quantity=Sum("quantity"),
+            order_count=Count("order_id", distinct=True),
+        )
+        .order_by("product__pick_order", "product__name")
+    )
+
+    lines = []
+    line_by_product_id = {}
+    for row in totals:
+        line = WaveLine(
+            row["product_id"],
+            row["product__name"],
+            row["product__code"],
+            row["product__pick_order"],
+            row["total_quantity"],
+            row["order_count"],
+        )
+        lines.append(line)
+        line_by_product_id[line.product_id] = line
+
+    # Per-tote split: GROUP BY product, order
+    splits = (
+        items
+        .values_list("product_id", "order_id")
+        .annotate(quantity=Sum("quantity"))
+        .order_by()
+    )
+    for product_id, order_id, quantity in splits:
+        line_by_product_id[product_id].totes.append((tote_by_order_id[order_id], quantity))
+
+    for line in lines:
+        line.totes.sort()
+
+    return Wave(orders, lines)
+
+
+def generate_wave_csv(wave: Wave) -> str:
+    """
+    Return CSV text for a wave in warehouse pick order.
+
+    Columns:
+        RowNumber ; PickOrder ; ProductName ; ProductCode ; TotalQuantity ; Totes
+    followed by a tote legend (tote number ; order id ; customer).
+    """
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=';')
+
+    writer.writerow(["SatırNo", "RafSırası", "ÜrünAdı", "ÜrünKodu", "ToplamAdet", "Kasalar"])
+    for idx, line in enumerate(wave.lines, start=1):
+        writer.writerow([
+            idx,
+            line.pick_order,
+            line.name,
+            line.code,
+            line.total_quantity,
+            line.tote_breakdown,
+        ])
+
+    writer.writerow([])
+    writer.writerow(["Kasa", "SiparişNo", "Müşteri"])
+    for tote, order in enumerate(wave.orders, start=1):
+        writer.writerow([f"T{tote}", order.id, order.customer_name])
+
+    csv_content = output.getvalue()
+    output.close()
+    return csv_content
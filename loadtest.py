@@ -0,0 +1,340 @@
+"""
+Load test for the order funnel.
+
+Customer sessions arrive at a configurable rate (Poisson, open loop) and
+walk the funnel like a browser: customer_info GET/POST -> order_form
+GET/POST -> order_success -> order_confirm. Print agents drain the print
+queue at the same time. Every step's latency goes to collector.py (UDP,
+tag "load.<step>") and into a per-stage summary.
+
+Give several rates to ramp up; the last stage that stays within the error
+budget and the confirm latency SLO is what one box can take:
+
+    python collector.py --port 9999 &
+    python loadtest.py --base-url http://127.0.0.1:8000 --rates 30,60,120,240 \\
+        --duration 60 --print-agents 2 --print-token $PRINT_API_TOKEN
+
+Latencies of a session are measured from its scheduled arrival, so time a
+session spends waiting for a free client thread is counted too.
+"""
+
+import argparse
+import random
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+QTY_FIELD_RE = re.compile(r'name="qty_(\d+)"')
+
+FUNNEL_STEPS = ["info_get", "info_post", "form_get", "form_post", "success_get", "confirm_post"]
+PRINT_STEPS = ["print_batch", "print_mark"]
+
+
+class Reporter:
+    """Collects step latencies for the summary and streams them to the collector."""
+    def __init__(self, collector=None):
+        self.lock = threading.Lock()
+        self.samples = {}   # step -> [ms]
+        self.errors = {}    # step -> count
+        self.sock = None
+        if collector:
+            host, _, port = collector.rpartition(":")
+            self.address = (host or "127.0.0.1", int(port))
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.setblocking(False)
+
+    def record(self, step, ms, ok=True):
+        with self.lock:
+            if ok:
+                self.samples.setdefault(step, []).append(ms)
+            else:
+                self.errors[step] = self.errors.get(step, 0) + 1
+        if ok and self.sock is not None:
+            try:
+                # Whole sessions are not requests: "/" keeps them out of the
+                # collector's overall window, like the app's background spans
+                tag = f"load/{step}" if step == "session" else f"load.{step}"
+                self.sock.sendto(f"{tag} {ms:.3f}".encode(), self.address)
+            except OSError:
+                pass
+
+    def reset(self):
+        with self.lock:
+            samples, errors = self.samples, self.errors
+            self.samples, self.errors = {}, {}
+        return samples, errors
+
+
+class BasketSizes:
+    """
+    Basket sizes from "lo-hi:weight" ranges, e.g. "1-5:40,6-15:40,16-40:20":
+    pick a range by weight, then a size uniformly inside it.
+    """
+    def __init__(self, spec):
+        self.ranges = []
+        self.weights = []
+        for part in spec.split(","):
+            bounds, _, weight = part.partition(":")
+            lo, _, hi = bounds.partition("-")
+            self.ranges.append((int(lo), int(hi or lo)))
+            self.weights.append(float(weight or 1))
+
+    def sample(self, rng):
+        lo, hi = rng.choices(self.ranges, weights=self.weights)[0]
+        return rng.randint(lo, hi)
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.base_url = args.base_url.rstrip("/")
+        self.reporter = Reporter(args.collector)
+        self.baskets = BasketSizes(args.basket)
+        self.product_ids = None
+        self.product_lock = threading.Lock()
+        self.confirms = 0
+        self.sessions_failed = 0
+        self.counter_lock = threading.Lock()
+
+    # ----------------------------
+    #  One customer session
+    # ----------------------------
+
+    def timed(self, step, scheduled, call, expected=(200,)):
+        """Run one request; latency counts from `scheduled` (queueing included)."""
+        started = max(time.perf_counter(), scheduled)
+        try:
+            response = call()
+        except requests.RequestException:
+            self.reporter.record(step, 0, ok=False)
+            raise
+        ms = (time.perf_counter() - started) * 1000
+        if response.status_code not in expected:
+            self.reporter.record(step, ms, ok=False)
+            raise requests.HTTPError(f"{step}: HTTP {response.status_code}")
+        self.reporter.record(step, ms)
+        return response
+
+    def think(self, rng):
+        if self.args.think:
+            time.sleep(rng.uniform(0, 2 * self.args.think))
+
+    def run_session(self, scheduled, seed):
+        rng = random.Random(seed)
+        customer_type = "wholesale" if rng.random() < self.args.wholesale_share else "retail"
+        funnel = f"{self.base_url}/order/{customer_type}"
+        session = requests.Session()
+        timeout = self.args.timeout
+
+        try:
+            self.timed("info_get", scheduled, lambda: session.get(f"{funnel}/", timeout=timeout))
+            self.think(rng)
+            self.timed("info_post", time.perf_counter(), lambda: session.post(
+                f"{funnel}/",
+                data={
+                    "csrfmiddlewaretoken": session.cookies.get("csrftoken", ""),
+                    "customer_name": f"Yük Testi {seed}",
+                    "customer_phone": f"0555{seed % 10000000:07d}",
+                    "customer_note": "",
+                },
+                allow_redirects=False,
+                timeout=timeout,
+            ), expected=(302,))
+
+            form = self.timed("form_get", time.perf_counter(), lambda: session.get(f"{funnel}/form/", timeout=timeout))
+            product_ids = self.get_product_ids(form.text)
+            self.think(rng)
+
+            size = min(self.baskets.sample(rng), len(product_ids))
+            basket = {f"qty_{pid}": rng.randint(1, 6) for pid in rng.sample(product_ids, size)}
+            basket["csrfmiddlewaretoken"] = session.cookies.get("csrftoken", "")
+            self.timed("form_post", time.perf_counter(), lambda: session.post(
+                f"{funnel}/form/", data=basket, allow_redirects=False, timeout=timeout,
+            ), expected=(302,))
+
+            self.timed("success_get", time.perf_counter(), lambda: session.get(f"{funnel}/success/", timeout=timeout))
+            self.think(rng)
+            self.timed("confirm_post", time.perf_counter(), lambda: session.post(
+                f"{funnel}/confirm/",
+                data={"csrfmiddlewaretoken": session.cookies.get("csrftoken", "")},
+                allow_redirects=False,
+                timeout=timeout,
+            ))
+        except (requests.RequestException, ValueError):
+            with self.counter_lock:
+                self.sessions_failed += 1
+            return
+        finally:
+            session.close()
+
+        self.reporter.record("session", (time.perf_counter() - scheduled) * 1000)
+        with self.counter_lock:
+            self.confirms += 1
+
+    def get_product_ids(self, html):
+        with self.product_lock:
+            if self.product_ids is None:
+                ids = sorted({int(pid) for pid in QTY_FIELD_RE.findall(html)})
+                if not ids:
+                    raise ValueError("No products on the order form")
+                self.product_ids = ids
+            return self.product_ids
+
+    # ----------------------------
+    #  Print agents
+    # ----------------------------
+
+    def run_print_agent(self, n, stop):
+        session = requests.Session()
+        session.headers.update({"X-PRINT-TOKEN": self.args.print_token, "X-Print-Agent": f"loadtest-{n}"})
+        while not stop.is_set():
+            try:
+                # The wait feed blocks by design; only the real work is timed
+                session.get(f"{self.base_url}/api/print-queue/wait/", params={"timeout": 5}, timeout=20)
+                batch = self.timed("print_batch", time.perf_counter(), lambda: session.get(
+                    f"{self.base_url}/api/print-batch/", params={"limit": 20}, timeout=60,
+                ), expected=(200, 204))
+                if batch.status_code == 204:
+                    continue
+                manifest = batch.headers["X-Print-Manifest"]
+                self.timed("print_mark", time.perf_counter(), lambda: session.post(
+                    f"{self.base_url}/api/print-batch/mark-printed/", json={"manifest": manifest}, timeout=15,
+                ))
+            except requests.RequestException:
+                time.sleep(1)
+        session.close()
+
+    # ----------------------------
+    #  Stages
+    # ----------------------------
+
+    def run_stage(self, rate_per_minute, pool, rng):
+        """Offer `rate_per_minute` sessions for --duration seconds; wait for them to finish."""
+        self.reporter.reset()
+        with self.counter_lock:
+            self.confirms = self.sessions_failed = 0
+
+        rate = rate_per_minute / 60
+        started = time.perf_counter()
+        end = started + self.args.duration
+        next_arrival = started
+        futures = []
+        while next_arrival < end:
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(self.run_session, next_arrival, rng.getrandbits(32)))
+            next_arrival += rng.expovariate(rate)
+
+        for future in futures:
+            future.result()
+        # The stage lasts at least --duration even when the last arrival came early
+        elapsed = max(time.perf_counter() - started, self.args.duration)
+
+        samples, errors = self.reporter.reset()
+        return {
+            "offered": len(futures),
+            "confirms": self.confirms,
+            "failed": self.sessions_failed,
+            "confirms_per_minute": self.confirms / elapsed * 60,
+            "elapsed": elapsed,
+            "samples": samples,
+            "errors": errors,
+        }
+
+    def print_stage(self, rate, result):
+        print()
+        print(f"--- {rate:g} sessions/min for {self.args.duration}s "
+              f"(finished after {result['elapsed']:.1f}s) ---")
+        print(f"  Sessions: {result['offered']} offered, {result['confirms']} confirmed, {result['failed']} failed")
+        print(f"  Confirms: {result['confirms_per_minute']:.1f}/min")
+        print(f"  {'step':<14} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for step in FUNNEL_STEPS + ["session"] + PRINT_STEPS:
+            latencies = result["samples"].get(step, [])
+            errors = result["errors"].get(step, 0)
+            if not latencies and not errors:
+                continue
+            if latencies:
+                a = np.array(latencies)
+                stats = (f"{np.percentile(a, 50):>9.1f} {np.percentile(a, 95):>9.1f} "
+                         f"{np.percentile(a, 99):>9.1f} {np.max(a):>9.1f}")
+            else:
+                stats = f"{'-':>9} {'-':>9} {'-':>9} {'-':>9}"
+            print(f"  {step:<14} {len(latencies):>6} {errors:>6} {stats}")
+
+    def stage_ok(self, result):
+        if not result["offered"]:
+            return True
+        error_rate = result["failed"] / result["offered"]
+        confirms = result["samples"].get("confirm_post", [])
+        p95 = np.percentile(confirms, 95) if confirms else float("inf")
+        return error_rate <= self.args.max_error_rate and p95 <= self.args.slo_ms
+
+    def run(self):
+        rates = [float(rate) for rate in self.args.rates.split(",")]
+        rng = random.Random(self.args.seed)
+
+        print("=" * 60)
+        print("  Order funnel load test")
+        print("=" * 60)
+        print(f"  Target:      {self.base_url}")
+        print(f"  Rates:       {', '.join(f'{r:g}' for r in rates)} sessions/min, {self.args.duration}s each")
+        print(f"  Wholesale:   {self.args.wholesale_share:.0%}   Basket: {self.args.basket}")
+        print(f"  Print agents: {self.args.print_agents}   Collector: {self.args.collector or '-'}")
+        print("=" * 60)
+
+        stop = threading.Event()
+        agents = [
+            threading.Thread(target=self.run_print_agent, args=(n, stop), daemon=True)
+            for n in range(self.args.print_agents)
+        ]
+        for agent in agents:
+            agent.start()
+
+        capacity = None
+        try:
+            with ThreadPoolExecutor(max_workers=self.args.max_sessions) as pool:
+                for rate in rates:
+                    result = self.run_stage(rate, pool, rng)
+                    self.print_stage(rate, result)
+                    if not self.stage_ok(result):
+                        print(f"  Over budget (errors > {self.args.max_error_rate:.0%} "
+                              f"or confirm p95 > {self.args.slo_ms:g} ms); stopping the ramp.")
+                        break
+                    capacity = result["confirms_per_minute"]
+        finally:
+            stop.set()
+
+        print()
+        print("=" * 60)
+        if capacity is None:
+            print("  Not even the first stage stayed within budget.")
+        else:
+            print(f"  Capacity: ~{capacity:.0f} confirms/min within budget")
+        print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for the order funnel")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Server under test")
+    parser.add_argument("--rates", default="30,60,120", help="Sessions per minute, one stage each (default: 30,60,120)")
+    parser.add_argument("--duration", type=int, default=60, help="Seconds per stage (default: 60)")
+    parser.add_argument("--wholesale-share", type=float, default=0.3, help="Share of wholesale sessions (default: 0.3)")
+    parser.add_argument("--basket", default="1-5:40,6-15:40,16-40:20",
+                        help='Basket sizes as "lo-hi:weight,..." (default: 1-5:40,6-15:40,16-40:20)')
+    parser.add_argument("--think", type=float, default=0.0, help="Mean think time between pages in seconds (default: 0)")
+    parser.add_argument("--max-sessions", type=int, default=64, help="Concurrent client sessions (default: 64)")
+    parser.add_argument("--print-agents", type=int, default=1, help="Print agents draining the queue (default: 1)")
+    parser.add_argument("--print-token", default="", help="PRINT_API_TOKEN of the server")
+    parser.add_argument("--collector", default="127.0.0.1:9999", help='collector.py address, "" to disable')
+    parser.add_argument("--slo-ms", type=float, default=1000, help="Confirm p95 budget in ms (default: 1000)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Failed session budget (default: 0.01)")
+    parser.add_argument("--timeout", type=float, default=30, help="Request timeout in seconds (default: 30)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for a repeatable run")
+
+    LoadTest(parser.parse_args()).run()
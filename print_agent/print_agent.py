@@ -1,79 +1,438 @@
-import time
-import os
-import requests
-
-BASE_URL = "https://dona-interlobular-tunefully.ngrok-free.dev"  # change to real domain
-PRINT_API_TOKEN = "SECRET1234567890987654321"
-
-HEADERS = {
-    "X-PRINT-TOKEN": PRINT_API_TOKEN
-}
-
-CHECK_INTERVAL_SECONDS = 30  # how often to poll the server
-
-
-def fetch_orders_to_print():
-    resp = requests.get(f"{BASE_URL}/api/orders-to-print/", headers=HEADERS, timeout=15)
-    resp.raise_for_status()
-    return resp.json()
-
-
-def download_picking_pdf(order_id):
-    resp = requests.get(
-        f"{BASE_URL}/api/orders/{order_id}/picking-pdf/",
-        headers=HEADERS,
-        timeout=30,
-    )
-    resp.raise_for_status()
-    filename = f"picking_order_{order_id}.pdf"
-    with open(filename, "wb") as f:
-        f.write(resp.content)
-    return filename
-
-
-def print_pdf(filename):
-    """
-    Windows-only: sends the PDF to the default printer.
-    Make sure the default app for .pdf supports the 'print' verb.
-    """
-    print(f"Sending {filename} to printer...")
-    os.startfile(filename, "print")
-
-
-def mark_order_printed(order_id):
-    resp = requests.post(
-        f"{BASE_URL}/api/orders/{order_id}/mark-printed/",
-        headers=HEADERS,
-        timeout=15,
-    )
-    resp.raise_for_status()
-
-
-def main_loop():
-    print("Print agent started. Press Ctrl+C to stop.")
-    while True:
-        try:
-            orders = fetch_orders_to_print()
-            if orders:
-                print(f"Found {len(orders)} order(s) to print.")
-            for order in orders:
-                order_id = order["id"]
-                try:
-                    print(f"Processing order {order_id}...")
-                    pdf_file = download_picking_pdf(order_id)
-                    print_pdf(pdf_file)
-                    # optional: wait a little between print and mark
-                    time.sleep(2)
-                    mark_order_printed(order_id)
-                    print(f"Order {order_id} marked as printed.")
-                except Exception as e:
-                    print(f"Error with order {order_id}: {e}")
-        except Exception as e:
-            print("Error communicating with server:", e)
-
-        time.sleep(CHECK_INTERVAL_SECONDS)
-
-
-if __name__ == "__main__":
-    main_loop()
-
+import json
+import os
+import shlex
+import socket
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BASE_URL = os.environ.get("PRINT_SERVER_URL", "https://dona-interlobular-tunefully.ngrok-free.dev")  # change to real domain
+PRINT_API_TOKEN = os.environ.get("PRINT_API_TOKEN", "SECRET1234567890987654321")
+
+# Unique per printer station: batches are leased to this id, so several
+# agents can print from the same queue without duplicates
+AGENT_ID = os.environ.get("PRINT_AGENT_ID") or socket.gethostname()
+
+HEADERS = {
+    "X-PRINT-TOKEN": PRINT_API_TOKEN,
+    "X-Print-Agent": AGENT_ID,
+}
+
+CHECK_INTERVAL_SECONDS = 30  # how often to poll the server when the wait feed is unavailable
+WAIT_SECONDS = 25  # how long one long-poll request waits for new orders
+BATCH_SIZE = 20  # orders per combined print job; 0 = one PDF per order
+PREFETCH = int(os.environ.get("PRINT_PREFETCH", 2))  # jobs downloaded ahead while one prints
+
+# Downloaded PDFs and the journal live here until the job is marked printed
+SPOOL_DIR = os.environ.get("PRINT_SPOOL_DIR", "spool")
+
+# Print command, "{file}" is replaced by the PDF path (appended when missing),
+# e.g. "lp -d Zebra {file}"; a fake printer such as
+# "python -c 'import time; time.sleep(0.5)'" benchmarks the pipeline without
+# one. Empty sends the PDF to the Windows default printer.
+PRINT_COMMAND = os.environ.get("PRINT_COMMAND", "")
+# Wait between printing and marking printed (the Windows print verb returns
+# before the job is spooled; a print command returns when it is done)
+PRINT_SETTLE_SECONDS = float(os.environ.get("PRINT_SETTLE_SECONDS", 0 if PRINT_COMMAND else 2))
+
+# A downloaded batch is only printed while its server lease has at least
+# this long left (time to print and mark it); later the server may hand it
+# to another agent. The lease length comes with each batch
+# (X-Print-Lease-Seconds, the server's PRINT_LEASE_SECONDS).
+LEASE_MARGIN_SECONDS = 60
+DEFAULT_LEASE_SECONDS = 300
+
+MARK_ATTEMPTS = 3
+
+# One keep-alive connection pool for every call to the server
+session = requests.Session()
+session.headers.update(HEADERS)
+
+# Keys of the jobs whose mark-printed call is running in the pool
+marking = set()
+marking_lock = threading.Lock()
+
+
+# ============================
+#  JOURNAL
+# ============================
+
+class Journal:
+    """
+    Crash-safe log of print jobs in the spool dir: one JSON line per state
+    change (downloaded -> printed -> marked), fsynced before we move on.
+    After a restart, downloaded jobs are printed from the spool and printed
+    jobs are only marked, so nothing is downloaded or printed twice.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.jobs = {}   # key -> job, insertion ordered; marked jobs are dropped
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # torn last line of a crash
+                    if record["state"] in ("marked", "dropped"):
+                        self.jobs.pop(record["key"], None)
+                    else:
+                        self.jobs.setdefault(record["key"], {}).update(record)
+
+        self.compact()
+        self.clean_spool()
+
+    def record(self, job, state):
+        job["state"] = state
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(job) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if state in ("marked", "dropped"):
+                self.jobs.pop(job["key"], None)
+            else:
+                self.jobs[job["key"]] = job
+
+    def pending(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def compact(self):
+        """Rewrite the journal with unfinished jobs only."""
+        with self.lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for job in self.jobs.values():
+                    f.write(json.dumps(job) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+
+    def clean_spool(self):
+        """Remove spool files no job refers to (downloads cut off by a crash)."""
+        with self.lock:
+            spool_dir = os.path.dirname(self.path)
+            keep = {os.path.basename(job["file"]) for job in self.jobs.values()}
+            for name in os.listdir(spool_dir):
+                if name.endswith((".pdf", ".part")) and name not in keep:
+                    os.remove(os.path.join(spool_dir, name))
+
+
+def spool(filename, content):
+    """Write a download into the spool dir atomically (never a half file)."""
+    path = os.path.join(SPOOL_DIR, filename)
+    tmp = path + ".part"
+    with open(tmp, "wb") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+# ============================
+#  SERVER CALLS
+# ============================
+
+def fetch_orders_to_print():
+    resp = session.get(f"{BASE_URL}/api/orders-to-print/", timeout=15)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def download_picking_pdf(order_id, journal):
+    resp = session.get(f"{BASE_URL}/api/order/{order_id}/picking-pdf/", timeout=30)
+    resp.raise_for_status()
+    job = {
+        "key": f"order-{order_id}",
+        "order_id": order_id,
+        "file": spool(f"picking_order_{order_id}.pdf", resp.content),
+        "downloaded_at": time.time(),
+    }
+    journal.record(job, "downloaded")
+    return job
+
+
+def mark_order_printed(order_id):
+    resp = session.post(f"{BASE_URL}/api/order/{order_id}/mark-printed/", timeout=15)
+    resp.raise_for_status()
+
+
+def download_print_batch(journal):
+    """
+    Download one PDF with the next BATCH_SIZE queued orders, leased to
+    this agent until marked printed. Returns the job, or None when nothing
+    is queued.
+    """
+    resp = session.get(f"{BASE_URL}/api/print-batch/", params={"limit": BATCH_SIZE}, timeout=60)
+    if "X-Print-Skipped-Ids" in resp.headers and resp.status_code != 200:
+        # Left leased on the server, so the next batch moves past them
+        raise RuntimeError(f"Orders {resp.headers['X-Print-Skipped-Ids']} could not be rendered")
+    resp.raise_for_status()
+    if resp.status_code == 204:
+        return None
+    order_ids = resp.headers["X-Print-Order-Ids"]
+    job = {
+        "key": f"batch-{resp.headers['X-Print-Lease']}",
+        "order_ids": order_ids,
+        "lease": resp.headers["X-Print-Lease"],
+        "manifest": resp.headers["X-Print-Manifest"],
+        "file": spool(f"print_batch_{order_ids.replace(',', '_')}.pdf", resp.content),
+        "downloaded_at": time.time(),
+        "lease_seconds": int(resp.headers.get("X-Print-Lease-Seconds", DEFAULT_LEASE_SECONDS)),
+    }
+    journal.record(job, "downloaded")
+    return job
+
+
+def mark_batch_printed(manifest):
+    resp = session.post(f"{BASE_URL}/api/print-batch/mark-printed/", json={"manifest": manifest}, timeout=15)
+    resp.raise_for_status()
+
+
+def release_batch(lease):
+    """Give a batch that could not be printed back to the queue."""
+    resp = session.post(f"{BASE_URL}/api/print-queue/{lease}/release/", timeout=15)
+    resp.raise_for_status()
+
+
+def wait_for_orders():
+    """
+    Long-poll the server until orders are queued.
+    Returns True when orders are waiting, False when the wait timed out and
+    None when the feed is unavailable (then the caller polls instead).
+    """
+    try:
+        resp = session.get(
+            f"{BASE_URL}/api/print-queue/wait/",
+            params={"timeout": WAIT_SECONDS},
+            timeout=WAIT_SECONDS + 15,
+        )
+    except requests.RequestException as e:
+        print("Wait feed unavailable:", e)
+        return None
+
+    if resp.status_code == 204:
+        return False
+    if resp.status_code != 200:
+        print(f"Wait feed unavailable: HTTP {resp.status_code}")
+        return None
+    return True
+
+
+# ============================
+#  PRINTING
+# ============================
+
+def print_pdf(filename):
+    """
+    Send a PDF to the printer: through PRINT_COMMAND when set, otherwise
+    (Windows only) to the default printer; the default app for .pdf must
+    support the 'print' verb.
+    """
+    print(f"Sending {filename} to printer...")
+    if PRINT_COMMAND:
+        args = [arg.replace("{file}", filename) for arg in shlex.split(PRINT_COMMAND)]
+        if "{file}" not in PRINT_COMMAND:
+            args.append(filename)
+        subprocess.run(args, check=True)
+    else:
+        os.startfile(filename, "print")
+
+
+def lease_ending(job):
+    """True when a batch's lease may run out before it is printed and marked."""
+    if "lease" not in job:
+        return False
+    lease_seconds = job.get("lease_seconds", DEFAULT_LEASE_SECONDS)
+    return time.time() - job["downloaded_at"] > lease_seconds - LEASE_MARGIN_SECONDS
+
+
+def drop_job(job, journal):
+    """Forget a job that will not be printed and give its orders back to the queue."""
+    if "lease" in job:
+        try:
+            release_batch(job["lease"])
+        except Exception as e:
+            print(f"Error releasing {job['key']} (its lease expires on its own): {e}")
+    journal.record(job, "dropped")
+    try:
+        os.remove(job["file"])
+    except OSError:
+        pass
+
+
+def print_job(job, journal):
+    if lease_ending(job):
+        # The server may give these orders to another agent any moment
+        print(f"Lease of {job['key']} is running out, not printing it.")
+        drop_job(job, journal)
+        return False
+    try:
+        print_pdf(job["file"])
+    except Exception:
+        drop_job(job, journal)
+        raise
+    journal.record(job, "printed")
+    return True
+
+
+def finish_job(job, journal):
+    """Mark a printed job on the server, then forget it (runs in the pool)."""
+    try:
+        time.sleep(PRINT_SETTLE_SECONDS)
+        for attempt in range(1, MARK_ATTEMPTS + 1):
+            try:
+                if "lease" in job:
+                    mark_batch_printed(job["manifest"])
+                    print(f"Orders {job['order_ids']} marked as printed.")
+                else:
+                    mark_order_printed(job["order_id"])
+                    print(f"Order {job['order_id']} marked as printed.")
+                break
+            except Exception as e:
+                print(f"Error marking {job['key']} (attempt {attempt}): {e}")
+                if attempt == MARK_ATTEMPTS:
+                    return  # stays "printed" in the journal; retried next pass
+                time.sleep(2 ** attempt)
+
+        journal.record(job, "marked")
+        try:
+            os.remove(job["file"])
+        except OSError:
+            pass
+    finally:
+        with marking_lock:
+            marking.discard(job["key"])
+
+
+def submit_finish(job, journal, pool):
+    """Queue the mark-printed call of a printed job, unless it is already running."""
+    with marking_lock:
+        if job["key"] in marking:
+            return
+        marking.add(job["key"])
+    pool.submit(finish_job, job, journal)
+
+
+def retry_marks(journal, pool):
+    """
+    Mark printed jobs whose mark-printed call failed. Runs every pass, so
+    the orders are marked before their lease expires and they are printed
+    again elsewhere.
+    """
+    for job in journal.pending():
+        if job["state"] == "printed":
+            submit_finish(job, journal, pool)
+
+
+def resume(journal, pool):
+    """Finish the jobs a previous run left in the journal."""
+    for job in journal.pending():
+        if job["state"] == "downloaded":
+            if not os.path.exists(job["file"]):
+                # The server queue still has these orders; download afresh
+                journal.record(job, "dropped")
+                continue
+            print(f"Resuming {job['key']}...")
+            try:
+                if not print_job(job, journal):
+                    continue
+            except Exception as e:
+                print(f"Error printing {job['key']}: {e}")
+                continue
+        submit_finish(job, journal, pool)
+
+
+def print_batches(journal, pool):
+    """
+    Print the whole queue as combined jobs of up to BATCH_SIZE orders,
+    downloading up to PREFETCH batches ahead while the printer is busy.
+    """
+    # One download thread: batches are claimed, and printed, oldest first
+    with ThreadPoolExecutor(max_workers=1) as downloader:
+        downloads = deque(downloader.submit(download_print_batch, journal) for _ in range(max(PREFETCH, 1)))
+        try:
+            while downloads:
+                job = downloads.popleft().result()
+                if job is None:
+                    continue  # queue drained; print what is already downloading
+                downloads.append(downloader.submit(download_print_batch, journal))
+                print(f"Printing orders {job['order_ids']} as one job...")
+                if print_job(job, journal):
+                    submit_finish(job, journal, pool)
+        except Exception:
+            # Give the batches downloaded ahead back to the queue too, instead
+            # of holding them until their leases expire
+            for download in downloads:
+                try:
+                    job = download.result()
+                except Exception:
+                    continue
+                if job is not None:
+                    drop_job(job, journal)
+            raise
+
+
+def print_orders(journal, pool):
+    """Print the queue one order at a time (BATCH_SIZE = 0), prefetching PDFs."""
+    # Orders still waiting for their mark-printed call are listed again
+    in_flight = {job.get("order_id") for job in journal.pending()}
+    orders = [order for order in fetch_orders_to_print() if order["id"] not in in_flight]
+    if orders:
+        print(f"Found {len(orders)} order(s) to print.")
+    downloads = [(order["id"], pool.submit(download_picking_pdf, order["id"], journal)) for order in orders]
+    for order_id, download in downloads:
+        try:
+            print(f"Processing order {order_id}...")
+            job = download.result()
+            print_job(job, journal)
+            submit_finish(job, journal, pool)
+        except Exception as e:
+            print(f"Error with order {order_id}: {e}")
+
+
+def main_loop():
+    print("Print agent started. Press Ctrl+C to stop.")
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    journal = Journal(os.path.join(SPOOL_DIR, "journal.jsonl"))
+
+    # Downloads and mark-printed calls run in threads, printing in this one
+    with ThreadPoolExecutor(max_workers=max(PREFETCH, 1) + 2) as pool:
+        resume(journal, pool)
+
+        queued = True  # drain whatever is already queued on start
+        while True:
+            # Marks that failed are retried well within the lease
+            retry_marks(journal, pool)
+
+            if queued:
+                try:
+                    if BATCH_SIZE:
+                        print_batches(journal, pool)
+                    else:
+                        print_orders(journal, pool)
+                except Exception as e:
+                    print("Error communicating with server:", e)
+                    time.sleep(CHECK_INTERVAL_SECONDS)
+                    continue
+
+            journal.compact()
+
+            # Picking starts as soon as an order is confirmed; when the server
+            # has no wait feed (or it fails) fall back to polling
+            queued = wait_for_orders()
+            if queued is None:
+                time.sleep(CHECK_INTERVAL_SECONDS)
+                queued = True
+
+
+if __name__ == "__main__":
+    main_loop()
@@ -0,0 +1,41 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class IsolatedDiscoverRunner(DiscoverRunner):
+    """
+    Test runner that keeps the whole run off the deployment's files.
+
+    The PDF cache, the invalidation stamps and the file session cache
+    default to directories under BASE_DIR. Test orders reuse real order ids,
+    so a cached test PDF evicts the real PDFs of that order, and a bumped
+    stamp rebuilds the caches of live workers and wakes their print-queue
+    long-polls. All three go to a scratch directory that is removed at the
+    end of the run.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.scratch_dir = Path(tempfile.mkdtemp(prefix="warehouse_orders_tests_"))
+        self.isolation = override_settings(
+            PDF_CACHE_DIR=str(self.scratch_dir / "pdf_cache"),
+            INVALIDATION_DIR=str(self.scratch_dir / "run"),
+            CACHES={
+                **settings.CACHES,
+                "sessions": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": str(self.scratch_dir / "sessions"),
+                },
+            },
+        )
+        self.isolation.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.isolation.disable()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)